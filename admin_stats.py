@@ -0,0 +1,166 @@
+"""
+Статистика платформы для дашборда супер-админа.
+
+Итоги (школы, активные школы, пользователи по ролям, доход по
+Payment.paid_amount) считаются одним SELECT: условные COUNT по таблице
+пользователей и скалярные подзапросы по школам и платежам. Результат
+хранится в памяти процесса с коротким TTL и сбрасывается при записи через
+счётчик поколений (тот же, что у кэша ответов), поэтому изменение в одном
+воркере видят все.
+
+Таблица школ отдаётся страницами по курсору (id), число пользователей
+считается только для школ страницы, так что время отрисовки дашборда не
+зависит от числа школ.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, null, or_, select
+
+from pagination import DEFAULT_PAGE_SIZE
+
+GENERATION = 'admin_stats'
+
+SCHOOL_COLUMNS = ('id', 'name', 'unique_url', 'description', 'logo_url', 'is_active', 'created_at')
+
+
+class AdminStats:
+    """Итоги платформы и страницы списка школ.
+
+    models - пространство имён с School, User и, если есть, Payment;
+    отсутствующие колонки (is_active, school_id, ...) не ломают запросы.
+    """
+
+    def __init__(self, models, roles, generations=None, ttl=30):
+        self.models = models
+        self.roles = tuple(roles)
+        self.generations = generations
+        self.ttl = ttl
+        self._cached = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _generation(self):
+        return self.generations.get(GENERATION) if self.generations is not None else 0
+
+    def compute(self, session):
+        """Посчитать итоги одним запросом."""
+        School, User = self.models.School, self.models.User
+        Payment = getattr(self.models, 'Payment', None)
+
+        schools = select(func.count(School.id)).scalar_subquery()
+        if hasattr(School, 'is_active'):
+            active = select(func.count(School.id)).where(School.is_active == True).scalar_subquery()
+        else:
+            active = schools
+        if Payment is not None:
+            revenue = select(func.coalesce(func.sum(Payment.paid_amount), 0)).scalar_subquery()
+        else:
+            revenue = literal(0)
+
+        statement = select(
+            func.count(User.id).label('total_users'),
+            *[func.count(case((User.role == role, 1))).label(role) for role in self.roles],
+            schools.label('total_schools'),
+            active.label('active_schools'),
+            revenue.label('total_revenue'),
+        ).select_from(User)
+        row = session.execute(statement).one()
+
+        return {
+            'total_schools': row.total_schools,
+            'active_schools': row.active_schools,
+            'total_users': row.total_users,
+            'users_by_role': {role: row._mapping[role] for role in self.roles},
+            'total_revenue': round(float(row.total_revenue or 0), 2),
+            'computed_at': datetime.utcnow().isoformat(),
+        }
+
+    def get(self, session):
+        """Итоги из кэша или заново, если истёк TTL или данные изменились."""
+        generation = self._generation()
+        cached = self._cached
+        if (generation is not None and cached is not None and cached[0] == generation
+                and cached[1] > time.monotonic()):
+            self.stats['hits'] += 1
+            return cached[2]
+
+        # Один поток считает, остальные ждут и берут готовый результат
+        with self._lock:
+            cached = self._cached
+            if (generation is not None and cached is not None and cached[0] == generation
+                    and cached[1] > time.monotonic()):
+                self.stats['hits'] += 1
+                return cached[2]
+            self.stats['misses'] += 1
+            value = self.compute(session)
+            if generation is not None:
+                self._cached = (generation, time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate(self):
+        """Сбросить итоги во всех воркерах."""
+        self._cached = None
+        if self.generations is not None:
+            self.generations.bump(GENERATION)
+
+    def school_page(self, session, after=None, limit=DEFAULT_PAGE_SIZE, search=None, status=None):
+        """Страница школ по возрастанию id после курсора after.
+
+        after - кортеж (id,) из decode_cursor. Возвращает (rows, has_more);
+        у строк есть атрибуты SCHOOL_COLUMNS и user_count. search - подстрока
+        названия или URL, status - active/inactive.
+        """
+        School, User = self.models.School, self.models.User
+
+        columns = [getattr(School, name).label(name) if hasattr(School, name) else null().label(name)
+                   for name in SCHOOL_COLUMNS]
+        query = select(*columns)
+        if after is not None:
+            query = query.where(School.id > after[0])
+        if search:
+            pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            query = query.where(or_(School.name.ilike(pattern, escape='\\'),
+                                    *([School.unique_url.ilike(pattern, escape='\\')]
+                                      if hasattr(School, 'unique_url') else [])))
+        if status and hasattr(School, 'is_active'):
+            query = query.where(School.is_active == (status == 'active'))
+
+        rows = session.execute(query.order_by(School.id).limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        counts = {}
+        if rows and hasattr(User, 'school_id'):
+            counts = dict(session.execute(
+                select(User.school_id, func.count(User.id))
+                .where(User.school_id.in_([row.id for row in rows]))
+                .group_by(User.school_id)
+            ).all())
+
+        return [SchoolRow(row, counts.get(row.id, 0)) for row in rows], has_more
+
+
+class SchoolRow:
+    """Строка таблицы школ: колонки School и число пользователей."""
+
+    __slots__ = SCHOOL_COLUMNS + ('user_count',)
+
+    def __init__(self, row, user_count):
+        for name in SCHOOL_COLUMNS:
+            setattr(self, name, getattr(row, name))
+        self.user_count = user_count
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'unique_url': self.unique_url,
+            'description': self.description,
+            'logo_url': self.logo_url,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'user_count': self.user_count,
+        }
@@ -1,41 +1,198 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, Response, current_app, render_template, request, redirect, url_for, flash, jsonify, send_file, stream_with_context
+from flask.cli import AppGroup
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from flask_socketio import SocketIO, emit, join_room, leave_room
-from flask_migrate import Migrate
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from sqlalchemy import and_, bindparam, case, delete, event, func, insert, inspect, literal, select, tuple_, union_all
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached, selectinload
+from datetime import datetime, time, timedelta
+from collections import defaultdict
+from types import SimpleNamespace
+import click
+import io
+import json
+import math
 import os
 import uuid
 
-# Инициализация Flask приложения
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///eduverse.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+from admin_stats import GENERATION as ADMIN_STATS_GENERATION, AdminStats
+from bulk_import import KINDS as IMPORT_KINDS, BulkImporter, iter_records
+from chat_pipeline import FrameJSON, MessageError, MessagePipeline
+from db_engine import (
+    REPLICA_BIND, RoutingSession, configure_engines, dialect_insert, engine_options, use_replica, write_lock,
+    write_transaction
+)
+from grade_journal import GradeJournal, JournalError
+from instrumentation import Instrumentation
+from loading_profiles import LoadingProfiles
+from message_writer import MessageWriter, QueueFullError, WriteError
+from response_cache import ResponseCache, create_generations
+from pagination import decode_cursor, encode_cursor, keyset_page, parse_page_size
+from password_hasher import HashLimitError, PasswordHasher
+from presence import Presence, create_presence_backend
+from report_export import FORMATS as EXPORT_FORMATS, ExportJobs, iter_report
+from roles import ROLES
+from school_calendar import CalendarError, ScheduleCalendar, generation_name, parse_range
+from search_index import SearchError, SearchIndex
+from timetable import Lesson, TimetableEngine, to_minutes
+from socketio_backends import create_client_manager
+from user_cache import UserCache, create_cache_backend
 
-# Инициализация расширений
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# Настройки из переменных окружения; create_app(config) может их переопределить
+def load_config(app):
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///eduverse.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Пул соединений PostgreSQL/MySQL
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', 'True').lower() == 'true'
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+    
+    # SQLite: WAL, ожидание блокировки вместо ошибки "database is locked"
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 15000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLITE_BEGIN_IMMEDIATE'] = os.getenv('SQLITE_BEGIN_IMMEDIATE', 'True').lower() == 'true'
+    app.config['SQLITE_POOL_SIZE'] = int(os.getenv('SQLITE_POOL_SIZE', 5))
+    app.config['SQLITE_MAX_OVERFLOW'] = int(os.getenv('SQLITE_MAX_OVERFLOW', 10))
+    
+    # Реплика для чтения: ею пользуются представления с @use_replica
+    app.config['DATABASE_REPLICA_URL'] = os.getenv('DATABASE_REPLICA_URL')
+    
+    # Отложенная запись сообщений чата
+    app.config['CHAT_PERSIST_MESSAGES'] = os.getenv('CHAT_PERSIST_MESSAGES', 'True').lower() == 'true'
+    app.config['CHAT_WRITE_BATCH_SIZE'] = int(os.getenv('CHAT_WRITE_BATCH_SIZE', 200))
+    # Пауза добора пакета, секунд; 0 - писать сразу, пока идёт запись, копится следующий пакет
+    app.config['CHAT_WRITE_FLUSH_INTERVAL'] = float(os.getenv('CHAT_WRITE_FLUSH_INTERVAL', 0))
+    app.config['CHAT_WRITE_QUEUE_SIZE'] = int(os.getenv('CHAT_WRITE_QUEUE_SIZE', 10000))
+    # Повторы неудачного пакета (пауза удваивается), затем строки, которые не
+    # записываются, уходят в файл CHAT_DEAD_LETTER_PATH (по умолчанию в instance/)
+    app.config['CHAT_WRITE_RETRIES'] = int(os.getenv('CHAT_WRITE_RETRIES', 3))
+    app.config['CHAT_WRITE_RETRY_DELAY'] = float(os.getenv('CHAT_WRITE_RETRY_DELAY', 0.05))
+    app.config['CHAT_DEAD_LETTER_PATH'] = os.getenv('CHAT_DEAD_LETTER_PATH') or None
+    # Сколько отправитель ждёт записи сообщения до подтверждения, секунд
+    app.config['CHAT_WRITE_ACK_TIMEOUT'] = float(os.getenv('CHAT_WRITE_ACK_TIMEOUT', 5))
+    
+    # Сообщения чата: максимальный размер текста, байт UTF-8; окно пакетной
+    # рассылки, мс (0 - каждое сообщение отдельным событием)
+    app.config['CHAT_MAX_MESSAGE_BYTES'] = int(os.getenv('CHAT_MAX_MESSAGE_BYTES', 4000))
+    app.config['CHAT_BATCH_INTERVAL_MS'] = float(os.getenv('CHAT_BATCH_INTERVAL_MS', 0))
+    
+    # Массовый импорт
+    app.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+    # Процессов хеширования паролей в CLI-импорте: пусто - по числу ядер, 0 - без пула
+    hash_workers = os.getenv('IMPORT_HASH_WORKERS')
+    app.config['IMPORT_HASH_WORKERS'] = int(hash_workers) if hash_workers else None
+    
+    # Кэш пользователей для user_loader: память процесса или общий redis://
+    app.config['USER_CACHE_URL'] = os.getenv('USER_CACHE_URL')
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 300))
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 10000))
+    
+    # Кэш готовых ответов редко меняющихся API (/api/schools): счётчики поколений
+    # в общем redis://, чтобы изменение видели все воркеры, или в памяти процесса -
+    # тогда поколение живёт RESPONSE_CACHE_LOCAL_TTL сек (0 - бессрочно, один воркер)
+    app.config['RESPONSE_CACHE_ENABLED'] = os.getenv('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+    app.config['RESPONSE_CACHE_URL'] = os.getenv('RESPONSE_CACHE_URL')
+    app.config['RESPONSE_CACHE_LOCAL_TTL'] = float(os.getenv('RESPONSE_CACHE_LOCAL_TTL', 30))
+    
+    # Хеширование паролей при входе и регистрации: метод werkzeug (старые хеши
+    # пересчитываются при входе), потоков пула (0 - в потоке запроса) и лимиты
+    # одновременных попыток всего, с одного IP и для одного имени
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 4))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.getenv('PASSWORD_HASH_QUEUE', 64))
+    app.config['LOGIN_MAX_PER_IP'] = int(os.getenv('LOGIN_MAX_PER_IP', 4))
+    app.config['LOGIN_MAX_PER_USERNAME'] = int(os.getenv('LOGIN_MAX_PER_USERNAME', 2))
+    
+    # Итоги дашборда супер-админа: TTL кэша, сек (сбрасывается и при записи)
+    app.config['ADMIN_STATS_TTL'] = float(os.getenv('ADMIN_STATS_TTL', 30))
+    
+    # Метрики SQL и времени по маршрутам (/metrics, формат Prometheus)
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+    
+    # Socket.IO: режим async и очередь сообщений для работы в нескольких воркерах
+    app.config['SOCKETIO_ASYNC_MODE'] = os.getenv('SOCKETIO_ASYNC_MODE') or None
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    app.config['SOCKETIO_CHANNEL'] = os.getenv('SOCKETIO_CHANNEL', 'eduverse')
+    # Кадр больше этого размера engine.io отбрасывает до разбора JSON
+    app.config['SOCKETIO_MAX_BUFFER_SIZE'] = int(os.getenv('SOCKETIO_MAX_BUFFER_SIZE', 65536))
+    
+    # Присутствие в чате: индексы в памяти процесса или общий redis://,
+    # heartbeat клиента и TTL кэша участия в чатах, сек
+    app.config['PRESENCE_URL'] = os.getenv('PRESENCE_URL')
+    app.config['PRESENCE_HEARTBEAT_TIMEOUT'] = float(os.getenv('PRESENCE_HEARTBEAT_TIMEOUT', 90))
+    app.config['PRESENCE_SWEEP_INTERVAL'] = float(os.getenv('PRESENCE_SWEEP_INTERVAL', 30))
+    app.config['CHAT_MEMBERSHIP_TTL'] = int(os.getenv('CHAT_MEMBERSHIP_TTL', 60))
+    
+    # Полнотекстовый поиск: конфигурация текстового поиска PostgreSQL
+    # (в SQLite - FTS5 с токенизатором unicode61) и сколько самых новых
+    # совпадений ранжировать
+    app.config['SEARCH_TEXT_CONFIG'] = os.getenv('SEARCH_TEXT_CONFIG', 'russian')
+    app.config['SEARCH_MAX_CANDIDATES'] = int(os.getenv('SEARCH_MAX_CANDIDATES', 10000))
+    
+    # Выгрузка отчётов: строк в пачке курсора, сколько строк можно отдать
+    # прямо в ответе (больше - только фоновой выгрузкой), каталог и срок
+    # хранения файлов фоновых выгрузок, сек
+    app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    app.config['EXPORT_SYNC_MAX_ROWS'] = int(os.getenv('EXPORT_SYNC_MAX_ROWS', 100000))
+    app.config['EXPORT_DIR'] = os.getenv('EXPORT_DIR') or None
+    app.config['EXPORT_TTL'] = int(os.getenv('EXPORT_TTL', 86400))
+    
+    # Календарь: максимальный период запроса, дней; кэш развёрнутых недель
+    # расписания (число недель и TTL, сек) - в хранилище USER_CACHE_URL
+    app.config['CALENDAR_MAX_DAYS'] = int(os.getenv('CALENDAR_MAX_DAYS', 62))
+    app.config['CALENDAR_CACHE_SIZE'] = int(os.getenv('CALENDAR_CACHE_SIZE', 20000))
+    app.config['CALENDAR_CACHE_TTL'] = int(os.getenv('CALENDAR_CACHE_TTL', 3600))
+
+# Расширения создаются без приложения и подключаются в create_app
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
-socketio = SocketIO(app, cors_allowed_origins="*")
-CORS(app)
+socketio = SocketIO()
+cors = CORS()
+instrumentation = Instrumentation()
+password_hasher = PasswordHasher()
+
+# Маршруты и команды CLI собираются при импорте и подключаются в create_app.
+# Blueprint не подходит: он добавляет префикс к именам endpoint, а шаблоны
+# (общие с app_simple.py) ссылаются на url_for('login'), url_for('dashboard')
+routes = []
+cli = AppGroup('eduverse')
+
+def route(rule, **options):
+    def decorator(view):
+        routes.append((rule, view, options))
+        return view
+    return decorator
 
 # Модели базы данных
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    # 255: хеш scrypt длиннее 120 символов
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # super_admin, project_admin, school_admin, teacher, student, parent
     school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Связи будут определены после всех моделей
+    
+    __table_args__ = (
+        # Число пользователей школ на странице дашборда супер-админа
+        db.Index('ix_user_school_id', 'school_id'),
+    )
 
 class School(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -68,19 +225,33 @@ class StudentSubject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
+    
+    # Проверка, что ученики журнала записаны на предмет
+    __table_args__ = (
+        db.Index('ix_student_subject_subject_student', 'subject_id', 'student_id'),
+    )
 
 class ClassStudent(db.Model):
     __tablename__ = 'class_student'
-    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    # active_history: при переводе ученика в другой класс агрегаты старого
+    # класса уменьшаются на его оценки
+    class_id = db.column_property(db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True), active_history=True)
+    student_id = db.column_property(db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True), active_history=True)
 
 class Grade(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
-    grade = db.Column(db.Integer, nullable=False)  # 1-10 баллов
+    # active_history: старое значение нужно для обновления агрегатов оценок,
+    # даже если объект был expired после commit
+    student_id = db.column_property(db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False), active_history=True)
+    subject_id = db.column_property(db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False), active_history=True)
+    grade = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)  # 1-10 баллов
     date = db.Column(db.Date, nullable=False)
     comment = db.Column(db.Text)
+    
+    # Журнал ищет оценки ячеек (ученик, предмет, дата); одна оценка на ячейку
+    __table_args__ = (
+        db.Index('ix_grade_student_subject_date', 'student_id', 'subject_id', 'date', unique=True),
+    )
 
 class Schedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -92,6 +263,11 @@ class Schedule(db.Model):
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
     room = db.Column(db.String(50))
+    
+    # Проверка конфликтов загружает расписание школы на нужный день
+    __table_args__ = (
+        db.Index('ix_schedule_school_day', 'school_id', 'day_of_week', 'start_time'),
+    )
 
 class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -101,6 +277,12 @@ class Event(db.Model):
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=False)
     event_type = db.Column(db.String(50))  # exam, holiday, event
+    
+    # Календарь выбирает события школы по диапазону дат; end_date в индексе -
+    # условие по нему проверяется без чтения строк таблицы
+    __table_args__ = (
+        db.Index('ix_event_school_start', 'school_id', 'start_date', 'end_date'),
+    )
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -111,6 +293,11 @@ class Payment(db.Model):
     status = db.Column(db.String(20), default='due')  # paid, partial, due
     month = db.Column(db.Integer, nullable=False)
     year = db.Column(db.Integer, nullable=False)
+    
+    # Ночная проверка просрочек ищет неоплаченные по status и due_date
+    __table_args__ = (
+        db.Index('ix_payment_status_due_date', 'status', 'due_date'),
+    )
 
 class ParentChild(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -129,6 +316,11 @@ class ChatParticipant(db.Model):
     chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Чаты пользователя (кэш участия, список чатов): ключ начинается с chat_id
+        db.Index('ix_chat_participant_user_id', 'user_id'),
+    )
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -138,9 +330,55 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_pinned = db.Column(db.Boolean, default=False)
+    
+    # История чата листается по ключу (timestamp, id) внутри chat_id,
+    # закреплённые сообщения - по частичному индексу только из них
+    __table_args__ = (
+        db.Index('ix_message_chat_timestamp_id', 'chat_id', 'timestamp', 'id'),
+        db.Index('ix_message_chat_pinned', 'chat_id', 'timestamp', 'id',
+                 sqlite_where=is_pinned == True,
+                 postgresql_where=is_pinned == True),
+    )
+
+# Агрегаты оценок: количество, сумма, сумма квадратов и гистограмма по шкале 1-10.
+# Поддерживаются инкрементально (см. apply_grade_deltas), дашборды читают их напрямую
+GRADE_SCALE = range(1, 11)
+
+class GradeStatMixin:
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    total_sq = db.Column(db.Integer, nullable=False, default=0)
+    h1 = db.Column(db.Integer, nullable=False, default=0)
+    h2 = db.Column(db.Integer, nullable=False, default=0)
+    h3 = db.Column(db.Integer, nullable=False, default=0)
+    h4 = db.Column(db.Integer, nullable=False, default=0)
+    h5 = db.Column(db.Integer, nullable=False, default=0)
+    h6 = db.Column(db.Integer, nullable=False, default=0)
+    h7 = db.Column(db.Integer, nullable=False, default=0)
+    h8 = db.Column(db.Integer, nullable=False, default=0)
+    h9 = db.Column(db.Integer, nullable=False, default=0)
+    h10 = db.Column(db.Integer, nullable=False, default=0)
+
+class GradeStat(GradeStatMixin, db.Model):
+    __tablename__ = 'grade_stat'
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), primary_key=True)
+
+class ClassGradeStat(GradeStatMixin, db.Model):
+    __tablename__ = 'class_grade_stat'
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), primary_key=True)
+
+# Очередь отложенной записи сообщений (настраивается в create_app, запускается при первом сообщении)
+message_writer = MessageWriter(None, db, Message)
+message_pipeline = MessagePipeline()
 
 # Определение связей после всех моделей
 def setup_relationships():
+    # Связи задаются один раз: повторный вызов (например, из __main__) ничего не делает
+    if 'grades' in User.__dict__:
+        return
+    
     # User relationships
     User.school = db.relationship('School', backref='users')
     User.teacher_subjects = db.relationship('TeacherSubject', backref='teacher')
@@ -148,6 +386,7 @@ def setup_relationships():
     User.grades = db.relationship('Grade', backref='student')
     User.payments = db.relationship('Payment', backref='student')
     User.parent_children = db.relationship('ParentChild', foreign_keys='ParentChild.parent_id', backref='parent')
+    ParentChild.child = db.relationship('User', foreign_keys='ParentChild.child_id')
     User.sent_messages = db.relationship('Message', foreign_keys='Message.sender_id', backref='sender')
     User.received_messages = db.relationship('Message', foreign_keys='Message.receiver_id', backref='receiver')
     
@@ -159,7 +398,7 @@ def setup_relationships():
     
     # Subject relationships
     Subject.teacher_subjects = db.relationship('TeacherSubject', backref='subject')
-    Subject.student_subjects = db.relationship('StudentSubject', backref='student')
+    Subject.student_subjects = db.relationship('StudentSubject', backref='subject')
     Subject.grades = db.relationship('Grade', backref='subject')
     
     # Class relationships
@@ -167,26 +406,520 @@ def setup_relationships():
     
     # Chat relationships
     Chat.participants = db.relationship('User', secondary='chat_participant')
-    Chat.messages = db.relationship('Message', backref='chat')
+    # Сообщений в чате может быть очень много: отдаём запрос, а не список
+    Chat.messages = db.relationship('Message', backref='chat', lazy='dynamic',
+                                    order_by=(Message.timestamp, Message.id))
+
+setup_relationships()
+
+# Профили загрузки связей для дашбордов: число запросов не растёт с объёмом данных.
+# Chat.messages - dynamic-связь, её не загружают заранее, а листают по страницам
+loading_profiles = LoadingProfiles()
+
+@loading_profiles.profile('student_dashboard')
+def student_dashboard_profile():
+    return [
+        joinedload(User.school),
+        selectinload(User.grades).joinedload(Grade.subject),
+        selectinload(User.payments),
+        selectinload(User.student_subjects).joinedload(StudentSubject.subject),
+    ]
+
+@loading_profiles.profile('parent_dashboard')
+def parent_dashboard_profile():
+    child = selectinload(User.parent_children).joinedload(ParentChild.child)
+    return [
+        child.joinedload(User.school),
+        child.selectinload(User.grades).joinedload(Grade.subject),
+        child.selectinload(User.payments),
+    ]
+
+@loading_profiles.profile('teacher_dashboard')
+def teacher_dashboard_profile():
+    return [
+        joinedload(User.school),
+        selectinload(User.teacher_subjects).joinedload(TeacherSubject.subject),
+    ]
+
+@loading_profiles.profile('school_overview')
+def school_overview_profile():
+    return [
+        selectinload(School.classes).selectinload(Class.students),
+        selectinload(School.subjects).selectinload(Subject.teacher_subjects).joinedload(TeacherSubject.teacher),
+        selectinload(School.events),
+    ]
+
+@loading_profiles.profile('chat_list')
+def chat_list_profile():
+    return [selectinload(Chat.participants)]
+
+# Инкрементальное обновление агрегатов оценок
+def _new_grade_acc():
+    return [0, 0, 0, [0] * len(GRADE_SCALE)]
+
+def _accumulate_grade(acc, grade, n):
+    acc[0] += n
+    acc[1] += grade * n
+    acc[2] += grade * grade * n
+    if grade in GRADE_SCALE:
+        acc[3][grade - GRADE_SCALE.start] += n
+
+def _merge_grade_acc(acc, other):
+    acc[0] += other[0]
+    acc[1] += other[1]
+    acc[2] += other[2]
+    acc[3] = [a + b for a, b in zip(acc[3], other[3])]
+
+def _upsert_grade_stats(connection, model, key_names, accs):
+    # Один INSERT ... ON CONFLICT DO UPDATE SET count = count + excluded.count
+    # пачкой: параллельные первые оценки одного ключа не дают IntegrityError
+    if not accs:
+        return
+    table = model.__table__
+    stat_columns = ['count', 'total', 'total_sq'] + [f'h{g}' for g in GRADE_SCALE]
+    rows = []
+    for key, (count, total, total_sq, histogram) in accs.items():
+        row = dict(zip(key_names, key), count=count, total=total, total_sq=total_sq)
+        row.update({f'h{g}': histogram[g - GRADE_SCALE.start] for g in GRADE_SCALE})
+        rows.append(row)
+    
+    statement = dialect_insert(connection.dialect, table)
+    if statement is not None:
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=list(key_names),
+            set_={name: table.c[name] + statement.excluded[name] for name in stat_columns}
+        ), rows)
+        return
+    
+    # Прочие СУБД: выборка существующих ключей, UPDATE пачкой и INSERT недостающих
+    key_columns = [table.c[name] for name in key_names]
+    existing = set(connection.execute(
+        select(*key_columns).where(tuple_(*key_columns).in_(list(accs)))
+    ).all())
+    updates = [{f'b_{name}': value for name, value in row.items()}
+               for row in rows if tuple(row[name] for name in key_names) in existing]
+    inserts = [row for row in rows if tuple(row[name] for name in key_names) not in existing]
+    if updates:
+        connection.execute(
+            table.update()
+            .where(*[column == bindparam(f'b_{column.name}') for column in key_columns])
+            .values({name: table.c[name] + bindparam(f'b_{name}') for name in stat_columns}),
+            updates
+        )
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+def apply_grade_deltas(connection, deltas):
+    """Применить изменения оценок к агрегатам ученика и его классов.
+    
+    deltas - итерируемое (student_id, subject_id, grade, n), где n = +1 для
+    добавленной оценки и -1 для удалённой. Массовые операции в обход ORM
+    должны вызывать эту функцию сами.
+    """
+    student_accs = defaultdict(_new_grade_acc)
+    for student_id, subject_id, grade, n in deltas:
+        _accumulate_grade(student_accs[(student_id, subject_id)], grade, n)
+    if not student_accs:
+        return
+    
+    student_ids = {student_id for student_id, _ in student_accs}
+    student_classes = defaultdict(list)
+    for class_id, student_id in connection.execute(
+        select(ClassStudent.class_id, ClassStudent.student_id)
+        .where(ClassStudent.student_id.in_(student_ids))
+    ):
+        student_classes[student_id].append(class_id)
+    
+    class_accs = defaultdict(_new_grade_acc)
+    for (student_id, subject_id), acc in student_accs.items():
+        for class_id in student_classes[student_id]:
+            _merge_grade_acc(class_accs[(class_id, subject_id)], acc)
+    
+    _upsert_grade_stats(connection, GradeStat, ('student_id', 'subject_id'), student_accs)
+    _upsert_grade_stats(connection, ClassGradeStat, ('class_id', 'subject_id'), class_accs)
+
+def apply_class_membership(connection, class_id, student_id, n):
+    # Ученик пришёл в класс (n=1) или ушёл из него (n=-1) со всеми своими оценками
+    class_accs = defaultdict(_new_grade_acc)
+    for subject_id, grade, count in connection.execute(
+        select(Grade.subject_id, Grade.grade, func.count())
+        .where(Grade.student_id == student_id)
+        .group_by(Grade.subject_id, Grade.grade)
+    ):
+        _accumulate_grade(class_accs[(class_id, subject_id)], grade, count * n)
+    _upsert_grade_stats(connection, ClassGradeStat, ('class_id', 'subject_id'), class_accs)
+
+def _previous_value(target, name):
+    history = inspect(target).attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(target, name)
+
+@event.listens_for(Grade, 'after_insert')
+def grade_inserted(mapper, connection, target):
+    apply_grade_deltas(connection, [(target.student_id, target.subject_id, target.grade, 1)])
+
+@event.listens_for(Grade, 'after_update')
+def grade_updated(mapper, connection, target):
+    key_names = ('student_id', 'subject_id', 'grade')
+    old = tuple(_previous_value(target, name) for name in key_names)
+    new = tuple(getattr(target, name) for name in key_names)
+    if old != new:
+        apply_grade_deltas(connection, [old + (-1,), new + (1,)])
+
+@event.listens_for(Grade, 'after_delete')
+def grade_deleted(mapper, connection, target):
+    apply_grade_deltas(connection, [(target.student_id, target.subject_id, target.grade, -1)])
+
+@event.listens_for(ClassStudent, 'after_insert')
+def class_student_inserted(mapper, connection, target):
+    apply_class_membership(connection, target.class_id, target.student_id, 1)
+
+@event.listens_for(ClassStudent, 'after_delete')
+def class_student_deleted(mapper, connection, target):
+    apply_class_membership(connection, target.class_id, target.student_id, -1)
+
+@event.listens_for(ClassStudent, 'after_update')
+def class_student_updated(mapper, connection, target):
+    old = (_previous_value(target, 'class_id'), _previous_value(target, 'student_id'))
+    new = (target.class_id, target.student_id)
+    if old != new:
+        apply_class_membership(connection, *old, -1)
+        apply_class_membership(connection, *new, 1)
+
+def rebuild_grade_stats():
+    """Полностью пересчитать агрегаты из таблиц grade и class_student."""
+    stat_names = ['count', 'total', 'total_sq'] + [f'h{g}' for g in GRADE_SCALE]
+    stat_columns = [
+        func.count(Grade.id),
+        func.sum(Grade.grade),
+        func.sum(Grade.grade * Grade.grade)
+    ] + [func.sum(case((Grade.grade == g, 1), else_=0)) for g in GRADE_SCALE]
+    
+    db.session.execute(delete(GradeStat))
+    db.session.execute(delete(ClassGradeStat))
+    student_rows = db.session.execute(
+        insert(GradeStat).from_select(
+            ['student_id', 'subject_id'] + stat_names,
+            select(Grade.student_id, Grade.subject_id, *stat_columns)
+            .group_by(Grade.student_id, Grade.subject_id)
+        )
+    ).rowcount
+    class_rows = db.session.execute(
+        insert(ClassGradeStat).from_select(
+            ['class_id', 'subject_id'] + stat_names,
+            select(ClassStudent.class_id, Grade.subject_id, *stat_columns)
+            .join(Grade, Grade.student_id == ClassStudent.student_id)
+            .group_by(ClassStudent.class_id, Grade.subject_id)
+        )
+    ).rowcount
+    db.session.commit()
+    return student_rows, class_rows
+
+@cli.command('rebuild-grade-stats')
+def rebuild_grade_stats_command():
+    """Пересчитать агрегаты оценок по ученикам и классам."""
+    student_rows, class_rows = rebuild_grade_stats()
+    click.echo(f'Агрегаты пересчитаны: ученик/предмет - {student_rows}, класс/предмет - {class_rows}')
+
+def grade_stat_to_dict(stat):
+    average = stat.total / stat.count if stat.count else None
+    variance = stat.total_sq / stat.count - average * average if stat.count else None
+    return {
+        'subject_id': stat.subject_id,
+        'count': stat.count,
+        'average': round(average, 2) if average is not None else None,
+        'stddev': round(math.sqrt(max(variance, 0.0)), 2) if variance is not None else None,
+        'histogram': {g: getattr(stat, f'h{g}') for g in GRADE_SCALE}
+    }
+
+# Массовый импорт: ClassStudent вставляется в обход ORM, поэтому агрегаты
+# оценок классов обновляются хуком
+def imported_class_students(connection, rows):
+    for row in rows:
+        apply_class_membership(connection, row['class_id'], row['student_id'], 1)
+
+# Школы и пользователи вставляются в обход событий ORM: кэш /api/schools
+# и итоги дашборда супер-админа сбрасываются после commit
+def imported_schools(connection, rows):
+    mark_response_changed(db.session, 'schools')
+    mark_response_changed(db.session, ADMIN_STATS_GENERATION)
+
+def imported_users(connection, rows):
+    mark_response_changed(db.session, ADMIN_STATS_GENERATION)
+
+def create_importer(chunk_size=None, hash_workers=None, hash_many=None):
+    models = SimpleNamespace(
+        School=School, Subject=Subject, Class=Class, User=User,
+        ClassStudent=ClassStudent, StudentSubject=StudentSubject, ParentChild=ParentChild
+    )
+    return BulkImporter(
+        db.session, models,
+        chunk_size=chunk_size or current_app.config['IMPORT_CHUNK_SIZE'],
+        hash_workers=hash_workers,
+        hash_method=current_app.config['PASSWORD_HASH_METHOD'],
+        hash_many=hash_many,
+        hooks={'schools': imported_schools, 'users': imported_users,
+               'class_students': imported_class_students}
+    )
+
+def import_format(filename, explicit=None):
+    fmt = explicit or ('jsonl' if filename and filename.endswith(('.jsonl', '.ndjson')) else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f'Неизвестный формат: {fmt}')
+    return fmt
+
+# Статусы платежей и просрочки
+UNPAID_STATUSES = ('due', 'partial')
+
+def payment_status(amount, paid_amount):
+    paid_amount = paid_amount or 0
+    if paid_amount >= amount:
+        return 'paid'
+    if paid_amount > 0:
+        return 'partial'
+    return 'due'
+
+@event.listens_for(Payment, 'before_insert')
+@event.listens_for(Payment, 'before_update')
+def payment_changed(mapper, connection, target):
+    target.status = payment_status(target.amount, target.paid_amount)
+
+def sweep_payments(chunk_size=5000, today=None):
+    """Пересчитать статусы всех платежей и посчитать просрочки по школам.
+    
+    Платежи обходятся по первичному ключу диапазонами по chunk_size строк,
+    каждый диапазон обновляется одним UPDATE в своей транзакции; ORM-объекты
+    не загружаются. Просроченные платежи ищутся по индексу (status, due_date).
+    """
+    today = today or datetime.utcnow().date()
+    started = datetime.utcnow()
+    paid = func.coalesce(Payment.paid_amount, 0)
+    computed_status = case(
+        (paid >= Payment.amount, 'paid'),
+        (paid > 0, 'partial'),
+        else_='due'
+    )
+    
+    chunks = updated = 0
+    last_id = 0
+    while True:
+        # Граница диапазона и UPDATE - в одной транзакции с блокировкой записи
+        write_lock(db.session)
+        upper_id = db.session.scalar(
+            select(Payment.id).where(Payment.id > last_id)
+            .order_by(Payment.id).offset(chunk_size - 1).limit(1)
+        )
+        in_range = Payment.id > last_id
+        if upper_id is not None:
+            in_range = in_range & (Payment.id <= upper_id)
+        
+        result = db.session.execute(
+            Payment.__table__.update()
+            .where(in_range)
+            .where((Payment.status.is_(None)) | (Payment.status != computed_status))
+            .values(status=computed_status)
+        )
+        db.session.commit()
+        chunks += 1
+        updated += result.rowcount
+        if upper_id is None:
+            break
+        last_id = upper_id
+    
+    overdue = {}
+    for school_id, count, outstanding in db.session.execute(
+        select(User.school_id, func.count(Payment.id), func.sum(Payment.amount - paid))
+        .join(User, User.id == Payment.student_id)
+        .where(Payment.status.in_(UNPAID_STATUSES), Payment.due_date < today)
+        .group_by(User.school_id)
+    ):
+        overdue[school_id] = {'count': count, 'outstanding': round(outstanding or 0, 2)}
+    db.session.rollback()
+    
+    report = {
+        'date': today.isoformat(),
+        'chunks': chunks,
+        'updated': updated,
+        'overdue_total': sum(item['count'] for item in overdue.values()),
+        'overdue_by_school': overdue,
+        'seconds': round((datetime.utcnow() - started).total_seconds(), 3)
+    }
+    current_app.logger.info('payment_sweep %s', json.dumps(report, ensure_ascii=False))
+    return report
+
+@cli.command('sweep-payments')
+@click.option('--chunk-size', type=int, default=5000, help='Платежей в одном UPDATE')
+@click.option('--date', 'today', type=click.DateTime(formats=['%Y-%m-%d']), help='Дата проверки (по умолчанию сегодня)')
+def sweep_payments_command(chunk_size, today):
+    """Пересчитать статусы платежей и вывести просрочки по школам (для cron)."""
+    report = sweep_payments(chunk_size, today.date() if today else None)
+    click.echo(f"Обновлено статусов: {report['updated']} за {report['chunks']} пачек, "
+               f"просрочено: {report['overdue_total']}, {report['seconds']} с")
+    for school_id, item in sorted(report['overdue_by_school'].items(), key=lambda kv: kv[0] or 0):
+        click.echo(f"  школа {school_id}: {item['count']} платежей, долг {item['outstanding']}")
+
+@cli.command('import-data')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='По умолчанию по расширению файла')
+@click.option('--chunk-size', type=int, help='Строк в одной пачке')
+@click.option('--hash-workers', type=int,
+              help='Процессов для хеширования паролей (0 - без пула; по умолчанию IMPORT_HASH_WORKERS)')
+def import_data_command(kind, path, fmt, chunk_size, hash_workers):
+    """Импортировать KIND из CSV/JSONL файла PATH."""
+    if hash_workers is None:
+        hash_workers = current_app.config['IMPORT_HASH_WORKERS']
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        records = iter_records(stream, import_format(path, fmt))
+        report = create_importer(chunk_size, hash_workers).run(records, kind)
+    
+    click.echo(f"Прочитано: {report['read']}, добавлено: {report['inserted']}, "
+               f"ошибок: {report['failed']}, {report['seconds']} с ({report['rows_per_sec']} строк/с)")
+    for error in report['errors']:
+        click.echo(f"  строка {error['row']}: {error['error']}")
+
+# Инициализация пользователя для Flask-Login (бэкенд кэша выбирается в create_app)
+user_cache = UserCache(create_cache_backend())
+
+# Хеш пароля в общий кэш не попадает: вход читает строку из БД сам, а у
+# объекта из снимка password_hash загрузится отдельным запросом при обращении
+SNAPSHOT_EXCLUDED = {'password_hash'}
+
+def user_snapshot(user):
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns
+            if column.key not in SNAPSHOT_EXCLUDED}
 
-# Инициализация пользователя для Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        # Восстанавливаем объект из снимка и присоединяем к сессии без SELECT
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    # Версия читается до SELECT: если строку изменят и кэш сбросят, пока
+    # она читается, устаревший снимок не запишется
+    version = user_cache.version(user_id)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        user_cache.set(user_id, user_snapshot(user), version=version)
+    return user
+
+# Сброс кэша при изменении пользователя: сразу при flush и повторно после
+# commit, чтобы параллельный запрос не успел закэшировать незакоммиченное
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def user_changed(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    inspect(target).session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id, count=False)
+
+# Кэш ответов: поколение увеличивается при flush и ещё раз после commit,
+# чтобы ответ, построенный по незакоммиченным данным, не остался в кэше
+response_cache = ResponseCache()
+
+def mark_response_changed(session, name):
+    response_cache.bump(name)
+    session.info.setdefault('changed_responses', set()).add(name)
+
+@event.listens_for(School, 'after_insert')
+@event.listens_for(School, 'after_update')
+@event.listens_for(School, 'after_delete')
+def school_changed(mapper, connection, target):
+    mark_response_changed(inspect(target).session, 'schools')
+
+# Итоги дашборда супер-админа: тот же счётчик поколений, что у кэша ответов
+admin_stats = AdminStats(SimpleNamespace(School=School, User=User, Payment=Payment), ROLES,
+                         generations=response_cache.generations)
+
+@event.listens_for(School, 'after_insert')
+@event.listens_for(School, 'after_update')
+@event.listens_for(School, 'after_delete')
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+@event.listens_for(Payment, 'after_insert')
+@event.listens_for(Payment, 'after_update')
+@event.listens_for(Payment, 'after_delete')
+def platform_changed(mapper, connection, target):
+    mark_response_changed(inspect(target).session, ADMIN_STATS_GENERATION)
+
+@event.listens_for(Session, 'after_commit')
+def bump_committed_responses(session):
+    for name in session.info.pop('changed_responses', ()):
+        response_cache.bump(name)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_rolled_back_responses(session):
+    session.info.pop('changed_responses', None)
+
+# Счётчики кэша пользователей и очереди сообщений в /metrics
+def runtime_metrics():
+    cache = user_cache.stats()
+    writer = message_writer.stats
+    presence_counts = presence.counts()
+    return [
+        ('eduverse_user_cache_hits_total', 'counter', {}, cache['hits']),
+        ('eduverse_user_cache_misses_total', 'counter', {}, cache['misses']),
+        ('eduverse_user_cache_invalidations_total', 'counter', {}, cache['invalidations']),
+        ('eduverse_chat_messages_written_total', 'counter', {}, writer['written']),
+        ('eduverse_chat_messages_rejected_total', 'counter', {}, writer['rejected']),
+        ('eduverse_chat_messages_failed_total', 'counter', {}, writer['failed']),
+        ('eduverse_chat_messages_retried_total', 'counter', {}, writer['retried']),
+        ('eduverse_chat_write_queue_pending', 'gauge', {}, message_writer.pending),
+        ('eduverse_chat_messages_accepted_total', 'counter', {}, message_pipeline.stats['accepted']),
+        ('eduverse_chat_messages_invalid_total', 'counter', {}, message_pipeline.stats['rejected']),
+        ('eduverse_chat_frames_total', 'counter', {}, message_pipeline.stats['frames']),
+        ('eduverse_response_cache_hits_total', 'counter', {}, response_cache.stats['hits']),
+        ('eduverse_response_cache_misses_total', 'counter', {}, response_cache.stats['misses']),
+        ('eduverse_response_cache_not_modified_total', 'counter', {}, response_cache.stats['not_modified']),
+        ('eduverse_password_hash_pending', 'gauge', {}, password_hasher.pending),
+        ('eduverse_password_hash_rejected_total', 'counter', {}, password_hasher.stats['rejected']),
+        ('eduverse_password_rehashed_total', 'counter', {}, password_hasher.stats['rehashed']),
+        ('eduverse_presence_connections', 'gauge', {}, presence_counts['connections']),
+        ('eduverse_presence_online_users', 'gauge', {}, presence_counts['users']),
+        ('eduverse_chat_join_rejected_total', 'counter', {}, presence.stats['rejected']),
+        ('eduverse_admin_stats_hits_total', 'counter', {}, admin_stats.stats['hits']),
+        ('eduverse_admin_stats_misses_total', 'counter', {}, admin_stats.stats['misses']),
+        ('eduverse_calendar_week_hits_total', 'counter', {}, schedule_calendar.stats['hits']),
+        ('eduverse_calendar_week_misses_total', 'counter', {}, schedule_calendar.stats['misses']),
+    ]
+
+instrumentation.add_collector(runtime_metrics)
 
 # Маршруты
-@app.route('/')
+@route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+def too_many_attempts(template):
+    flash('Слишком много попыток, попробуйте через несколько секунд')
+    return render_template(template), 429, {'Retry-After': '1'}
+
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        user = User.query.filter_by(username=username).first()
+        try:
+            with password_hasher.limit(request.remote_addr, username):
+                user = User.query.filter_by(username=username).first()
+                valid, new_hash = password_hasher.verify(user.password_hash, password) if user else (False, None)
+        except HashLimitError:
+            return too_many_attempts('login.html')
         
-        if user and check_password_hash(user.password_hash, password):
+        if valid:
+            if new_hash:
+                # Транзакция чтения закрывается до записи: хеш пересчитан вне её,
+                # обновление идёт своей транзакцией с блокировкой записи
+                db.session.commit()
+                user.password_hash = new_hash
+                db.session.commit()
             login_user(user)
             return redirect(url_for('dashboard'))
         else:
@@ -194,7 +927,7 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -210,10 +943,19 @@ def register():
             flash('Пользователь с таким email уже существует')
             return render_template('register.html')
         
+        try:
+            with password_hasher.limit(request.remote_addr, username):
+                password_hash = password_hasher.hash(password)
+        except HashLimitError:
+            return too_many_attempts('register.html')
+        
+        # Проверки выше - отдельная транзакция чтения (хеширование идёт вне её);
+        # одновременную регистрацию того же имени остановит уникальный индекс
+        db.session.commit()
         user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password),
+            password_hash=password_hash,
             role=role
         )
         db.session.add(user)
@@ -224,13 +966,13 @@ def register():
     
     return render_template('register.html')
 
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
     return redirect(url_for('index'))
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
     if current_user.role == 'super_admin':
@@ -248,18 +990,76 @@ def dashboard():
     
     return redirect(url_for('index'))
 
+# Дашборд супер-админа: итоги из кэша admin_stats и первая страница школ,
+# следующие страницы таблица подгружает из /api/admin/schools
+@route('/super-admin-dashboard')
+@login_required
+@use_replica
+def super_admin_dashboard():
+    if current_user.role != 'super_admin':
+        flash('Недостаточно прав')
+        return redirect(url_for('index'))
+    
+    schools, has_more = admin_stats.school_page(db.session)
+    return render_template('super_admin_dashboard.html',
+                         schools=schools,
+                         stats=admin_stats.get(db.session),
+                         schools_after=encode_cursor(schools[-1].id) if has_more else None,
+                         recent_activities=[])
+
+@route('/api/admin/stats', methods=['GET'])
+@login_required
+@use_replica
+def get_admin_stats():
+    if current_user.role != 'super_admin':
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    return jsonify(admin_stats.get(db.session))
+
+@route('/api/admin/schools', methods=['GET'])
+@login_required
+@use_replica
+def get_admin_schools():
+    if current_user.role != 'super_admin':
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    after_cursor = request.args.get('after')
+    status = request.args.get('status') or None
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+        after = decode_cursor(after_cursor, 1) if after_cursor else None
+        if status not in (None, 'active', 'inactive'):
+            raise ValueError('Некорректный статус')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    schools, has_more = admin_stats.school_page(
+        db.session, after=after, limit=limit,
+        search=request.args.get('q', '').strip() or None, status=status)
+    return jsonify({
+        'schools': [school.to_dict() for school in schools],
+        'after': encode_cursor(schools[-1].id) if has_more else None,
+        'has_more': has_more
+    })
+
 # API маршруты для школ
-@app.route('/api/schools', methods=['GET'])
+@route('/api/schools', methods=['GET'])
 def get_schools():
-    schools = School.query.filter_by(is_active=True).all()
-    return jsonify([{
-        'id': school.id,
-        'name': school.name,
-        'unique_url': school.unique_url,
-        'description': school.description
-    } for school in schools])
+    def build():
+        rows = db.session.execute(
+            select(School.id, School.name, School.unique_url, School.description)
+            .where(School.is_active == True).order_by(School.id)
+        )
+        return [{
+            'id': row.id,
+            'name': row.name,
+            'unique_url': row.unique_url,
+            'description': row.description
+        } for row in rows]
+    # Ответ строится раз на поколение данных, повторные запросы с ETag получают 304
+    return response_cache.respond('schools', build)
 
-@app.route('/api/schools', methods=['POST'])
+@route('/api/schools', methods=['POST'])
+@write_transaction(db.session)
 @login_required
 def create_school():
     if current_user.role not in ['super_admin', 'project_admin']:
@@ -277,41 +1077,1175 @@ def create_school():
     
     return jsonify({'id': school.id, 'message': 'Школа создана успешно'})
 
+# API истории чата
+def message_to_dict(message):
+    return {
+        'id': message.id,
+        'chat_id': message.chat_id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat(),
+        'is_pinned': bool(message.is_pinned)
+    }
+
+def can_read_chat(user, chat_id):
+    if user.role == 'super_admin':
+        return True
+    return chat_id in presence.chat_ids(user.id)
+
+def chat_messages_page(chat_id, pinned_only=False):
+    if not can_read_chat(current_user, chat_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    before_cursor = request.args.get('before')
+    after_cursor = request.args.get('after')
+    try:
+        if before_cursor and after_cursor:
+            raise ValueError('Укажите только before или after')
+        limit = parse_page_size(request.args.get('limit'))
+        before = decode_cursor(before_cursor, 2) if before_cursor else None
+        after = decode_cursor(after_cursor, 2) if after_cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = Message.query.filter(Message.chat_id == chat_id)
+    if pinned_only:
+        query = query.filter(Message.is_pinned == True)
+    
+    messages, has_more = keyset_page(query, (Message.timestamp, Message.id),
+                                     before=before, after=after, limit=limit)
+    
+    if messages:
+        before_cursor = encode_cursor(messages[0].timestamp, messages[0].id)
+        after_cursor = encode_cursor(messages[-1].timestamp, messages[-1].id)
+    
+    return jsonify({
+        'messages': [message_to_dict(m) for m in messages],
+        'before': before_cursor,
+        'after': after_cursor,
+        # Для before/без курсора has_more означает наличие более старых сообщений,
+        # для after - более новых
+        'has_more': has_more
+    })
+
+@route('/api/chats/<int:chat_id>/messages', methods=['GET'])
+@login_required
+@use_replica
+def get_chat_messages(chat_id):
+    return chat_messages_page(chat_id)
+
+@route('/api/chats/<int:chat_id>/messages/pinned', methods=['GET'])
+@login_required
+@use_replica
+def get_pinned_messages(chat_id):
+    return chat_messages_page(chat_id, pinned_only=True)
+
+# API журнала: оценки класса по предмету за несколько дат одним запросом
+def can_grade_subject(user, subject):
+    if user.role in ('super_admin', 'project_admin'):
+        return True
+    if user.school_id != subject.school_id:
+        return False
+    if user.role == 'school_admin':
+        return True
+    return user.role == 'teacher' and db.session.execute(
+        select(TeacherSubject.id).where(TeacherSubject.teacher_id == user.id,
+                                        TeacherSubject.subject_id == subject.id)
+    ).first() is not None
+
+@route('/api/subjects/<int:subject_id>/grades', methods=['POST'])
+@write_transaction(db.session)
+@login_required
+def submit_grades(subject_id):
+    subject = db.session.get(Subject, subject_id)
+    if subject is None:
+        return jsonify({'error': 'Предмет не найден'}), 404
+    if not can_grade_subject(current_user, subject):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    class_id = data.get('class_id')
+    if class_id is not None:
+        school_class = db.session.get(Class, class_id) if isinstance(class_id, int) else None
+        if school_class is None or school_class.school_id != subject.school_id:
+            return jsonify({'error': 'Класс не найден в школе предмета'}), 400
+    
+    journal = GradeJournal(db.session, SimpleNamespace(
+        Grade=Grade, StudentSubject=StudentSubject, ClassStudent=ClassStudent
+    ), apply_deltas=apply_grade_deltas)
+    try:
+        report = journal.submit(subject_id, data.get('dates'), data.get('rows'), class_id=class_id)
+    except JournalError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report)
+
+# API статистики оценок (чтение готовых агрегатов)
+STAFF_ROLES = ('super_admin', 'project_admin', 'school_admin', 'teacher')
+
+def can_view_student(user, student_id):
+    if user.id == student_id or user.role in ('super_admin', 'project_admin'):
+        return True
+    if user.role == 'parent':
+        return ParentChild.query.filter_by(parent_id=user.id, child_id=student_id).first() is not None
+    if user.role in STAFF_ROLES:
+        student = db.session.get(User, student_id)
+        return student is not None and student.school_id == user.school_id
+    return False
+
+def can_view_class(user, class_id):
+    if user.role in ('super_admin', 'project_admin'):
+        return True
+    if user.role in STAFF_ROLES:
+        school_class = db.session.get(Class, class_id)
+        return school_class is not None and school_class.school_id == user.school_id
+    return False
+
+@route('/api/grade-stats/students/<int:student_id>', methods=['GET'])
+@login_required
+@use_replica
+def get_student_grade_stats(student_id):
+    if not can_view_student(current_user, student_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    query = GradeStat.query.filter_by(student_id=student_id)
+    if request.args.get('subject_id'):
+        query = query.filter_by(subject_id=request.args.get('subject_id', type=int))
+    return jsonify([grade_stat_to_dict(stat) for stat in query.all()])
+
+@route('/api/grade-stats/classes/<int:class_id>', methods=['GET'])
+@login_required
+@use_replica
+def get_class_grade_stats(class_id):
+    if not can_view_class(current_user, class_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    query = ClassGradeStat.query.filter_by(class_id=class_id)
+    if request.args.get('subject_id'):
+        query = query.filter_by(subject_id=request.args.get('subject_id', type=int))
+    return jsonify([grade_stat_to_dict(stat) for stat in query.all()])
+
+@route('/api/admin/cache-stats', methods=['GET'])
+@login_required
+def get_cache_stats():
+    if current_user.role != 'super_admin':
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    return jsonify({'user_cache': user_cache.stats(), 'response_cache': response_cache.stats,
+                    'admin_stats': admin_stats.stats})
+
+# API дашбордов: данные грузятся профилями loading_profiles за фиксированное число запросов
+def user_brief(user):
+    return {'id': user.id, 'username': user.username, 'role': user.role}
+
+def grade_to_dict(grade):
+    return {
+        'id': grade.id,
+        'subject_id': grade.subject_id,
+        'subject': grade.subject.name,
+        'grade': grade.grade,
+        'date': grade.date.isoformat(),
+        'comment': grade.comment
+    }
+
+def payment_to_dict(payment):
+    return {
+        'id': payment.id,
+        'amount': payment.amount,
+        'paid_amount': payment.paid_amount,
+        'due_date': payment.due_date.isoformat(),
+        'status': payment.status,
+        'month': payment.month,
+        'year': payment.year
+    }
+
+def student_overview(student):
+    grades = sorted(student.grades, key=lambda g: (g.date, g.id), reverse=True)
+    return {
+        **user_brief(student),
+        'school': student.school.name if student.school else None,
+        'grades': [grade_to_dict(g) for g in grades],
+        'payments': [payment_to_dict(p) for p in sorted(student.payments, key=lambda p: (p.year, p.month))]
+    }
+
+def load_current_user(profile):
+    return loading_profiles.apply(User.query, profile).filter(User.id == current_user.id).one()
+
+@route('/api/dashboard/student', methods=['GET'])
+@login_required
+@use_replica
+def get_student_dashboard():
+    if current_user.role != 'student':
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    student = load_current_user('student_dashboard')
+    data = student_overview(student)
+    data['subjects'] = [{'id': link.subject.id, 'name': link.subject.name}
+                        for link in student.student_subjects]
+    return jsonify(data)
+
+@route('/api/dashboard/parent', methods=['GET'])
+@login_required
+@use_replica
+def get_parent_dashboard():
+    if current_user.role != 'parent':
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    parent = load_current_user('parent_dashboard')
+    return jsonify({'children': [student_overview(link.child) for link in parent.parent_children]})
+
+@route('/api/dashboard/teacher', methods=['GET'])
+@login_required
+@use_replica
+def get_teacher_dashboard():
+    if current_user.role != 'teacher':
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    teacher = load_current_user('teacher_dashboard')
+    return jsonify({
+        **user_brief(teacher),
+        'school': teacher.school.name if teacher.school else None,
+        'subjects': [{'id': link.subject.id, 'name': link.subject.name}
+                     for link in teacher.teacher_subjects]
+    })
+
+@route('/api/schools/<int:school_id>/overview', methods=['GET'])
+@login_required
+@use_replica
+def get_school_overview(school_id):
+    if not can_view_school(current_user, school_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    school = loading_profiles.apply(School.query, 'school_overview').filter(School.id == school_id).first()
+    if school is None:
+        return jsonify({'error': 'Школа не найдена'}), 404
+    return jsonify({
+        'id': school.id,
+        'name': school.name,
+        'classes': [{
+            'id': c.id,
+            'name': c.name,
+            'grade_level': c.grade_level,
+            'students': [user_brief(u) for u in c.students]
+        } for c in school.classes],
+        'subjects': [{
+            'id': subject.id,
+            'name': subject.name,
+            'teachers': [user_brief(link.teacher) for link in subject.teacher_subjects]
+        } for subject in school.subjects],
+        'events': [{
+            'id': e.id,
+            'title': e.title,
+            'start_date': e.start_date.isoformat(),
+            'end_date': e.end_date.isoformat(),
+            'event_type': e.event_type
+        } for e in school.events]
+    })
+
+@route('/api/chats', methods=['GET'])
+@login_required
+@use_replica
+def get_chats():
+    query = Chat.query.join(ChatParticipant, ChatParticipant.chat_id == Chat.id).filter(
+        ChatParticipant.user_id == current_user.id).order_by(Chat.id)
+    return jsonify([{
+        'id': chat.id,
+        'name': chat.name,
+        'chat_type': chat.chat_type,
+        'participants': [user_brief(u) for u in chat.participants]
+    } for chat in loading_profiles.apply(query, 'chat_list')])
+
+# API массового импорта
+@route('/api/import/<kind>', methods=['POST'])
+@login_required
+def import_data(kind):
+    if current_user.role not in ['super_admin', 'project_admin']:
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    if kind not in IMPORT_KINDS:
+        return jsonify({'error': f'Неизвестный вид импорта: {kind}'}), 404
+    
+    # Файл формы или тело запроса целиком; читается потоково
+    upload = request.files.get('file')
+    raw = upload.stream if upload else request.stream
+    filename = upload.filename if upload else None
+    try:
+        fmt = import_format(filename, request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        # В веб-воркере без пула процессов: пароли пачки раздаются по общему
+        # ограниченному пулу password_hasher, импорт занимает в нём одну попытку
+        with password_hasher.limit(request.remote_addr):
+            report = create_importer(hash_workers=0, hash_many=password_hasher.hash_many).run(
+                iter_records(stream, fmt), kind)
+    except HashLimitError:
+        return jsonify({'error': 'Слишком много попыток, попробуйте через несколько секунд'}), 429, {'Retry-After': '1'}
+    except ValueError as e:
+        return jsonify({'error': f'Ошибка чтения файла: {e}'}), 400
+    return jsonify(report)
+
+# API расписания с проверкой конфликтов
+def can_manage_school(user, school_id):
+    if user.role in ('super_admin', 'project_admin'):
+        return True
+    return user.role == 'school_admin' and user.school_id == school_id
+
+def can_view_school(user, school_id):
+    if user.role in ('super_admin', 'project_admin'):
+        return True
+    return user.role in STAFF_ROLES and user.school_id == school_id
+
+def minutes_to_time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+def parse_lesson(data, lesson_id):
+    try:
+        day = int(data['day_of_week'])
+        start = to_minutes(data['start_time'])
+        end = to_minutes(data['end_time'])
+        teacher_id = int(data['teacher_id'])
+        class_id = int(data['class_id'])
+        subject_id = int(data['subject_id'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'Некорректный урок: {e}')
+    if not 0 <= day <= 6:
+        raise ValueError('day_of_week должен быть от 0 до 6')
+    if start >= end:
+        raise ValueError('Урок должен заканчиваться позже, чем начинается')
+    
+    room = str(data.get('room') or '').strip() or None
+    lesson = Lesson(lesson_id, day, start, end, teacher_id, class_id, room)
+    return lesson, subject_id
+
+def load_timetable(school_id, day=None):
+    # Только колонки, без ORM-объектов: школа может иметь тысячи уроков
+    query = select(Schedule.id, Schedule.day_of_week, Schedule.start_time, Schedule.end_time,
+                   Schedule.teacher_id, Schedule.class_id, Schedule.room).where(Schedule.school_id == school_id)
+    if day is not None:
+        query = query.where(Schedule.day_of_week == day)
+    return TimetableEngine(
+        Lesson(row.id, row.day_of_week, to_minutes(row.start_time), to_minutes(row.end_time),
+               row.teacher_id, row.class_id, row.room)
+        for row in db.session.execute(query)
+    )
+
+def foreign_resources(school_id, lessons):
+    """Учителя, классы и предметы уроков, которые не относятся к школе.
+    
+    lessons - пары (Lesson, subject_id); проверка одним запросом. Возвращает
+    {'teacher_id': [...], 'class_id': [...], 'subject_id': [...]} только
+    с непустыми списками.
+    """
+    wanted = {
+        'teacher_id': {lesson.teacher_id for lesson, _ in lessons},
+        'class_id': {lesson.class_id for lesson, _ in lessons},
+        'subject_id': {subject_id for _, subject_id in lessons},
+    }
+    found = defaultdict(set)
+    for field, value in db.session.execute(union_all(
+        select(literal('teacher_id'), User.id).where(
+            User.id.in_(wanted['teacher_id']), User.school_id == school_id, User.role == 'teacher'),
+        select(literal('class_id'), Class.id).where(
+            Class.id.in_(wanted['class_id']), Class.school_id == school_id),
+        select(literal('subject_id'), Subject.id).where(
+            Subject.id.in_(wanted['subject_id']), Subject.school_id == school_id),
+    )):
+        found[field].add(value)
+    return {field: sorted(ids - found[field]) for field, ids in wanted.items() if ids - found[field]}
+
+def foreign_resources_response(invalid):
+    return jsonify({'error': 'Учитель, класс или предмет не относится к школе', 'invalid': invalid}), 400
+
+def lock_timetable(school_id):
+    """Блокировка записи расписания школы до проверки конфликтов.
+    
+    Проверка и вставка идут в одной транзакции: в SQLite её открывает
+    @write_transaction с блокировкой записи, в остальных СУБД блокируется
+    строка школы. False, если школы нет.
+    """
+    return db.session.scalar(select(School.id).where(School.id == school_id).with_for_update()) is not None
+
+def conflict_to_dict(kind, value, day, lesson_id, other_id):
+    return {'resource': kind, 'value': value, 'day_of_week': day,
+            'lesson': lesson_id, 'conflicts_with': other_id}
+
+def schedule_to_dict(schedule):
+    return {
+        'id': schedule.id,
+        'subject_id': schedule.subject_id,
+        'class_id': schedule.class_id,
+        'teacher_id': schedule.teacher_id,
+        'day_of_week': schedule.day_of_week,
+        'start_time': schedule.start_time.strftime('%H:%M'),
+        'end_time': schedule.end_time.strftime('%H:%M'),
+        'room': schedule.room
+    }
+
+@route('/api/schools/<int:school_id>/schedules', methods=['POST'])
+@write_transaction(db.session)
+@login_required
+def create_schedule(school_id):
+    if not can_manage_school(current_user, school_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    try:
+        lesson, subject_id = parse_lesson(request.get_json() or {}, None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not lock_timetable(school_id):
+        return jsonify({'error': 'Школа не найдена'}), 404
+    invalid = foreign_resources(school_id, [(lesson, subject_id)])
+    if invalid:
+        return foreign_resources_response(invalid)
+    conflicts = load_timetable(school_id, lesson.day).conflicts(lesson)
+    if conflicts:
+        return jsonify({
+            'error': 'Урок пересекается с расписанием',
+            'conflicts': [conflict_to_dict(kind, value, lesson.day, None, other)
+                          for kind, value, other in conflicts]
+        }), 409
+    
+    schedule = Schedule(
+        school_id=school_id, subject_id=subject_id, class_id=lesson.class_id,
+        teacher_id=lesson.teacher_id, day_of_week=lesson.day, room=lesson.room,
+        start_time=minutes_to_time(lesson.start), end_time=minutes_to_time(lesson.end)
+    )
+    db.session.add(schedule)
+    db.session.commit()
+    return jsonify(schedule_to_dict(schedule)), 201
+
+@route('/api/schools/<int:school_id>/timetable', methods=['PUT'])
+@write_transaction(db.session)
+@login_required
+def replace_timetable(school_id):
+    if not can_manage_school(current_user, school_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    items = request.get_json()
+    if not isinstance(items, list):
+        return jsonify({'error': 'Ожидается список уроков'}), 400
+    
+    # Номер строки в запросе служит идентификатором урока в отчёте о конфликтах
+    lessons, subjects, rows, errors = [], [], [], []
+    for index, item in enumerate(items):
+        try:
+            lesson, subject_id = parse_lesson(item, index)
+        except ValueError as e:
+            errors.append({'lesson': index, 'error': str(e)})
+            continue
+        lessons.append(lesson)
+        subjects.append(subject_id)
+        rows.append({
+            'school_id': school_id, 'subject_id': subject_id, 'class_id': lesson.class_id,
+            'teacher_id': lesson.teacher_id, 'day_of_week': lesson.day, 'room': lesson.room,
+            'start_time': minutes_to_time(lesson.start), 'end_time': minutes_to_time(lesson.end)
+        })
+    if errors:
+        return jsonify({'error': 'Некорректные уроки', 'errors': errors}), 400
+    
+    conflicts = TimetableEngine.validate(lessons)
+    if conflicts:
+        return jsonify({
+            'error': 'Расписание содержит пересечения',
+            'conflicts': [conflict_to_dict(*conflict) for conflict in conflicts]
+        }), 409
+    
+    if not lock_timetable(school_id):
+        return jsonify({'error': 'Школа не найдена'}), 404
+    if lessons:
+        invalid = foreign_resources(school_id, list(zip(lessons, subjects)))
+        if invalid:
+            return foreign_resources_response(invalid)
+    db.session.execute(delete(Schedule).where(Schedule.school_id == school_id))
+    if rows:
+        db.session.execute(insert(Schedule), rows)
+    # Запись в обход ORM: события Schedule не сработают
+    mark_response_changed(db.session, generation_name(school_id))
+    db.session.commit()
+    return jsonify({'message': 'Расписание обновлено', 'lessons': len(rows)})
+
+@route('/api/schools/<int:school_id>/free', methods=['GET'])
+@login_required
+@use_replica
+def get_free_resources(school_id):
+    if not can_view_school(current_user, school_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    kind = request.args.get('kind', 'room')
+    try:
+        day = int(request.args['day_of_week'])
+        start = to_minutes(request.args['start_time'])
+        end = to_minutes(request.args['end_time'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Укажите day_of_week, start_time и end_time (ЧЧ:ММ)'}), 400
+    
+    if kind == 'room':
+        candidates = db.session.scalars(
+            select(Schedule.room).where(Schedule.school_id == school_id, Schedule.room.isnot(None))
+            .distinct().order_by(Schedule.room)
+        ).all()
+    elif kind == 'teacher':
+        candidates = db.session.scalars(
+            select(User.id).where(User.school_id == school_id, User.role == 'teacher').order_by(User.id)
+        ).all()
+    elif kind == 'class':
+        candidates = db.session.scalars(
+            select(Class.id).where(Class.school_id == school_id).order_by(Class.id)
+        ).all()
+    else:
+        return jsonify({'error': 'kind должен быть room, teacher или class'}), 400
+    
+    free = load_timetable(school_id, day).free(kind, candidates, day, start, end)
+    return jsonify({'kind': kind, 'free': free})
+
+# Выгрузка отчётов по оценкам и платежам (CSV/XLSX): строки читаются курсором
+# пачками и сразу пишутся в ответ или, для больших отчётов, в файл в фоне
+export_jobs = ExportJobs()
+
+class ExportRequestError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def parse_export_filters(args):
+    filters = {}
+    for name in ('class_id', 'subject_id'):
+        if args.get(name):
+            filters[name] = args.get(name, type=int)
+            if filters[name] is None:
+                raise ExportRequestError(f'Некорректный {name}')
+    for name in ('date_from', 'date_to'):
+        if args.get(name):
+            try:
+                filters[name] = datetime.strptime(args[name], '%Y-%m-%d').date()
+            except ValueError:
+                raise ExportRequestError(f'{name}: ожидается дата ГГГГ-ММ-ДД')
+    return filters
+
+def report_class(statement, student_id, school_id, filters):
+    """Колонка класса ученика и statement с нужными соединениями.
+    
+    С фильтром class_id - соединение с этим классом (одна строка на ученика
+    класса). Без фильтра ученик может состоять в нескольких классах, поэтому
+    соединение идёт с первым по имени классом школы на ученика - строки не
+    дублируются.
+    """
+    if 'class_id' in filters:
+        statement = (statement
+                     .join(ClassStudent, and_(ClassStudent.student_id == student_id,
+                                              ClassStudent.class_id == filters['class_id']))
+                     .join(Class, Class.id == ClassStudent.class_id)
+                     .where(Class.school_id == school_id))
+        return statement, Class.name.label('class_name')
+    first_class = (select(ClassStudent.student_id, func.min(Class.name).label('name'))
+                   .join(Class, Class.id == ClassStudent.class_id)
+                   .where(Class.school_id == school_id)
+                   .group_by(ClassStudent.student_id)
+                   .subquery())
+    statement = statement.outerjoin(first_class, first_class.c.student_id == student_id)
+    return statement, first_class.c.name.label('class_name')
+
+def grade_report(school_id, filters):
+    header = ['Дата', 'Класс', 'Ученик', 'Предмет', 'Оценка', 'Комментарий']
+    statement = (
+        select(Grade.date, User.username, Subject.name, Grade.grade, Grade.comment)
+        .join(User, User.id == Grade.student_id)
+        .join(Subject, Subject.id == Grade.subject_id)
+        .where(Subject.school_id == school_id)
+    )
+    statement, class_name = report_class(statement, Grade.student_id, school_id, filters)
+    statement = statement.with_only_columns(
+        Grade.date, class_name, User.username, Subject.name, Grade.grade, Grade.comment)
+    if 'subject_id' in filters:
+        statement = statement.where(Grade.subject_id == filters['subject_id'])
+    if 'date_from' in filters:
+        statement = statement.where(Grade.date >= filters['date_from'])
+    if 'date_to' in filters:
+        statement = statement.where(Grade.date <= filters['date_to'])
+    return header, statement.order_by(class_name, User.username, Subject.name, Grade.date, Grade.id)
+
+def payment_report(school_id, filters):
+    header = ['Класс', 'Ученик', 'Год', 'Месяц', 'Срок оплаты', 'Сумма', 'Оплачено', 'Статус']
+    statement = (
+        select(User.username, Payment.year, Payment.month, Payment.due_date,
+               Payment.amount, Payment.paid_amount, Payment.status)
+        .join(User, User.id == Payment.student_id)
+        .where(User.school_id == school_id)
+    )
+    statement, class_name = report_class(statement, Payment.student_id, school_id, filters)
+    statement = statement.with_only_columns(
+        class_name, User.username, Payment.year, Payment.month, Payment.due_date,
+        Payment.amount, Payment.paid_amount, Payment.status)
+    if 'date_from' in filters:
+        statement = statement.where(Payment.due_date >= filters['date_from'])
+    if 'date_to' in filters:
+        statement = statement.where(Payment.due_date <= filters['date_to'])
+    return header, statement.order_by(class_name, User.username, Payment.due_date, Payment.id)
+
+# Отчёт: (построитель запроса, кто может выгружать)
+EXPORT_REPORTS = {
+    'grades': (grade_report, can_view_school),
+    'payments': (payment_report, can_manage_school),
+}
+
+def export_rows(statement):
+    """Строки отчёта курсором пачками по EXPORT_BATCH_SIZE.
+    
+    Отдельное соединение (реплика, если есть) с read_only: транзакция
+    чтения открыта всё время выгрузки и не должна держать блокировку записи
+    SQLite. В PostgreSQL yield_per включает серверный курсор.
+    """
+    engine = db.engines.get(REPLICA_BIND, db.engine)
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    with engine.connect().execution_options(read_only=True, yield_per=batch_size) as connection:
+        for row in connection.execute(statement):
+            yield tuple(row)
+
+def prepare_export(school_id, report):
+    """(header, statement, filename, fmt); ExportRequestError, если выгрузка невозможна."""
+    if report not in EXPORT_REPORTS:
+        raise ExportRequestError(f'Неизвестный отчёт: {report}', 404)
+    build, allowed = EXPORT_REPORTS[report]
+    if not allowed(current_user, school_id):
+        raise ExportRequestError('Недостаточно прав', 403)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise ExportRequestError(f'Неизвестный формат: {fmt}')
+    header, statement = build(school_id, parse_export_filters(request.args))
+    filename = f"{report}-school{school_id}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    return header, statement, filename, fmt
+
+def count_rows(statement, limit=None):
+    """Число строк отчёта; с limit счёт останавливается на limit строках."""
+    return db.session.scalar(select(func.count()).select_from(
+        statement.order_by(None).limit(limit).subquery()))
+
+@route('/api/schools/<int:school_id>/exports/<report>', methods=['GET'])
+@login_required
+def export_report(school_id, report):
+    try:
+        header, statement, filename, fmt = prepare_export(school_id, report)
+    except ExportRequestError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    # Полный COUNT большого отчёта не нужен: достаточно знать, что строк больше лимита
+    max_rows = current_app.config['EXPORT_SYNC_MAX_ROWS']
+    total = count_rows(statement, limit=max_rows + 1)
+    if total > max_rows:
+        return jsonify({'error': 'Отчёт слишком большой для выгрузки в ответе: '
+                                 'запустите фоновую выгрузку (POST)', 'max_rows': max_rows}), 413
+
+    chunks = iter_report(fmt, header, export_rows(statement))
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Export-Rows': str(total),
+    })
+
+@route('/api/schools/<int:school_id>/exports/<report>', methods=['POST'])
+@login_required
+def start_export(school_id, report):
+    try:
+        header, statement, filename, fmt = prepare_export(school_id, report)
+    except ExportRequestError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    owner_id = current_user.id
+    total = count_rows(statement)
+    job = export_jobs.start(owner_id, filename, fmt, header,
+                            lambda: export_rows(statement), total=total)
+    return jsonify({**job, 'status_url': url_for('get_export_status', job_id=job['id'])}), 202
+
+def load_export_job(job_id):
+    job = export_jobs.status(job_id)
+    if job is None or (job['owner_id'] != current_user.id and current_user.role != 'super_admin'):
+        return None
+    return job
+
+@route('/api/exports/<job_id>', methods=['GET'])
+@login_required
+def get_export_status(job_id):
+    job = load_export_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Выгрузка не найдена'}), 404
+    if job['status'] == 'done':
+        job['download_url'] = url_for('download_export', job_id=job_id)
+    return jsonify(job)
+
+@route('/api/exports/<job_id>/download', methods=['GET'])
+@login_required
+def download_export(job_id):
+    job = load_export_job(job_id)
+    path = export_jobs.file_path(job_id) if job else None
+    if path is None:
+        return jsonify({'error': 'Выгрузка не найдена или ещё не готова'}), 404
+    return send_file(path, mimetype=EXPORT_FORMATS[job['format']], as_attachment=True,
+                     download_name=job['filename'])
+
+# Календарь: события школы и уроки расписания, развёрнутые в даты периода
+def load_calendar_lessons(school_id, class_ids, teacher_ids):
+    return db.session.execute(
+        select(Schedule.id, Schedule.day_of_week, Schedule.start_time, Schedule.end_time,
+               Schedule.subject_id, Subject.name.label('subject'), Schedule.class_id,
+               Class.name.label('class_name'), Schedule.teacher_id, Schedule.room)
+        .join(Subject, Subject.id == Schedule.subject_id)
+        .join(Class, Class.id == Schedule.class_id)
+        .where(Schedule.school_id == school_id,
+               Schedule.class_id.in_(class_ids) | Schedule.teacher_id.in_(teacher_ids))
+    ).all()
+
+schedule_calendar = ScheduleCalendar(load_calendar_lessons, generations=response_cache.generations)
+
+@event.listens_for(Schedule, 'after_insert')
+@event.listens_for(Schedule, 'after_update')
+@event.listens_for(Schedule, 'after_delete')
+@event.listens_for(Subject, 'after_update')
+@event.listens_for(Class, 'after_update')
+def schedule_changed(mapper, connection, target):
+    # Названия предметов и классов тоже хранятся в развёрнутых неделях
+    mark_response_changed(inspect(target).session, generation_name(target.school_id))
+
+def load_calendar_events(school_ids, start, end):
+    """События школ, пересекающие [start, end]."""
+    if not school_ids:
+        return []
+    rows = db.session.execute(
+        select(Event.id, Event.school_id, Event.title, Event.start_date, Event.end_date, Event.event_type)
+        .where(Event.school_id.in_(school_ids),
+               Event.start_date < datetime.combine(end + timedelta(days=1), time.min),
+               Event.end_date >= datetime.combine(start, time.min))
+    )
+    return [{
+        'type': 'event',
+        'id': row.id,
+        'school_id': row.school_id,
+        'title': row.title,
+        'event_type': row.event_type,
+        'start': row.start_date.isoformat(),
+        'end': row.end_date.isoformat()
+    } for row in rows]
+
+def calendar_period():
+    return parse_range(request.args.get('from'), request.args.get('to'),
+                       current_app.config['CALENDAR_MAX_DAYS'])
+
+def calendar_response(start, end, events, lessons):
+    items = sorted(events + lessons, key=lambda item: item['start'])
+    return jsonify({'from': start.isoformat(), 'to': end.isoformat(), 'items': items})
+
+@route('/api/calendar', methods=['GET'])
+@login_required
+def get_my_calendar():
+    """Календарь пользователя: уроки его классов (детей - для родителя),
+    уроки учителя и события их школ."""
+    try:
+        start, end = calendar_period()
+    except CalendarError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    user = current_user
+    classes = defaultdict(set)
+    teachers = defaultdict(set)
+    if user.role in ('student', 'parent'):
+        query = select(Class.school_id, Class.id).join(ClassStudent, ClassStudent.class_id == Class.id)
+        if user.role == 'student':
+            query = query.where(ClassStudent.student_id == user.id)
+        else:
+            query = query.join(ParentChild, ParentChild.child_id == ClassStudent.student_id).where(
+                ParentChild.parent_id == user.id)
+        for school_id, class_id in db.session.execute(query):
+            classes[school_id].add(class_id)
+    elif user.role == 'teacher' and user.school_id:
+        teachers[user.school_id].add(user.id)
+    
+    school_ids = set(classes) | set(teachers)
+    if user.school_id:
+        school_ids.add(user.school_id)
+    lessons = []
+    for school_id in sorted(set(classes) | set(teachers)):
+        lessons += schedule_calendar.lessons(school_id, start, end, classes[school_id], teachers[school_id])
+    return calendar_response(start, end, load_calendar_events(school_ids, start, end), lessons)
+
+@route('/api/schools/<int:school_id>/calendar', methods=['GET'])
+@login_required
+def get_school_calendar(school_id):
+    """События школы и, если указаны class_id/teacher_id, их уроки."""
+    if not can_view_school(current_user, school_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    try:
+        start, end = calendar_period()
+    except CalendarError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    class_ids = request.args.getlist('class_id', type=int)
+    teacher_ids = request.args.getlist('teacher_id', type=int)
+    lessons = schedule_calendar.lessons(school_id, start, end, class_ids, teacher_ids)
+    return calendar_response(start, end, load_calendar_events([school_id], start, end), lessons)
+
+# Присутствие: кто онлайн и в каких чатах; участие в чатах берётся из кэша,
+# а не запросом к ChatParticipant на каждое событие
+def load_chat_ids(user_id):
+    return db.session.execute(
+        select(ChatParticipant.chat_id).where(ChatParticipant.user_id == user_id)
+    ).scalars().all()
+
+presence = Presence(load_chat_ids=load_chat_ids)
+
+# Кэш участия сбрасывается сразу при flush и ещё раз после commit
+@event.listens_for(ChatParticipant, 'after_insert')
+@event.listens_for(ChatParticipant, 'after_update')
+@event.listens_for(ChatParticipant, 'after_delete')
+def chat_participant_changed(mapper, connection, target):
+    presence.invalidate_memberships(target.user_id)
+    inspect(target).session.info.setdefault('changed_member_ids', set()).add(target.user_id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_memberships(session):
+    for user_id in session.info.pop('changed_member_ids', ()):
+        presence.invalidate_memberships(user_id)
+
+@route('/api/chats/<int:chat_id>/online', methods=['GET'])
+@login_required
+def get_chat_online(chat_id):
+    if not can_read_chat(current_user, chat_id):
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    return jsonify({
+        'chat_id': chat_id,
+        'online': presence.online_in_room(chat_id),
+        'user_ids': sorted(presence.members_online(chat_id))
+    })
+
+@route('/api/schools/<int:school_id>/online', methods=['GET'])
+@login_required
+def get_school_online(school_id):
+    if current_user.role not in ('super_admin', 'project_admin') and current_user.school_id != school_id:
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    return jsonify({'school_id': school_id, 'online': presence.online_in_school(school_id)})
+
+# Полнотекстовый поиск: индексы создаются вместе с таблицами (create_all),
+# для существующей БД - flask reindex-search
+search_index = SearchIndex()
+search_index.register('messages', Message.__table__, ['content'], scope='chat_id')
+search_index.register('events', Event.__table__, ['title', 'description'], scope='school_id',
+                      weights=[4.0, 1.0])
+search_index.register('subjects', Subject.__table__, ['name', 'description'], scope='school_id',
+                      weights=[4.0, 1.0])
+search_index.install(db.metadata)
+
+def visible_school_ids(user):
+    """Школы, события и предметы которых видит пользователь (None - все)."""
+    if user.role in ('super_admin', 'project_admin'):
+        return None
+    school_ids = {user.school_id} if user.school_id else set()
+    if user.role == 'parent':
+        school_ids.update(db.session.execute(
+            select(User.school_id).join(ParentChild, ParentChild.child_id == User.id)
+            .where(ParentChild.parent_id == user.id, User.school_id.isnot(None))
+        ).scalars())
+    return school_ids
+
+def search_result_to_dict(kind, row):
+    if kind == 'messages':
+        result = message_to_dict(row)
+    elif kind == 'events':
+        result = {
+            'id': row.id,
+            'school_id': row.school_id,
+            'title': row.title,
+            'description': row.description,
+            'start_date': row.start_date.isoformat(),
+            'end_date': row.end_date.isoformat(),
+            'event_type': row.event_type
+        }
+    else:
+        result = {'id': row.id, 'school_id': row.school_id, 'name': row.name,
+                  'description': row.description}
+    result['score'] = row.score
+    return result
+
+@route('/api/search', methods=['GET'])
+@login_required
+@use_replica
+def get_search_results():
+    kinds = request.args.get('type', 'messages,events,subjects').split(',')
+    chat_id = request.args.get('chat_id', type=int)
+    school_id = request.args.get('school_id', type=int)
+    try:
+        if not set(kinds) <= set(search_index.documents):
+            raise ValueError('Неизвестный тип: ' + request.args['type'])
+        limit = parse_page_size(request.args.get('limit'), default=20, maximum=50)
+        offset = min(max(request.args.get('offset', 0, type=int), 0), 1000)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Область видимости: чаты пользователя и школы, к которым он относится
+    if chat_id is not None:
+        if not can_read_chat(current_user, chat_id):
+            return jsonify({'error': 'Недостаточно прав'}), 403
+        chat_scope = [chat_id]
+    else:
+        chat_scope = None if current_user.role == 'super_admin' else presence.chat_ids(current_user.id)
+    school_scope = visible_school_ids(current_user)
+    if school_id is not None:
+        if school_scope is not None and school_id not in school_scope:
+            return jsonify({'error': 'Недостаточно прав'}), 403
+        school_scope = [school_id]
+    
+    response = {'query': request.args.get('q', '')}
+    try:
+        for kind in kinds:
+            rows = search_index.search(db.session, kind, request.args.get('q'),
+                                       scope=chat_scope if kind == 'messages' else school_scope,
+                                       limit=limit, offset=offset)
+            response[kind] = [search_result_to_dict(kind, row) for row in rows]
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(response)
+
+@cli.command('reindex-search')
+@click.option('--type', 'kinds', multiple=True, type=click.Choice(['messages', 'events', 'subjects']),
+              help='Что перестроить (по умолчанию всё)')
+def reindex_search_command(kinds):
+    """Создать индексы поиска, если их нет, и перестроить их из таблиц."""
+    started = datetime.utcnow()
+    with db.engine.begin() as connection:
+        counts = search_index.rebuild(connection, list(kinds) or None)
+    seconds = round((datetime.utcnow() - started).total_seconds(), 3)
+    click.echo('Индексы поиска перестроены за %s с: %s' % (
+        seconds, ', '.join(f'{name} - {count}' for name, count in counts.items())))
+
 # Socket.IO события для чата
+@socketio.on('connect')
+def on_connect():
+    # Анонимные подключения не учитываются и не могут войти в чаты
+    if current_user.is_authenticated:
+        presence.connect(request.sid, current_user.id, current_user.school_id)
+
+@socketio.on('disconnect')
+def on_disconnect():
+    presence.disconnect(request.sid)
+
+@socketio.on('heartbeat')
+def on_heartbeat():
+    if presence.heartbeat(request.sid) or not current_user.is_authenticated:
+        return
+    # Подключение удалено sweep (долго не было heartbeat): регистрируем заново
+    presence.connect(request.sid, current_user.id, current_user.school_id)
+    for room in rooms():
+        if room != request.sid:
+            presence.join(request.sid, room)
+
 @socketio.on('join')
+@instrumentation.event('join')
 def on_join(data):
-    room = data['room']
+    room = str(data['room'])
+    try:
+        chat_id = int(room)
+    except ValueError:
+        chat_id = None
+    if chat_id is None or not current_user.is_authenticated or not (
+            current_user.role == 'super_admin' or presence.can_join(current_user.id, chat_id)):
+        emit('error', {'msg': 'Нет доступа к чату'})
+        return
+    
     join_room(room)
-    emit('status', {'msg': f'Пользователь присоединился к чату {room}'}, room=room)
+    presence.join(request.sid, room)
+    emit('status', {'msg': f'Пользователь присоединился к чату {room}',
+                    'online': presence.online_in_room(room)}, room=room)
 
 @socketio.on('leave')
+@instrumentation.event('leave')
 def on_leave(data):
-    room = data['room']
+    room = str(data['room'])
     leave_room(room)
-    emit('status', {'msg': f'Пользователь покинул чат {room}'}, room=room)
+    if presence.leave(request.sid, room):
+        emit('status', {'msg': f'Пользователь покинул чат {room}',
+                        'online': presence.online_in_room(room)}, room=room)
 
 @socketio.on('message')
+@instrumentation.event('message')
 def on_message(data):
-    room = data['room']
-    emit('message', data, room=room)
+    """Сообщение в чат; ответ (ack) - id строки в БД и время сервера или ошибка."""
+    def reject(msg):
+        emit('error', {'msg': msg})
+        return {'error': msg}
+    
+    if not current_user.is_authenticated:
+        return reject('Нет доступа к чату')
+    try:
+        message = message_pipeline.prepare(data, current_user.id)
+    except MessageError as e:
+        return reject(str(e))
+    # Писать можно только в чат, в который подключение вошло через join (с проверкой прав)
+    room = str(message['chat_id'])
+    if room not in rooms():
+        return reject('Нет доступа к чату')
+    
+    if current_app.config['CHAT_PERSIST_MESSAGES']:
+        try:
+            ticket = message_writer.put({
+                'chat_id': message['chat_id'],
+                'sender_id': message['sender_id'],
+                'receiver_id': message['receiver_id'],
+                'content': message['content'],
+                'timestamp': datetime.fromisoformat(message['timestamp'])
+            })
+        except QueueFullError:
+            return reject('Сервер перегружен, сообщение не отправлено. Повторите попытку.')
+        # Рассылка и подтверждение - только после записи в БД и с её id:
+        # клиент сверяет живые сообщения с историей и может их закрепить
+        try:
+            message['id'] = ticket.wait(current_app.config['CHAT_WRITE_ACK_TIMEOUT'])
+        except WriteError as e:
+            return reject(f'{e}. Повторите попытку.')
+    
+    message_pipeline.publish(room, message)
+    return {'id': message['id'], 'timestamp': message['timestamp']}
+
+# Схема БД и супер-админ создаются отдельным шагом (flask init-db), а не при старте воркера
+def init_db(username='admin', email='admin@eduverse.com', password='admin123'):
+    db.create_all()
+    if User.query.filter_by(role='super_admin').first():
+        return None
+    super_admin = User(
+        username=username,
+        email=email,
+        password_hash=generate_password_hash(password, current_app.config['PASSWORD_HASH_METHOD']),
+        role='super_admin'
+    )
+    db.session.add(super_admin)
+    db.session.commit()
+    return super_admin
+
+@cli.command('init-db')
+@click.option('--admin-username', default='admin', show_default=True)
+@click.option('--admin-email', default='admin@eduverse.com', show_default=True)
+@click.option('--admin-password', default='admin123', show_default=True)
+def init_db_command(admin_username, admin_email, admin_password):
+    """Создать таблицы и супер-админа, если его ещё нет."""
+    admin = init_db(admin_username, admin_email, admin_password)
+    click.echo('Таблицы созданы' + (f', супер-админ: {admin.username}' if admin else ''))
+
+def create_app(config=None):
+    """Приложение EduVerse: настройки из окружения, поверх них - config."""
+    app = Flask(__name__)
+    load_config(app)
+    if config:
+        app.config.update(config)
+    
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config))
+    if app.config['DATABASE_REPLICA_URL']:
+        app.config.setdefault('SQLALCHEMY_BINDS', {REPLICA_BIND: {
+            'url': app.config['DATABASE_REPLICA_URL'],
+            **engine_options(app.config['DATABASE_REPLICA_URL'], app.config)
+        }})
+    
+    db.init_app(app)
+    configure_engines(app, db)
+    # Flask-Migrate импортирует alembic (~0.1 с) и нужен только командам flask db,
+    # поэтому подключается лишь при запуске через CLI, а не в воркере
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    login_manager.init_app(app)
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+        json=FrameJSON,
+        max_http_buffer_size=app.config['SOCKETIO_MAX_BUFFER_SIZE'],
+        client_manager=create_client_manager(
+            app.config['SOCKETIO_MESSAGE_QUEUE'],
+            channel=app.config['SOCKETIO_CHANNEL']
+        )
+    )
+    cors.init_app(app)
+    # Пул хеширования должен быть того же режима, что и Socket.IO (eventlet.tpool и т.д.)
+    password_hasher.init_app(
+        async_mode=socketio.async_mode,
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_QUEUE'],
+        per_ip=app.config['LOGIN_MAX_PER_IP'],
+        per_username=app.config['LOGIN_MAX_PER_USERNAME']
+    )
+    instrumentation.init_app(app)
+    
+    user_cache.backend = create_cache_backend(
+        app.config['USER_CACHE_URL'],
+        maxsize=app.config['USER_CACHE_SIZE'],
+        ttl=app.config['USER_CACHE_TTL'],
+        prefix='eduverse:user:'
+    )
+    response_cache.generations = create_generations(
+        app.config['RESPONSE_CACHE_URL'] or app.config['USER_CACHE_URL'],
+        local_ttl=app.config['RESPONSE_CACHE_LOCAL_TTL'] or None)
+    response_cache.enabled = app.config['RESPONSE_CACHE_ENABLED']
+    # Фоновые задачи, паузы и события берутся у SocketIO: так presence,
+    # export_jobs, message_pipeline и message_writer работают в том же режиме
+    # async (eventlet/threading), что и обработчики событий.
+    presence.init_app(
+        backend=create_presence_backend(app.config['PRESENCE_URL'] or app.config['USER_CACHE_URL']),
+        memberships=create_cache_backend(
+            app.config['PRESENCE_URL'] or app.config['USER_CACHE_URL'],
+            maxsize=app.config['USER_CACHE_SIZE'],
+            ttl=app.config['CHAT_MEMBERSHIP_TTL'],
+            prefix='eduverse:membership:'
+        ),
+        heartbeat_timeout=app.config['PRESENCE_HEARTBEAT_TIMEOUT'],
+        sweep_interval=app.config['PRESENCE_SWEEP_INTERVAL'],
+        start_background_task=socketio.start_background_task,
+        sleep=socketio.sleep
+    )
+    search_index.init_app(text_config=app.config['SEARCH_TEXT_CONFIG'],
+                          max_candidates=app.config['SEARCH_MAX_CANDIDATES'])
+    admin_stats.generations = response_cache.generations
+    schedule_calendar.init_app(
+        cache=create_cache_backend(
+            app.config['USER_CACHE_URL'],
+            maxsize=app.config['CALENDAR_CACHE_SIZE'],
+            ttl=app.config['CALENDAR_CACHE_TTL'],
+            prefix='eduverse:calendar:'
+        ),
+        generations=response_cache.generations
+    )
+    admin_stats.ttl = app.config['ADMIN_STATS_TTL']
+    export_jobs.init_app(
+        app,
+        directory=app.config['EXPORT_DIR'],
+        ttl=app.config['EXPORT_TTL'],
+        start_background_task=socketio.start_background_task,
+        sleep=socketio.sleep
+    )
+    message_pipeline.init_app(
+        emit=lambda event, frame, room: socketio.emit(event, frame, to=room),
+        max_bytes=app.config['CHAT_MAX_MESSAGE_BYTES'],
+        batch_interval=app.config['CHAT_BATCH_INTERVAL_MS'] / 1000,
+        start_background_task=socketio.start_background_task,
+        sleep=socketio.sleep
+    )
+    message_writer.init_app(
+        app,
+        batch_size=app.config['CHAT_WRITE_BATCH_SIZE'],
+        flush_interval=app.config['CHAT_WRITE_FLUSH_INTERVAL'],
+        max_pending=app.config['CHAT_WRITE_QUEUE_SIZE'],
+        retries=app.config['CHAT_WRITE_RETRIES'],
+        retry_delay=app.config['CHAT_WRITE_RETRY_DELAY'],
+        dead_letter_path=(app.config['CHAT_DEAD_LETTER_PATH']
+                          or os.path.join(app.instance_path, 'chat_dead_letter.jsonl')),
+        start_background_task=socketio.start_background_task,
+        sleep=socketio.sleep,
+        create_event=socketio.server.eio.create_event
+    )
+    
+    for rule, view, options in routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for command in cli.commands.values():
+        app.cli.add_command(command)
+    return app
 
 if __name__ == '__main__':
+    app = create_app()
+    # Для разработки таблицы и супер-админ создаются сразу, в продакшене - flask init-db
     with app.app_context():
-        # Настройка связей между моделями
-        setup_relationships()
-        
-        # Создание таблиц
-        db.create_all()
-        
-        # Создание супер-админа по умолчанию
-        if not User.query.filter_by(role='super_admin').first():
-            super_admin = User(
-                username='admin',
-                email='admin@eduverse.com',
-                password_hash=generate_password_hash('admin123'),
-                role='super_admin'
-            )
-            db.session.add(super_admin)
-            db.session.commit()
-    
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+        init_db()
+    
+    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
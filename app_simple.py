@@ -3,8 +3,13 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from types import SimpleNamespace
 import os
 
+from admin_stats import AdminStats
+from pagination import decode_cursor, encode_cursor, parse_page_size
+from roles import ROLES
+
 # Инициализация Flask приложения
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
@@ -32,6 +37,9 @@ class School(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Итоги дашборда супер-админа: кэш на 30 секунд, сбрасывается при записи
+admin_stats = AdminStats(SimpleNamespace(School=School, User=User), ROLES, ttl=30)
+
 # Инициализация пользователя для Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
@@ -81,6 +89,7 @@ def register():
         )
         db.session.add(user)
         db.session.commit()
+        admin_stats.invalidate()
         
         flash('Регистрация успешна! Теперь вы можете войти.')
         return redirect(url_for('login'))
@@ -110,17 +119,13 @@ def super_admin_dashboard():
         flash('Недостаточно прав')
         return redirect(url_for('dashboard'))
     
-    schools = School.query.all()
-    stats = {
-        'total_schools': len(schools),
-        'total_users': User.query.count(),
-        'active_schools': len([s for s in schools if s.created_at]),
-        'total_revenue': 0
-    }
+    # В таблице только первая страница, остальные подгружаются из /api/admin/schools
+    schools, has_more = admin_stats.school_page(db.session)
     
     return render_template('super_admin_dashboard.html', 
                          schools=schools, 
-                         stats=stats,
+                         stats=admin_stats.get(db.session),
+                         schools_after=encode_cursor(schools[-1].id) if has_more else None,
                          recent_activities=[])
 
 @app.route('/student-dashboard')
@@ -168,9 +173,31 @@ def create_school():
     )
     db.session.add(school)
     db.session.commit()
+    admin_stats.invalidate()
     
     return jsonify({'id': school.id, 'message': 'Школа создана успешно'})
 
+@app.route('/api/admin/schools', methods=['GET'])
+@login_required
+def get_admin_schools():
+    if current_user.role != 'super_admin':
+        return jsonify({'error': 'Недостаточно прав'}), 403
+    
+    after_cursor = request.args.get('after')
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+        after = decode_cursor(after_cursor, 1) if after_cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    schools, has_more = admin_stats.school_page(
+        db.session, after=after, limit=limit, search=request.args.get('q', '').strip() or None)
+    return jsonify({
+        'schools': [school.to_dict() for school in schools],
+        'after': encode_cursor(schools[-1].id) if has_more else None,
+        'has_more': has_more
+    })
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк данных дашборда супер-админа при росте числа школ.
+
+Для каждого размера из --schools создаётся временная SQLite БД (по
+--users-per-school учеников и --payments-per-user платежей на ученика) и
+сравнивается прежний способ (School.query.all() ради len() и отдельный
+подсчёт пользователей) с AdminStats: итоги одним запросом без кэша и из
+кэша, а также первая страница таблицы школ с числом пользователей.
+Выводится медиана по --repeat замерам в мс.
+
+    python benchmarks/bench_admin_dashboard.py --schools 1000 10000 50000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def run(eduverse, url, schools, users_per_school, payments_per_user, repeat):
+    from sqlalchemy import insert
+
+    app = eduverse.create_app({'SQLALCHEMY_DATABASE_URI': url})
+    db, School, User, Payment = eduverse.db, eduverse.School, eduverse.User, eduverse.Payment
+    admin_stats = eduverse.admin_stats
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(School), [{
+            'name': f'Школа №{i}', 'unique_url': f'school-{i}', 'is_active': i % 10 != 0,
+            'description': f'Школа №{i}: углублённое изучение математики'
+        } for i in range(1, schools + 1)])
+        db.session.execute(insert(User), [{
+            'username': f'student{i}', 'email': f'student{i}@example.com', 'password_hash': '-',
+            'role': 'student', 'school_id': 1 + i % schools
+        } for i in range(schools * users_per_school)])
+        db.session.execute(insert(Payment), [{
+            'student_id': 1 + i % (schools * users_per_school), 'amount': 5000.0, 'paid_amount': 2500.0,
+            'due_date': date(2024, 9, 1), 'status': 'partial', 'month': 9, 'year': 2024
+        } for i in range(schools * users_per_school * payments_per_user)])
+        db.session.commit()
+
+        def old():
+            rows = School.query.all()
+            return {'total_schools': len(rows), 'total_users': User.query.count(),
+                    'active_schools': len([s for s in rows if s.is_active]), 'total_revenue': 0}
+
+        def uncached():
+            admin_stats.invalidate()
+            admin_stats.get(db.session)
+
+        def page():
+            admin_stats.school_page(db.session)
+
+        admin_stats.get(db.session)
+        result = {
+            'old': measure(old, repeat),
+            'stats': measure(uncached, repeat),
+            'cached': measure(lambda: admin_stats.get(db.session), repeat),
+            'page': measure(page, repeat),
+        }
+        db.session.remove()
+        db.engine.dispose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--schools', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--users-per-school', type=int, default=5)
+    parser.add_argument('--payments-per-user', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.path.insert(0, ROOT)
+        import app as eduverse
+
+        print(f"{'школ':>8}{'прежний':>12}{'итоги':>12}{'из кэша':>12}{'страница':>12}   (мс)")
+        for schools in args.schools:
+            url = f'sqlite:///{os.path.join(tmp, f"dashboard_{schools}.db")}'
+            r = run(eduverse, url, schools, args.users_per_school, args.payments_per_user, args.repeat)
+            print(f"{schools:>8}{r['old']:>12.1f}{r['stats']:>12.1f}{r['cached']:>12.3f}{r['page']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
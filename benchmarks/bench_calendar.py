@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Календарь на месяц: развёртывание расписания по дням и кэш недель.
+
+Во временной SQLite БД --schools школ по --classes классов, у каждого класса
+--lessons уроков в неделю, у школы --events событий за несколько лет.
+Календарь ученика и учителя на месяц (GET /api/calendar) запрашивается:
+с холодным кэшем недель (сброс перед каждым запросом), с тёплым кэшем и,
+для сравнения, наивно - расписание класса на каждый день месяца отдельным
+запросом плюс все события школы с фильтром в Python. Выводятся p50/p95 в мс
+и число SQL-запросов на один календарь, а также план запроса событий.
+
+    python benchmarks/bench_calendar.py --schools 50 --requests 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "calendar.db")}'
+
+from sqlalchemy import event, insert, select, text
+
+import app as eduverse
+from school_calendar import week_starts
+
+app = eduverse.create_app()
+MONTH = (date(2024, 9, 1), date(2024, 9, 30))
+
+
+def seed(args, rng):
+    db, m = eduverse.db, eduverse
+    db.drop_all()
+    db.create_all()
+    session = db.session
+
+    def add_all(model, rows):
+        return session.execute(insert(model).returning(model.id), rows).scalars().all()
+
+    students, teachers = [], []
+    for s in range(args.schools):
+        school_id = add_all(m.School, [{'name': f'Школа {s}', 'unique_url': f'school{s}'}])[0]
+        subject_ids = add_all(m.Subject, [{'name': f'Предмет {i}', 'school_id': school_id} for i in range(10)])
+        class_ids = add_all(m.Class, [{'name': f'{s}-{i}', 'school_id': school_id, 'grade_level': 5}
+                                      for i in range(args.classes)])
+        teacher_ids = add_all(m.User, [{'username': f't{s}-{i}', 'email': f't{s}-{i}@example.com',
+                                        'password_hash': '-', 'role': 'teacher', 'school_id': school_id}
+                                       for i in range(args.classes)])
+        student_ids = add_all(m.User, [{'username': f's{s}-{i}', 'email': f's{s}-{i}@example.com',
+                                        'password_hash': '-', 'role': 'student', 'school_id': school_id}
+                                       for i in range(args.classes)])
+        session.execute(insert(m.ClassStudent), [{'class_id': c, 'student_id': st}
+                                                 for c, st in zip(class_ids, student_ids)])
+        # Урок k класса i ведёт учитель (i + k) % classes: без пересечений по учителям
+        per_day = -(-args.lessons // 5)
+        session.execute(insert(m.Schedule), [{
+            'school_id': school_id, 'class_id': class_id, 'subject_id': rng.choice(subject_ids),
+            'teacher_id': teacher_ids[(i + k) % args.classes], 'day_of_week': k // per_day,
+            'start_time': datetime(2000, 1, 1, 8 + k % per_day).time(),
+            'end_time': datetime(2000, 1, 1, 8 + k % per_day, 45).time(), 'room': str(i),
+        } for i, class_id in enumerate(class_ids) for k in range(args.lessons)])
+        first = datetime(2020, 1, 1)
+        session.execute(insert(m.Event), [{
+            'school_id': school_id, 'title': f'Событие {e}',
+            'start_date': (start := first + timedelta(hours=rng.randrange(5 * 365 * 24))),
+            'end_date': start + timedelta(hours=rng.choice([1, 2, 24, 72])), 'event_type': 'event',
+        } for e in range(args.events)])
+        students += student_ids
+        teachers += teacher_ids
+    session.commit()
+    return students, teachers
+
+
+def naive_calendar(user_id):
+    """Без развёртывания по неделям: запрос расписания на каждый день периода."""
+    m, session = eduverse, eduverse.db.session
+    user = session.get(m.User, user_id)
+    class_ids = session.execute(select(m.ClassStudent.class_id)
+                                .where(m.ClassStudent.student_id == user_id)).scalars().all()
+    items = []
+    day = MONTH[0]
+    while day <= MONTH[1]:
+        for lesson in session.execute(select(m.Schedule).where(
+                m.Schedule.class_id.in_(class_ids) | (m.Schedule.teacher_id == user_id),
+                m.Schedule.day_of_week == day.weekday())).scalars():
+            items.append((datetime.combine(day, lesson.start_time), lesson.id))
+        day += timedelta(days=1)
+    window = (datetime.combine(MONTH[0], datetime.min.time()),
+              datetime.combine(MONTH[1] + timedelta(days=1), datetime.min.time()))
+    for e in session.execute(select(m.Event).where(m.Event.school_id == user.school_id)).scalars():
+        if e.start_date < window[1] and e.end_date >= window[0]:
+            items.append((e.start_date, e.id))
+    session.rollback()
+    return sorted(items)
+
+
+class Counter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith(('BEGIN', 'COMMIT', 'ROLLBACK')):
+            self.count += 1
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered) * 1000, ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--schools', type=int, default=50)
+    parser.add_argument('--classes', type=int, default=30)
+    parser.add_argument('--lessons', type=int, default=30, help='уроков класса в неделю')
+    parser.add_argument('--events', type=int, default=2000, help='событий школы')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with app.app_context():
+        students, teachers = seed(args, rng)
+        engine = eduverse.db.engine
+        plan = eduverse.db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT id FROM event WHERE school_id IN (1, 2) '
+            'AND start_date < :end AND end_date >= :start'), {'start': '2024-09-01', 'end': '2024-10-01'}).all()
+        eduverse.db.session.rollback()
+    counter = Counter(engine)
+    users = [rng.choice(students if i % 2 else teachers) for i in range(args.requests)]
+    clients = {}
+
+    def client(user_id):
+        if user_id not in clients:
+            clients[user_id] = app.test_client()
+            with clients[user_id].session_transaction() as flask_session:
+                flask_session['_user_id'] = str(user_id)
+                flask_session['_fresh'] = True
+            clients[user_id].get('/api/calendar?from=2000-01-03&to=2000-01-03')  # прогрев user_loader
+        return clients[user_id]
+
+    url = f'/api/calendar?from={MONTH[0]}&to={MONTH[1]}'
+    for user_id in set(users):
+        client(user_id)
+
+    def measure(label, call, before=None):
+        samples, statements = [], 0
+        for user_id in users:
+            if before:
+                before()
+            counter.count = 0
+            started = time.perf_counter()
+            call(user_id)
+            samples.append(time.perf_counter() - started)
+            statements += counter.count
+        return (label, *percentiles(samples), statements / len(users))
+
+    def via_api(user_id):
+        response = client(user_id).get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'HTTP {response.status_code}: {response.get_data(as_text=True)}')
+
+    def naive(user_id):
+        with app.app_context():
+            naive_calendar(user_id)
+
+    rows = [
+        measure('по дням (наивно)', naive),
+        measure('кэш недель холодный', via_api, before=eduverse.schedule_calendar.cache.clear),
+    ]
+    for user_id in set(users):
+        via_api(user_id)
+    rows.append(measure('кэш недель тёплый', via_api))
+    weeks = len(list(week_starts(*MONTH)))
+    print(f'школ: {args.schools}, уроков в расписании: {args.schools * args.classes * args.lessons}, '
+          f'событий: {args.schools * args.events}, недель в периоде: {weeks}')
+    print('план запроса событий:', '; '.join(row.detail for row in plan))
+    print(f"{'способ':<24}{'p50, мс':>10}{'p95, мс':>10}{'SQL':>8}")
+    for label, p50, p95, statements in rows:
+        print(f'{label:<24}{p50:>10.2f}{p95:>10.2f}{statements:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Рассылка сообщений чата в комнату из --members подписчиков.
+
+socketio.Server (threading) с одной комнатой; вместо сетевых клиентов
+перехватывается eio.send и считаются кадры и байты. --messages сообщений
+рассылаются тремя способами:
+
+    как было    - словарь клиента (ISO-время, room строкой) через emit:
+                  пакет кодируется заново для каждого получателя
+    Frame       - сообщение MessagePipeline, JSON один раз на комнату
+    пакетами    - пакетный режим: всплески по --burst сообщений уходят
+                  одним событием 'messages'
+
+Выводятся процессорное время на одну доставку (сообщение x получатель),
+кадров в секунду и байт UTF-8 на доставку.
+
+    python benchmarks/bench_chat_pipeline.py --members 1000 --messages 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio
+
+from chat_pipeline import FrameJSON, MessagePipeline
+
+ROOM = '42'
+TEXT = 'Домашнее задание на завтра: параграф 12, упражнения 3-7, повторить правила'
+
+
+def create_server(members, json_module):
+    server = socketio.Server(async_mode='threading', json=json_module)
+    # Server(json=None) не сбрасывает модуль пакетов, выставляем явно
+    socketio.packet.Packet.json = json_module
+    sent = {'frames': 0, 'last': ''}
+
+    def send(eio_sid, packet):
+        sent['frames'] += 1
+        sent['last'] = packet
+
+    server.eio.send = send
+    server.manager_initialized = True
+    server.manager.initialize()
+    for n in range(members):
+        sid = server.manager.connect(f'client-{n}', '/')
+        server.manager.enter_room(sid, '/', ROOM)
+    return server, sent
+
+
+def run(label, members, messages, json_module, deliver):
+    server, sent = create_server(members, json_module)
+    wall, cpu = time.perf_counter(), time.process_time()
+    deliver(server)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    deliveries = members * messages
+    # Кадры одного способа почти одинаковы: размер - по последнему
+    size = sent['frames'] * len(sent['last'].encode('utf-8')) / deliveries
+    return (label, cpu / deliveries * 1e6, sent['frames'] / wall, size, sent['frames'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--members', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--burst', type=int, default=10, help='сообщений во всплеске (пакетный режим)')
+    args = parser.parse_args()
+
+    def legacy(server):
+        for n in range(args.messages):
+            server.emit('message', {'room': ROOM, 'content': f'{TEXT} {n}',
+                                    'timestamp': datetime.utcnow().isoformat() + 'Z'}, room=ROOM)
+
+    def pipeline(batch_interval):
+        def deliver(server):
+            chat = MessagePipeline(emit=lambda event, frame, room: server.emit(event, frame, room=room),
+                                   batch_interval=batch_interval,
+                                   start_background_task=lambda target: None)
+            for n in range(args.messages):
+                message = chat.prepare({'room': ROOM, 'content': f'{TEXT} {n}'}, sender_id=7)
+                chat.publish(ROOM, message)
+                # Окно пакета истекает после каждого всплеска
+                if batch_interval and (n + 1) % args.burst == 0:
+                    chat.flush()
+            chat.flush()
+        return deliver
+
+    rows = [
+        run('как было', args.members, args.messages, json, legacy),
+        run('Frame', args.members, args.messages, FrameJSON, pipeline(0)),
+        run(f'пакетами по {args.burst}', args.members, args.messages, FrameJSON, pipeline(0.01)),
+    ]
+    print(f'подписчиков: {args.members}, сообщений: {args.messages}, '
+          f'доставок: {args.members * args.messages}')
+    print(f"{'способ':<16}{'мкс CPU/доставку':>18}{'кадров/с':>12}{'байт/доставку':>15}{'кадров':>10}")
+    for label, cpu, fps, size, frames in rows:
+        print(f'{label:<16}{cpu:>18.2f}{fps:>12.0f}{size:>15.1f}{frames:>10}')
+
+
+if __name__ == '__main__':
+    main()
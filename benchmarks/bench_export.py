@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Выгрузка отчёта по оценкам: потоком и целиком в памяти.
+
+Во временной SQLite БД класс из --students учеников и оценки по одному
+предмету, всего --rows строк для каждого значения. Отчёт выгружается в CSV
+и XLSX через GET /api/schools/<id>/exports/grades, ответ читается по кускам
+и не сохраняется. Для сравнения тот же отчёт строится как без потоковой
+выгрузки: все строки из БД (.all()), затем весь файл в памяти. Выводятся
+время, строк/с, размер файла и пик памяти Python (tracemalloc): у потоковой
+выгрузки он не должен зависеть от числа строк. tracemalloc замедляет оба
+способа, так что время годится только для сравнения между ними.
+
+    python benchmarks/bench_export.py --rows 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "export.db")}'
+
+from sqlalchemy import insert
+
+import app as eduverse
+from report_export import iter_report
+
+app = eduverse.create_app({'EXPORT_SYNC_MAX_ROWS': 10 ** 9, 'EXPORT_DIR': os.path.join(_tmp.name, 'exports')})
+
+
+def seed(rows, students, batch=50000):
+    db, m = eduverse.db, eduverse
+    db.drop_all()
+    db.create_all()
+    session = db.session
+
+    def add_all(model, values):
+        return session.execute(insert(model).returning(model.id), values).scalars().all()
+
+    school_id = add_all(m.School, [{'name': 'Школа', 'unique_url': 'school'}])[0]
+    subject_id = add_all(m.Subject, [{'name': 'Математика', 'school_id': school_id}])[0]
+    class_id = add_all(m.Class, [{'name': '5А', 'school_id': school_id, 'grade_level': 5}])[0]
+    admin_id = add_all(m.User, [{'username': 'admin', 'email': 'admin@example.com', 'password_hash': '-',
+                                 'role': 'school_admin', 'school_id': school_id}])[0]
+    student_ids = add_all(m.User, [{'username': f'student{i}', 'email': f'student{i}@example.com',
+                                    'password_hash': '-', 'role': 'student', 'school_id': school_id}
+                                   for i in range(students)])
+    session.execute(insert(m.ClassStudent), [{'class_id': class_id, 'student_id': s} for s in student_ids])
+    first_day = date(2020, 1, 1)
+    for start in range(0, rows, batch):
+        session.execute(insert(m.Grade), [{
+            'student_id': student_ids[i % students], 'subject_id': subject_id, 'grade': 1 + i % 10,
+            'date': first_day + timedelta(days=i // students), 'comment': 'Работа на уроке',
+        } for i in range(start, min(rows, start + batch))])
+    session.commit()
+    return school_id, admin_id
+
+
+def measure(produce):
+    """(секунды, байт, пик памяти в байтах) для produce() -> итератор кусков."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    for chunk in produce():
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def run(rows, students):
+    with app.app_context():
+        school_id, admin_id = seed(rows, students)
+
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['_user_id'] = str(admin_id)
+        flask_session['_fresh'] = True
+
+    def streamed(fmt):
+        def produce():
+            response = client.get(f'/api/schools/{school_id}/exports/grades?format={fmt}', buffered=False)
+            if response.status_code != 200:
+                raise RuntimeError(f'HTTP {response.status_code}: {response.get_data(as_text=True)}')
+            try:
+                yield from response.response
+            finally:
+                response.close()
+        return produce
+
+    def in_memory(fmt):
+        def produce():
+            with app.app_context():
+                header, statement = eduverse.grade_report(school_id, {})
+                result = eduverse.db.session.execute(statement).all()
+                data = b''.join(iter_report(fmt, header, result))
+                eduverse.db.session.rollback()
+            yield data
+        return produce
+
+    results = []
+    for fmt in ('csv', 'xlsx'):
+        for label, produce in (('поток', streamed(fmt)), ('в памяти', in_memory(fmt))):
+            results.append((fmt, label, *measure(produce)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--students', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'строк':>9}  {'формат':<7}{'способ':<10}{'с':>8}{'строк/с':>10}{'файл, МБ':>10}{'пик, МБ':>10}")
+    for rows in args.rows:
+        for fmt, label, elapsed, size, peak in run(rows, args.students):
+            print(f'{rows:>9}  {fmt:<7}{label:<10}{elapsed:>8.2f}{rows / elapsed:>10.0f}'
+                  f'{size / 2 ** 20:>10.1f}{peak / 2 ** 20:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест рассылки Socket.IO: N комнат x M подписчиков на K воркерах.
+
+Каждый воркер - отдельный процесс со своим socketio.Server и менеджером
+клиентов из SOCKETIO_MESSAGE_QUEUE. Подписчики комнаты распределены по
+воркерам поровну; вместо сетевых клиентов отправка engine.io
+перехватывается и фиксируется время доставки. Издатель в главном процессе
+публикует события в комнаты через менеджер write_only, замеряется задержка
+от публикации до отправки клиенту (часы CLOCK_MONOTONIC общие для машины).
+
+    python benchmarks/bench_fanout.py --url udp://127.0.0.1:47000-47003 --workers 4
+    python benchmarks/bench_fanout.py --url redis://localhost:6379/0 --workers 4
+    python benchmarks/bench_fanout.py --url memory:// --workers 4   # потоки в одном процессе
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio
+
+from socketio_backends import create_client_manager
+
+CHANNEL = 'eduverse-bench'
+
+
+def worker(url, index, workers, rooms, subscribers, ready, stop, results):
+    server = socketio.Server(
+        async_mode='threading',
+        client_manager=create_client_manager(url, channel=CHANNEL)
+    )
+    deliveries = []
+    server.eio.send = lambda eio_sid, packet: deliveries.append((time.monotonic(), packet))
+    server.manager_initialized = True
+    server.manager.initialize()
+
+    local = subscribers // workers + (1 if index < subscribers % workers else 0)
+    for room in range(rooms):
+        for n in range(local):
+            sid = server.manager.connect(f'w{index}-r{room}-{n}', '/')
+            server.manager.enter_room(sid, '/', f'room-{room}')
+
+    ready.set()
+    stop.wait()
+
+    latencies = []
+    for received_at, packet in list(deliveries):
+        event, payload = json.loads(packet[1:])
+        latencies.append(received_at - payload['t'])
+    results.put(latencies)
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='udp://127.0.0.1:47000-47003')
+    parser.add_argument('--workers', '-k', type=int, default=4)
+    parser.add_argument('--rooms', '-n', type=int, default=50)
+    parser.add_argument('--subscribers', '-m', type=int, default=40,
+                        help='подписчиков в каждой комнате (на все воркеры)')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.01,
+                        help='пауза между раундами публикаций, сек')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    args = parser.parse_args()
+
+    in_process = args.url.startswith('memory:')
+    if in_process:
+        Event, Queue, Runner = threading.Event, queue.Queue, threading.Thread
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        Event, Queue, Runner = ctx.Event, ctx.Queue, ctx.Process
+
+    stop = Event()
+    results = Queue()
+    ready_events = []
+    runners = []
+    for index in range(args.workers):
+        ready = Event()
+        runner = Runner(target=worker, args=(args.url, index, args.workers, args.rooms,
+                                             args.subscribers, ready, stop, results),
+                        daemon=True)
+        runner.start()
+        ready_events.append(ready)
+        runners.append(runner)
+    for ready in ready_events:
+        ready.wait(args.timeout)
+
+    publisher = create_client_manager(args.url, channel=CHANNEL, write_only=True)
+    expected = args.rooms * args.subscribers * args.rounds
+
+    started = time.monotonic()
+    for _ in range(args.rounds):
+        for room in range(args.rooms):
+            publisher.emit('fanout', {'t': time.monotonic(), 'room': room},
+                           namespace='/', room=f'room-{room}')
+        time.sleep(args.interval)
+    published = time.monotonic() - started
+
+    # Даём воркерам дослать хвост
+    time.sleep(min(1.0, args.timeout))
+    stop.set()
+
+    latencies = []
+    for _ in runners:
+        latencies.extend(results.get(timeout=args.timeout))
+    for runner in runners:
+        runner.join(args.timeout)
+
+    latencies.sort()
+    print(f'бэкенд: {args.url}  воркеров: {args.workers}  комнат: {args.rooms}  '
+          f'подписчиков в комнате: {args.subscribers}  раундов: {args.rounds}')
+    print(f'доставлено: {len(latencies)} из {expected}')
+    if latencies:
+        print(f'p50: {percentile(latencies, 50) * 1000:.2f} мс  '
+              f'p99: {percentile(latencies, 99) * 1000:.2f} мс  '
+              f'max: {latencies[-1] * 1000:.2f} мс')
+        print(f'доставок/сек за время публикации: {len(latencies) / published:.0f}')
+
+
+if __name__ == '__main__':
+    main()
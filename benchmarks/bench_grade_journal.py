@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Журнал оценок класса: построчная запись и пакетный API.
+
+Во временной SQLite БД класс из --students учеников с предметом. Для
+каждого числа дат из --dates журнал (ученики x даты) записывается:
+построчно через ORM (commit на каждую оценку, как было бы без пакетного
+API) и одним POST /api/subjects/<id>/grades - сначала новые оценки, затем
+повторно с изменённой частью и без изменений. Выводятся время и число SQL
+запросов; агрегаты оценок после пакетной записи сверяются с полным
+пересчётом (flask rebuild-grade-stats).
+
+    python benchmarks/bench_grade_journal.py --students 40 --dates 1 5 20
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "grade_journal.db")}'
+
+from sqlalchemy import event, insert, select
+
+import app as eduverse
+
+app = eduverse.create_app()
+
+
+def seed(students):
+    db, m = eduverse.db, eduverse
+    db.drop_all()
+    db.create_all()
+    session = db.session
+
+    def add_all(model, rows):
+        return session.execute(insert(model).returning(model.id), rows).scalars().all()
+
+    school_id = add_all(m.School, [{'name': 'Школа', 'unique_url': 'school'}])[0]
+    subject_id = add_all(m.Subject, [{'name': 'Математика', 'school_id': school_id}])[0]
+    class_id = add_all(m.Class, [{'name': '5А', 'school_id': school_id, 'grade_level': 5}])[0]
+    teacher_id = add_all(m.User, [{'username': 'teacher', 'email': 'teacher@example.com',
+                                   'password_hash': '-', 'role': 'teacher', 'school_id': school_id}])[0]
+    student_ids = add_all(m.User, [{'username': f'student{i}', 'email': f'student{i}@example.com',
+                                    'password_hash': '-', 'role': 'student', 'school_id': school_id}
+                                   for i in range(students)])
+    session.execute(insert(m.TeacherSubject), [{'teacher_id': teacher_id, 'subject_id': subject_id}])
+    session.execute(insert(m.ClassStudent), [{'class_id': class_id, 'student_id': s} for s in student_ids])
+    session.commit()
+    return teacher_id, subject_id, class_id, student_ids
+
+
+class Counter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith(('BEGIN', 'COMMIT', 'ROLLBACK')):
+            self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+
+
+def stats_snapshot():
+    m = eduverse
+    columns = ['count', 'total', 'total_sq'] + [f'h{g}' for g in m.GRADE_SCALE]
+    return (
+        sorted(m.db.session.execute(select(m.GradeStat.student_id, m.GradeStat.subject_id,
+                                           *[getattr(m.GradeStat, c) for c in columns])).all()),
+        sorted(m.db.session.execute(select(m.ClassGradeStat.class_id, m.ClassGradeStat.subject_id,
+                                           *[getattr(m.ClassGradeStat, c) for c in columns])).all()),
+    )
+
+
+def run(students, dates_count):
+    with app.app_context():
+        teacher_id, subject_id, class_id, student_ids = seed(students)
+        engine = eduverse.db.engine
+    dates = [date(2024, 9, 2) + timedelta(days=d) for d in range(dates_count)]
+
+    def matrix(shift):
+        return [[1 + (s + d + shift) % 10 for d in range(dates_count)] for s in range(students)]
+
+    # Построчно: оценка за оценкой, commit на каждую
+    with app.app_context(), Counter(engine) as counter:
+        started = time.perf_counter()
+        for student_id, grades in zip(student_ids, matrix(0)):
+            for day, grade in zip(dates, grades):
+                eduverse.db.session.add(eduverse.Grade(student_id=student_id, subject_id=subject_id,
+                                                       grade=grade, date=day))
+                eduverse.db.session.commit()
+        rows = [('построчно (ORM)', time.perf_counter() - started, counter.count, students * dates_count)]
+        eduverse.db.session.execute(eduverse.Grade.__table__.delete())
+        eduverse.rebuild_grade_stats()
+
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['_user_id'] = str(teacher_id)
+        flask_session['_fresh'] = True
+    client.get(f'/api/grade-stats/classes/{class_id}')  # прогрев user_loader
+
+    def submit(label, grades):
+        body = {'class_id': class_id, 'dates': [d.isoformat() for d in dates],
+                'rows': [{'student_id': s, 'grades': g} for s, g in zip(student_ids, grades)]}
+        with Counter(engine) as counter:
+            started = time.perf_counter()
+            response = client.post(f'/api/subjects/{subject_id}/grades', json=body)
+            elapsed = time.perf_counter() - started
+        report = response.get_json()
+        if response.status_code != 200 or report['errors']:
+            raise RuntimeError(f'{label}: HTTP {response.status_code} {report}')
+        rows.append((label, elapsed, counter.count, report['inserted'] + report['updated']))
+
+    half_changed = [g[:len(g) // 2] + [1 + v % 10 for v in g[len(g) // 2:]] for g in matrix(0)]
+    submit('API: новые', matrix(0))
+    submit('API: изменения', half_changed)
+    submit('API: без изменений', half_changed)
+
+    with app.app_context():
+        incremental = stats_snapshot()
+        eduverse.rebuild_grade_stats()
+        consistent = incremental == stats_snapshot()
+    return rows, consistent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--dates', type=int, nargs='+', default=[1, 5, 20])
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'ячеек':>7}  {'способ':<22}{'мс':>10}{'SQL':>8}{'записано':>10}")
+    for dates_count in args.dates:
+        rows, consistent = run(args.students, dates_count)
+        failed |= not consistent
+        for label, elapsed, statements, written in rows:
+            print(f'{args.students * dates_count:>7}  {label:<22}{elapsed * 1000:>10.1f}{statements:>8}{written:>10}')
+        print(f"{'':>7}  агрегаты = пересчёт: {'да' if consistent else 'НЕТ'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Задержка чата во время волны входов (как в 8:00 перед первым уроком).
+
+Сервер (eventlet, как gunicorn -k eventlet) запускается в отдельном
+процессе на временном SQLite с --users пользователями. Клиент чата по
+WebSocket (вошедший участник чата) раз в --interval секунд отправляет
+сообщение в комнату чата и ждёт его возврата; одновременно --clients потоков выполняют --logins
+POST /login. Сравниваются хеширование прямо в обработчике
+(PASSWORD_HASH_WORKERS=0) и в пуле потоков. Выводятся задержки чата до и
+во время волны, входы/сек и HTTP-статусы.
+
+    python benchmarks/bench_login_storm.py --logins 200 --clients 20
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'storm-password'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(db_path, port, workers, users, ready):
+    import eventlet
+    eventlet.monkey_patch()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, ROOT)
+
+    import logging
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+
+    import app as eduverse
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = eduverse.create_app({
+        'SOCKETIO_ASYNC_MODE': 'eventlet',
+        'PASSWORD_HASH_WORKERS': workers,
+        # Все клиенты бенчмарка приходят с 127.0.0.1
+        'LOGIN_MAX_PER_IP': 0,
+        'PASSWORD_HASH_QUEUE': 10000,
+        'CHAT_PERSIST_MESSAGES': False,
+    })
+    with app.app_context():
+        eduverse.db.create_all()
+        if not eduverse.User.query.first():
+            # Один хеш на всех: иначе подготовка заняла бы минуты
+            password_hash = generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+            eduverse.db.session.execute(insert(eduverse.User), [{
+                'username': f'student{i}', 'email': f'student{i}@example.com',
+                'password_hash': password_hash, 'role': 'student'
+            } for i in range(users)])
+            eduverse.db.session.add(eduverse.Chat(id=1, name='probe', chat_type='group'))
+            eduverse.db.session.add(eduverse.ChatParticipant(chat_id=1, user_id=1))
+            eduverse.db.session.commit()
+
+    listener = eventlet.listen(('127.0.0.1', port))
+    ready.set()
+    eventlet.wsgi.server(listener, app, log_output=False)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ChatProbe(threading.Thread):
+    """Клиент Socket.IO поверх WebSocket: сообщение в комнату и ожидание эха."""
+
+    def __init__(self, port, interval):
+        super().__init__(daemon=True)
+        import simple_websocket
+
+        # В чат пускают только участников: входим как student0
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn.request('POST', '/login', urlencode({'username': 'student0', 'password': PASSWORD}),
+                     {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = conn.getresponse()
+        cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+        conn.close()
+
+        self.ws = simple_websocket.Client.connect(
+            f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket', headers={'Cookie': cookie})
+        self.ws.receive(timeout=5)                      # открытие engine.io
+        self.ws.send('40')
+        self.ws.receive(timeout=5)                      # подключение к namespace
+        self.ws.send('42' + json.dumps(['join', {'room': '1'}]))
+        self.interval = interval
+        self.samples = []
+        self.running = True
+
+    def round_trip(self, seq):
+        self.ws.send('42' + json.dumps(['message', {'room': '1', 'content': str(seq)}]))
+        while True:
+            packet = self.ws.receive(timeout=30)
+            if packet == '2':
+                self.ws.send('3')
+                continue
+            if packet.startswith('42'):
+                event, data = json.loads(packet[2:])
+                if event == 'message' and data.get('content') == str(seq):
+                    return
+
+    def run(self):
+        seq = 0
+        while self.running:
+            seq += 1
+            started = time.perf_counter()
+            self.round_trip(seq)
+            self.samples.append((started, time.perf_counter()))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.ws.close()
+
+
+def storm(port, logins, clients, users):
+    statuses, lock = {}, threading.Lock()
+    counter = iter(range(logins))
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            body = urlencode({'username': f'student{n % users}', 'password': PASSWORD})
+            conn.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+            status = conn.getresponse().status
+            conn.close()
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def run_mode(ctx, db_path, workers, args):
+    port = free_port()
+    ready = ctx.Event()
+    server = ctx.Process(target=serve, args=(db_path, port, workers, args.users, ready), daemon=True)
+    server.start()
+    try:
+        if not ready.wait(60):
+            sys.exit('Сервер не запустился')
+        probe = ChatProbe(port, args.interval)
+        probe.start()
+        time.sleep(args.idle)
+
+        storm_started = time.perf_counter()
+        statuses = storm(port, args.logins, args.clients, args.users)
+        storm_finished = time.perf_counter()
+        probe.stop()
+    finally:
+        server.terminate()
+        server.join()
+
+    # Сообщение "во время волны", если его путь хоть частично пришёлся на неё
+    idle = [end - start for start, end in probe.samples if end < storm_started]
+    during = [end - start for start, end in probe.samples if start < storm_finished and end > storm_started]
+    return {
+        'idle_p50': percentile(idle, 50) * 1000,
+        'p50': percentile(during, 50) * 1000,
+        'p99': percentile(during, 99) * 1000,
+        'max': max(during) * 1000,
+        'logins_per_sec': args.logins / (storm_finished - storm_started),
+        'statuses': statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4, help='потоков пула хеширования')
+    parser.add_argument('--interval', type=float, default=0.02, help='пауза между сообщениями чата, сек')
+    parser.add_argument('--idle', type=float, default=1.0, help='замер задержки чата до волны, сек')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    modes = [('в обработчике', 0), (f'пул ({args.workers})', args.workers)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'login_storm.db')
+        for name, workers in modes:
+            results.append((name, run_mode(ctx, db_path, workers, args)))
+
+    print(f'входов: {args.logins}, одновременно: {args.clients}; задержка чата, мс')
+    print(f"{'хеширование':<16}{'до волны':>10}{'p50':>10}{'p99':>10}{'max':>10}{'входов/с':>10}  статусы")
+    for name, r in results:
+        print(f"{name:<16}{r['idle_p50']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['max']:>10.1f}"
+              f"{r['logins_per_sec']:>10.1f}  {r['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк обработчика сообщений чата с отложенной записью и без неё.
+
+Сообщения отправляются --clients потоками через тестовые клиенты Socket.IO
+в обработчик on_message, который подтверждает сообщение после записи
+пакета; замеряются сообщения/сек и p50/p99 задержки emit до подтверждения.
+База — временный SQLite, рабочая БД не трогается.
+
+    python benchmarks/bench_message_writer.py --messages 20000 --clients 50
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_login import UserMixin
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+import app as eduverse
+from message_writer import MessageWriter
+
+
+class BenchUser(UserMixin):
+    # Супер-админ входит в любой чат без проверки участия (запроса к БД)
+    role = 'super_admin'
+    school_id = None
+
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(app, persist, messages, concurrency, batch_size, flush_interval, engine):
+    session = scoped_session(sessionmaker(bind=engine))
+    writer = MessageWriter(
+        app, SimpleNamespace(session=session), eduverse.Message,
+        batch_size=batch_size, flush_interval=flush_interval,
+        max_pending=max(messages, 10000)
+    )
+    eduverse.message_writer = writer
+    app.config['CHAT_PERSIST_MESSAGES'] = persist
+
+    clients = []
+    for _ in range(concurrency):
+        http_client = app.test_client()
+        with http_client.session_transaction() as flask_session:
+            flask_session['_user_id'] = '1'
+            flask_session['_fresh'] = True
+        client = eduverse.socketio.test_client(app, flask_test_client=http_client)
+        client.emit('join', {'room': '1'})
+        client.get_received()
+        clients.append(client)
+
+    latencies = []
+    errors = []
+
+    def sender(client, count):
+        for i in range(count):
+            t0 = time.perf_counter()
+            ack = client.emit('message', {'room': '1', 'content': f'сообщение {i}'}, callback=True)
+            latencies.append(time.perf_counter() - t0)
+            if 'error' in ack:
+                errors.append(ack['error'])
+            if i % 100 == 0:
+                client.get_received()
+
+    per_client = messages // concurrency
+    threads = [threading.Thread(target=sender, args=(client, per_client)) for client in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.disconnect()
+
+    with engine.connect() as conn:
+        stored = conn.execute(select(func.count()).select_from(eduverse.Message.__table__)).scalar()
+    session.remove()
+
+    return {
+        'mode': 'persist' if persist else 'no-persist',
+        'msg_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'stored': stored,
+        'batches': writer.stats['batches'],
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--flush-interval', type=float, default=0)
+    args = parser.parse_args()
+
+    app = eduverse.create_app({'SOCKETIO_ASYNC_MODE': 'threading'})
+    eduverse.login_manager.user_loader(lambda user_id: BenchUser(int(user_id)))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for persist in (False, True):
+            engine = create_engine(f'sqlite:///{os.path.join(tmp, f"bench_{persist}.db")}')
+            eduverse.Message.__table__.create(engine)
+            results.append(run(app, persist, args.messages, args.clients,
+                               args.batch_size, args.flush_interval, engine))
+            engine.dispose()
+
+    print(f"{'режим':<12}{'msg/s':>12}{'p50, мс':>10}{'p99, мс':>10}{'в БД':>10}{'пакетов':>10}{'ошибок':>10}")
+    for r in results:
+        print(f"{r['mode']:<12}{r['msg_per_sec']:>12.0f}{r['p50_ms']:>10.3f}"
+              f"{r['p99_ms']:>10.3f}{r['stored']:>10}{r['batches']:>10}{r['errors']:>10}")
+
+
+if __name__ == '__main__':
+    main()
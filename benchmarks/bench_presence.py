@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк присутствия: --connections подключений, вход в чаты, счётчики онлайн.
+
+Подключения принадлежат --users пользователям (часть с несколькими
+вкладками) из --schools школ; каждый пользователь участвует в --chats-per-user
+чатах из --chats. Участие хранится во временной SQLite (таблица
+chat_participant). Замеряются connect, join с проверкой участия через кэш
+(холодный и прогретый; для сравнения - запросом к БД на каждый join),
+heartbeat, число онлайн в чате и школе (и для сравнения - перебором всех
+подключений), sweep и disconnect. Выводится время на операцию и память
+индексов.
+
+    python benchmarks/bench_presence.py --connections 50000
+    python benchmarks/bench_presence.py --connections 50000 --url redis://localhost:6379/0
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Index, Integer, MetaData, Table, create_engine, insert, select
+
+from presence import Presence, create_presence_backend
+from user_cache import LocalCacheBackend
+
+
+def timed(label, count, func, results):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    results.append((label, count, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--connections', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=35000)
+    parser.add_argument('--schools', type=int, default=200)
+    parser.add_argument('--chats', type=int, default=5000)
+    parser.add_argument('--chats-per-user', type=int, default=3)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--url', default=None, help='бэкенд присутствия (по умолчанию память процесса)')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    user_chats = {user: rng.sample(range(1, args.chats + 1), args.chats_per_user)
+                  for user in range(1, args.users + 1)}
+    sids = [(f'sid-{n}', 1 + n % args.users) for n in range(args.connections)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "presence.db")}')
+        participants = Table('chat_participant', MetaData(),
+                             Column('chat_id', Integer, primary_key=True),
+                             Column('user_id', Integer, primary_key=True),
+                             Index('ix_chat_participant_user_id', 'user_id'))
+        participants.create(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(participants), [{'chat_id': chat, 'user_id': user}
+                                                for user, chats in user_chats.items() for chat in chats])
+        conn = engine.connect()
+
+        def load_chat_ids(user_id):
+            return conn.execute(select(participants.c.chat_id)
+                                .where(participants.c.user_id == user_id)).scalars().all()
+
+        def build():
+            return Presence(create_presence_backend(args.url), LocalCacheBackend(maxsize=args.users),
+                            load_chat_ids=load_chat_ids)
+
+        def connect_all(presence):
+            for sid, user in sids:
+                presence.connect(sid, user, school_id=1 + user % args.schools)
+
+        def join_all(presence):
+            for sid, user in sids:
+                for chat in user_chats[user]:
+                    if presence.can_join(user, chat):
+                        presence.join(sid, chat)
+
+        # Память меряется отдельным проходом: tracemalloc сильно замедляет код
+        tracemalloc.start()
+        presence = build()
+        connect_all(presence)
+        join_all(presence)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        for sid, _ in sids:
+            presence.disconnect(sid)
+
+        presence = build()
+        results = []
+        joins = args.connections * args.chats_per_user
+        timed('connect', args.connections, lambda: connect_all(presence), results)
+        timed('join (холодный кэш участия)', joins, lambda: join_all(presence), results)
+        timed('join (кэш участия)', joins, lambda: join_all(presence), results)
+
+        sample = sids[:min(len(sids), 20000)]
+
+        def join_with_query():
+            for sid, user in sample:
+                for chat in user_chats[user]:
+                    conn.execute(select(participants.c.chat_id).where(
+                        participants.c.chat_id == chat, participants.c.user_id == user)).first()
+
+        timed('join (запрос к БД)', len(sample) * args.chats_per_user, join_with_query, results)
+        timed('heartbeat', args.connections,
+              lambda: [presence.heartbeat(sid) for sid, _ in sids], results)
+
+        rooms = [rng.randint(1, args.chats) for _ in range(args.lookups)]
+        schools = [rng.randint(1, args.schools) for _ in range(args.lookups)]
+        timed('онлайн в чате', args.lookups,
+              lambda: [presence.online_in_room(room) for room in rooms], results)
+        timed('онлайн в школе', args.lookups,
+              lambda: [presence.online_in_school(school) for school in schools], results)
+
+        def scan():
+            for room in rooms[:100]:
+                len({user for sid, user in sids if room in user_chats[user]})
+
+        timed('онлайн в чате (перебор)', 100, scan, results)
+        timed('sweep (никто не устарел)', 1, presence.sweep, results)
+        counts = presence.counts()
+        timed('disconnect', args.connections,
+              lambda: [presence.disconnect(sid) for sid, _ in sids], results)
+        conn.close()
+        engine.dispose()
+
+    print(f'подключений: {counts["connections"]}, пользователей онлайн: {counts["users"]}, '
+          f'бэкенд: {args.url or "память процесса"}')
+    print(f'память индексов и кэша участия: {memory / 1024 / 1024:.1f} МБ; '
+          f'промахов кэша участия: {presence.stats["membership_misses"]}')
+    print(f"{'операция':<30}{'операций':>10}{'всего, мс':>12}{'мкс/оп':>10}")
+    for label, count, elapsed in results:
+        print(f'{label:<30}{count:>10}{elapsed * 1000:>12.1f}{elapsed / count * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк GET /api/schools с кэшем ответов и без него.
+
+Сервер (werkzeug, по потоку на соединение) запускается в отдельном
+процессе на временном SQLite со --schools школами. Нагрузку дают
+--clients потоков с keep-alive соединениями в течение --seconds секунд.
+Режимы: без кэша, с кэшем (полный ответ, gzip) и с кэшем и If-None-Match
+(ответ 304). Выводятся запросы/сек, p50/p99 задержки и байты на ответ.
+
+    python benchmarks/bench_schools_cache.py --schools 500 --clients 16
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(db_path, port, cached, schools, ready):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['RESPONSE_CACHE_ENABLED'] = 'True' if cached else 'False'
+    sys.path.insert(0, ROOT)
+
+    import logging
+    from sqlalchemy import insert
+    from werkzeug.serving import make_server
+
+    import app as eduverse
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = eduverse.create_app()
+    with app.app_context():
+        eduverse.db.create_all()
+        if not eduverse.School.query.first():
+            eduverse.db.session.execute(insert(eduverse.School), [{
+                'name': f'Школа №{i}', 'unique_url': f'school-{i}',
+                'description': f'Школа №{i}: углублённое изучение математики и информатики'
+            } for i in range(schools)])
+            eduverse.db.session.commit()
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    ready.set()
+    server.serve_forever()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load(port, clients, seconds, conditional):
+    headers = {'Accept-Encoding': 'gzip'}
+    if conditional:
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        conn.request('GET', '/api/schools', headers=headers)
+        response = conn.getresponse()
+        response.read()
+        headers['If-None-Match'] = response.getheader('ETag')
+        conn.close()
+
+    latencies, sizes, statuses = [], [], set()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        local_latencies, local_bytes = [], 0
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            conn.request('GET', '/api/schools', headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            local_latencies.append(time.perf_counter() - t0)
+            local_bytes += len(body)
+            statuses.add(response.status)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            sizes.append(local_bytes)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'bytes': sum(sizes) / max(len(latencies), 1),
+        'statuses': sorted(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--schools', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    modes = [('без кэша', False, False), ('кэш', True, False), ('кэш + ETag', True, True)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_schools.db')
+        for name, cached, conditional in modes:
+            port = free_port()
+            ready = ctx.Event()
+            server = ctx.Process(target=serve, args=(db_path, port, cached, args.schools, ready), daemon=True)
+            server.start()
+            if not ready.wait(60):
+                server.terminate()
+                sys.exit('Сервер не запустился')
+            try:
+                results.append((name, load(port, args.clients, args.seconds, conditional)))
+            finally:
+                server.terminate()
+                server.join()
+
+    print(f"{'режим':<14}{'req/s':>10}{'p50, мс':>10}{'p99, мс':>10}{'байт/ответ':>12}  статусы")
+    for name, r in results:
+        print(f"{name:<14}{r['rps']:>10.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['bytes']:>12.0f}  {r['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска по сообщениям чата на --messages сообщений.
+
+Во временную SQLite БД (FTS5 создаётся вместе с таблицами) пакетами
+вставляются сообщения из --chats чатов; текст - слова синтетического
+словаря с частотами по закону Ципфа, так что есть и очень частые, и редкие
+слова. Индекс поддерживается триггерами, поэтому скорость вставки
+показывает цену инкрементальной индексации. Затем замеряется поиск: редкое
+слово, частое слово, два слова, префикс - в --user-chats чатах
+пользователя и без ограничения (супер-админ); для сравнения - LIKE '%...%'
+по той же таблице. Выводятся p50/p95 в мс и время reindex-search.
+
+    python benchmarks/bench_search.py --messages 2000000
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SYLLABLES = ['ма', 'те', 'ки', 'ро', 'ну', 'ла', 'за', 'пе', 'ст', 'во', 'ри', 'де', 'шко', 'ур', 'ок',
+             'ка', 'ли', 'мо', 'ту', 'ва', 'ге', 'ни', 'ба', 'со']
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda w: rng.random())
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return (statistics.median(ordered) * 1000,
+            ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=2000000)
+    parser.add_argument('--chats', type=int, default=20000)
+    parser.add_argument('--user-chats', type=int, default=30, help='чатов у пользователя')
+    parser.add_argument('--words', type=int, default=50000, help='размер словаря')
+    parser.add_argument('--queries', type=int, default=200, help='запросов каждого вида')
+    parser.add_argument('--like-queries', type=int, default=5, help='запросов LIKE каждого вида')
+    parser.add_argument('--batch', type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    words = vocabulary(args.words, rng)
+    cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, len(words) + 1)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "search.db")}'
+        sys.path.insert(0, ROOT)
+        from sqlalchemy import insert
+
+        import app as eduverse
+
+        app = eduverse.create_app({'CHAT_PERSIST_MESSAGES': False})
+        db, Message, search_index = eduverse.db, eduverse.Message, eduverse.search_index
+        with app.app_context():
+            db.create_all()
+            started_at = datetime(2024, 9, 1)
+            inserted = 0
+            indexing = time.perf_counter()
+            while inserted < args.messages:
+                size = min(args.batch, args.messages - inserted)
+                tokens = rng.choices(words, cum_weights=cum_weights, k=size * 10)
+                db.session.execute(insert(Message), [{
+                    'chat_id': 1 + (inserted + i) % args.chats,
+                    'sender_id': 1,
+                    'content': ' '.join(tokens[i * 10:i * 10 + rng.randint(3, 10)]),
+                    'timestamp': started_at + timedelta(seconds=inserted + i),
+                } for i in range(size)])
+                db.session.commit()
+                inserted += size
+            indexing = time.perf_counter() - indexing
+
+            rare = words[len(words) // 2:]
+            common = words[:20]
+            kinds = {
+                'редкое слово': lambda: rng.choice(rare),
+                'частое слово': lambda: rng.choice(common),
+                'два слова': lambda: f'{rng.choice(common)} {rng.choice(words[:2000])}',
+                'префикс': lambda: rng.choice(words[:5000])[:3],
+            }
+
+            def user_scope():
+                return rng.sample(range(1, args.chats + 1), args.user_chats)
+
+            results = []
+            for label, make_query in kinds.items():
+                for scope_label, make_scope in (('чаты пользователя', user_scope), ('все', lambda: None)):
+                    samples, found = [], 0
+                    for _ in range(args.queries):
+                        query, scope = make_query(), make_scope()
+                        started = time.perf_counter()
+                        found += len(search_index.search(db.session, 'messages', query, scope=scope))
+                        samples.append(time.perf_counter() - started)
+                        db.session.rollback()
+                    results.append((label, scope_label, 'FTS5', *percentiles(samples), found / args.queries))
+
+                for scope_label, make_scope in (('чаты пользователя', user_scope), ('все', lambda: None)):
+                    samples = []
+                    for _ in range(args.like_queries):
+                        scope = make_scope()
+                        query = db.session.query(Message).filter(
+                            *[Message.content.ilike(f'%{token}%') for token in make_query().split()])
+                        if scope is not None:
+                            query = query.filter(Message.chat_id.in_(scope))
+                        started = time.perf_counter()
+                        query.order_by(Message.id.desc()).limit(20).all()
+                        samples.append(time.perf_counter() - started)
+                        db.session.rollback()
+                    results.append((label, scope_label, 'LIKE', *percentiles(samples), None))
+
+            rebuild = time.perf_counter()
+            with db.engine.begin() as connection:
+                search_index.rebuild(connection, ['messages'])
+            rebuild = time.perf_counter() - rebuild
+            db_size = os.path.getsize(os.path.join(tmp, 'search.db'))
+            db.session.remove()
+            db.engine.dispose()
+
+    print(f'сообщений: {args.messages}, чатов: {args.chats}, словарь: {args.words} слов, '
+          f'БД: {db_size / 1024 / 1024:.0f} МБ')
+    print(f'вставка с индексацией триггерами: {args.messages / indexing:.0f} строк/с; '
+          f'reindex-search: {rebuild:.1f} с')
+    print(f"{'запрос':<16}{'область':<20}{'способ':<8}{'p50, мс':>10}{'p95, мс':>10}{'найдено':>10}")
+    for label, scope_label, method, p50, p95, found in results:
+        found = f'{found:.1f}' if found is not None else '-'
+        print(f'{label:<16}{scope_label:<20}{method:<8}{p50:>10.2f}{p95:>10.2f}{found:>10}')
+
+
+if __name__ == '__main__':
+    main()
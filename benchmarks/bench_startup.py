@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта воркера: импорт, create_app() и первый запрос.
+
+Каждый замер - отдельный процесс Python, как при запуске нового
+контейнера. Схема БД создаётся заранее (как `flask init-db`), поэтому в
+замер попадает только то, что воркер делает сам при старте. Выводятся
+медиана и худшее время по --runs запускам.
+
+    python benchmarks/bench_startup.py --runs 10 --path /api/schools
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app as eduverse
+imported = time.perf_counter()
+flask_app = eduverse.create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': finished - created,
+    'total': finished - started,
+    'status': response.status_code,
+}))
+"""
+
+SETUP = """
+import app as eduverse
+with eduverse.create_app().app_context():
+    eduverse.init_db()
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/schools')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=ROOT,
+                   DATABASE_URL=f'sqlite:///{os.path.join(tmp, "startup.db")}')
+        subprocess.run([sys.executable, '-c', SETUP], env=env, cwd=ROOT, check=True)
+
+        samples = []
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, '-c', PROBE, args.path], env=env, cwd=ROOT,
+                                    check=True, capture_output=True, text=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    statuses = sorted({s['status'] for s in samples})
+    print(f"{'этап':<16}{'медиана, мс':>14}{'худшее, мс':>14}")
+    for stage in ('import', 'create_app', 'first_request', 'total'):
+        values = [s[stage] * 1000 for s in samples]
+        print(f"{stage:<16}{statistics.median(values):>14.1f}{max(values):>14.1f}")
+    print(f'HTTP-статусы первого запроса: {statuses}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк движка конфликтов расписания на расписании района.
+
+Генерирует школы с классами, учителями и кабинетами (по умолчанию около
+50 тыс. уроков в неделю), затем замеряет: поурочное добавление с проверкой
+конфликтов, проверку всего расписания одним проходом и запросы свободных
+кабинетов/учителей на слот.
+
+    python benchmarks/bench_timetable.py --schools 100
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timetable import Lesson, TimetableEngine
+
+SLOTS = [(8 * 60 + i * 55, 8 * 60 + i * 55 + 45) for i in range(7)]
+
+
+def generate(schools, classes_per_school, lessons_per_class, seed):
+    # Каждый класс получает уроки в свободные слоты недели; учитель и кабинет
+    # берутся случайно, поэтому часть уроков конфликтует - как при импорте
+    rng = random.Random(seed)
+    lessons = []
+    for school in range(schools):
+        teachers = [f'{school}-t{n}' for n in range(classes_per_school * 2)]
+        rooms = [f'{school}-r{n}' for n in range(classes_per_school + 5)]
+        for class_n in range(classes_per_school):
+            slots = rng.sample([(day, slot) for day in range(5) for slot in SLOTS], lessons_per_class)
+            for day, (start, end) in slots:
+                lessons.append(Lesson(len(lessons), day, start, end, rng.choice(teachers),
+                                      f'{school}-c{class_n}', rng.choice(rooms)))
+    return lessons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--schools', type=int, default=100)
+    parser.add_argument('--classes', type=int, default=20, help='классов в школе')
+    parser.add_argument('--lessons', type=int, default=25, help='уроков класса в неделю')
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    lessons = generate(args.schools, args.classes, args.lessons, args.seed)
+    print(f'уроков: {len(lessons)}')
+
+    started = time.perf_counter()
+    conflicts = TimetableEngine.validate(lessons)
+    elapsed = time.perf_counter() - started
+    print(f'проверка одним проходом: {elapsed * 1000:.1f} мс, конфликтов: {len(conflicts)}')
+
+    engine = TimetableEngine()
+    started = time.perf_counter()
+    rejected = sum(1 for lesson in lessons if engine.add(lesson))
+    elapsed = time.perf_counter() - started
+    print(f'добавление с проверкой: {elapsed * 1000:.1f} мс '
+          f'({elapsed / len(lessons) * 1e6:.2f} мкс на урок), отклонено: {rejected}')
+
+    rng = random.Random(args.seed)
+    rooms = {school: [f'{school}-r{n}' for n in range(args.classes + 5)] for school in range(args.schools)}
+    teachers = {school: [f'{school}-t{n}' for n in range(args.classes * 2)] for school in range(args.schools)}
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        school = rng.randrange(args.schools)
+        day = rng.randrange(5)
+        start, end = rng.choice(SLOTS)
+        engine.free('room', rooms[school], day, start, end)
+        engine.free('teacher', teachers[school], day, start, end)
+    elapsed = time.perf_counter() - started
+    print(f'свободные кабинеты и учителя: {args.queries / elapsed:.0f} запросов/с '
+          f'({len(rooms[0]) + len(teachers[0])} кандидатов в школе)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка записи в SQLite несколькими писателями.
+
+--writers потоков, распределённых по --processes процессам, выполняют по
+--transactions транзакций "прочитать, затем записать" (число сообщений
+чата, затем новое сообщение) через db.session приложения. Сравниваются
+профиль по умолчанию (WAL, synchronous=NORMAL, транзакция с write_lock() -
+BEGIN IMMEDIATE до чтения, busy_timeout) и прежний режим (журнал DELETE,
+отложенный BEGIN).
+Выводятся транзакции/сек и число ошибок "database is locked"; код
+возврата 1, если они есть в настроенном профиле.
+
+    python benchmarks/stress_sqlite_writers.py --writers 32 --processes 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    'настроенный': {},
+    'прежний': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL',
+                'SQLITE_BEGIN_IMMEDIATE': 'False', 'SQLITE_BUSY_TIMEOUT_MS': '5000'},
+}
+
+
+def worker_process(db_path, env, threads, transactions, results):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+
+    from sqlalchemy import func, select
+    from sqlalchemy.exc import OperationalError
+
+    import app as eduverse
+    from db_engine import write_lock
+
+    app = eduverse.create_app()
+    immediate = app.config['SQLITE_BEGIN_IMMEDIATE']
+    counters = {'committed': 0, 'locked': 0, 'other': 0}
+    lock = threading.Lock()
+
+    def writer(index):
+        committed = locked = other = 0
+        with app.app_context():
+            session = eduverse.db.session
+            for i in range(transactions):
+                try:
+                    if immediate:
+                        write_lock(session)
+                    count = session.execute(
+                        select(func.count()).select_from(eduverse.Message).where(eduverse.Message.chat_id == 1)
+                    ).scalar()
+                    session.add(eduverse.Message(chat_id=1, sender_id=1 + index,
+                                                 content=f'{index}/{i} после {count}'))
+                    session.commit()
+                    committed += 1
+                except OperationalError as e:
+                    session.rollback()
+                    if 'locked' in str(e):
+                        locked += 1
+                    else:
+                        other += 1
+        with lock:
+            counters['committed'] += committed
+            counters['locked'] += locked
+            counters['other'] += other
+
+    pool = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(counters)
+
+
+def run_profile(name, env, args, ctx):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stress.db')
+        setup = ctx.Process(target=create_schema, args=(db_path, env))
+        setup.start()
+        setup.join()
+
+        results = ctx.Queue()
+        per_process = max(1, args.writers // args.processes)
+        processes = [ctx.Process(target=worker_process,
+                                 args=(db_path, env, per_process, args.transactions, results))
+                     for _ in range(args.processes)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        totals = {'committed': 0, 'locked': 0, 'other': 0}
+        for _ in processes:
+            for key, value in results.get().items():
+                totals[key] += value
+        for process in processes:
+            process.join()
+        totals['seconds'] = time.perf_counter() - started
+        totals['name'] = name
+        return totals
+
+
+def create_schema(db_path, env):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    import app as eduverse
+    from db_engine import write_lock
+    with eduverse.create_app().app_context():
+        eduverse.db.create_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--transactions', type=int, default=50)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = [run_profile(name, env, args, ctx) for name, env in PROFILES.items()]
+
+    print(f"{'профиль':<14}{'tx/s':>10}{'успешно':>10}{'locked':>10}{'другие':>10}")
+    for r in results:
+        print(f"{r['name']:<14}{r['committed'] / r['seconds']:>10.0f}{r['committed']:>10}"
+              f"{r['locked']:>10}{r['other']:>10}")
+    sys.exit(1 if results[0]['locked'] or results[0]['other'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+"""
+Потоковый массовый импорт школ, пользователей, классов и зачислений.
+
+Файл CSV или JSONL читается построчно и обрабатывается пачками по
+chunk_size строк: внешние ключи (школа по unique_url, класс и предмет по
+имени внутри школы, пользователь по username) разрешаются через словари
+в памяти, строки вставляются одним executemany на пачку, транзакция
+фиксируется после каждой пачки. Память не зависит от размера файла:
+словари школ, классов и предметов загружаются целиком (их немного), а
+пользователи ищутся одним запросом на пачку. Пароли хешируются методом
+hash_method в пуле из hash_workers процессов (None - по числу ядер, 0 -
+без пула, функцией hash_many над списком паролей пачки; так импорт внутри
+веб-воркера пользуется общим ограниченным пулом хеширования).
+
+Формат записей (колонки CSV или ключи JSONL):
+
+    schools:          name, unique_url[, description, contact_info]
+    subjects:         school, name[, description]
+    classes:          school, name, grade_level
+    users:            username, email, password, role[, school]
+    class_students:   school, class, username
+    student_subjects: school, subject, username
+    parent_children:  parent, child
+
+где school - unique_url школы, class/subject - название в этой школе,
+username/parent/child - имена пользователей. В классы и на предметы
+записываются только ученики, parent - пользователь с ролью parent, child -
+ученик.
+"""
+
+import csv
+import functools
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import insert, or_, select, tuple_
+from werkzeug.security import generate_password_hash
+
+from roles import ROLES
+
+KINDS = ('schools', 'subjects', 'classes', 'users',
+         'class_students', 'student_subjects', 'parent_children')
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportRowError(ValueError):
+    """Ошибка в строке импорта; сообщение попадает в отчёт."""
+
+
+def iter_records(stream, fmt):
+    """Записи из текстового потока CSV или JSONL, по одной.
+
+    Строка JSONL, которая не разбирается или не является объектом,
+    выдаётся как ImportRowError и попадает в отчёт ошибкой этой записи.
+    """
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            yield record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield ImportRowError(f'Строка {line_number}: некорректный JSON ({e})')
+                continue
+            if isinstance(record, dict):
+                yield record
+            else:
+                yield ImportRowError(f'Строка {line_number}: ожидался объект JSON')
+    else:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _required(record, *names):
+    values = []
+    for name in names:
+        value = record.get(name)
+        if value is None or str(value).strip() == '':
+            raise ImportRowError(f'Не заполнено поле {name}')
+        values.append(str(value).strip())
+    return values
+
+
+def _user_id(users, username, role):
+    if username not in users:
+        raise ImportRowError(f'Пользователь {username} не найден')
+    user_id, actual = users[username]
+    if actual != role:
+        raise ImportRowError(f'Пользователь {username} должен иметь роль {role}, а не {actual}')
+    return user_id
+
+
+class BulkImporter:
+    """Импорт одного файла заданного вида.
+
+    models - объект с атрибутами School, Subject, Class, User, ClassStudent,
+    StudentSubject, ParentChild. hooks - словарь вид -> функция
+    (connection, rows), вызываемая после вставки пачки в той же транзакции.
+    """
+
+    def __init__(self, session, models, chunk_size=1000, hash_workers=None,
+                 hash_method='pbkdf2', hash_many=None, hooks=None):
+        self.session = session
+        self.models = models
+        self.chunk_size = chunk_size
+        self.hash_workers = hash_workers
+        # partial от функции модуля передаётся в процессы пула (pickle)
+        self._generate_hash = functools.partial(generate_password_hash, method=hash_method)
+        self.hash_many = hash_many or (lambda passwords: [self._generate_hash(p) for p in passwords])
+        self.hooks = hooks or {}
+        self._schools = None
+        self._classes = None
+        self._subjects = None
+        self._executor = None
+
+    # Словари для разрешения внешних ключей
+
+    def school_ids(self):
+        if self._schools is None:
+            School = self.models.School
+            self._schools = dict(self.session.execute(select(School.unique_url, School.id)).all())
+        return self._schools
+
+    def class_ids(self):
+        if self._classes is None:
+            Class = self.models.Class
+            self._classes = {(school_id, name): class_id for class_id, school_id, name in
+                             self.session.execute(select(Class.id, Class.school_id, Class.name))}
+        return self._classes
+
+    def subject_ids(self):
+        if self._subjects is None:
+            Subject = self.models.Subject
+            self._subjects = {(school_id, name): subject_id for subject_id, school_id, name in
+                              self.session.execute(select(Subject.id, Subject.school_id, Subject.name))}
+        return self._subjects
+
+    def users(self, usernames):
+        """username -> (id, роль) одним запросом."""
+        User = self.models.User
+        if not usernames:
+            return {}
+        return {username: (user_id, role) for username, user_id, role in self.session.execute(
+            select(User.username, User.id, User.role).where(User.username.in_(set(usernames)))
+        )}
+
+    def _school_id(self, unique_url):
+        school_id = self.school_ids().get(unique_url)
+        if school_id is None:
+            raise ImportRowError(f'Школа {unique_url} не найдена')
+        return school_id
+
+    def hash_passwords(self, passwords):
+        if not passwords:
+            return []
+        if self.hash_workers == 0:
+            return list(self.hash_many(passwords))
+        workers = self.hash_workers or os.cpu_count() or 1
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(self._executor.map(self._generate_hash, passwords, chunksize=chunksize))
+
+    # Подготовка пачек: (строки для вставки, ошибки [(номер, текст)])
+
+    def _rows(self, chunk, build):
+        rows, errors = [], []
+        for number, record in chunk:
+            try:
+                rows.append((number, build(record)))
+            except ImportRowError as e:
+                errors.append((number, str(e)))
+        return rows, errors
+
+    def _drop_duplicates(self, rows, errors, key, existing, message):
+        seen = set()
+        unique = []
+        for number, row in rows:
+            row_key = key(row)
+            if row_key in existing or row_key in seen:
+                errors.append((number, message))
+            else:
+                seen.add(row_key)
+                unique.append((number, row))
+        return unique
+
+    def _prepare_schools(self, chunk):
+        School = self.models.School
+
+        def build(record):
+            name, unique_url = _required(record, 'name', 'unique_url')
+            return {'name': name, 'unique_url': unique_url,
+                    'description': record.get('description') or '',
+                    'contact_info': record.get('contact_info') or ''}
+
+        rows, errors = self._rows(chunk, build)
+        taken = self.session.execute(select(School.name, School.unique_url).where(or_(
+            School.name.in_([r['name'] for _, r in rows]),
+            School.unique_url.in_([r['unique_url'] for _, r in rows])
+        ))).all()
+        names = {name for name, _ in taken}
+        urls = {unique_url for _, unique_url in taken}
+        unique = []
+        for number, row in rows:
+            if row['name'] in names or row['unique_url'] in urls:
+                errors.append((number, 'Школа с таким названием или адресом уже существует'))
+            else:
+                names.add(row['name'])
+                urls.add(row['unique_url'])
+                unique.append((number, row))
+        return unique, errors
+
+    def _prepare_subjects(self, chunk):
+        def build(record):
+            school, name = _required(record, 'school', 'name')
+            return {'school_id': self._school_id(school), 'name': name,
+                    'description': record.get('description') or ''}
+
+        rows, errors = self._rows(chunk, build)
+        rows = self._drop_duplicates(rows, errors, lambda r: (r['school_id'], r['name']),
+                                     self.subject_ids(), 'Предмет уже существует')
+        return rows, errors
+
+    def _prepare_classes(self, chunk):
+        def build(record):
+            school, name, grade_level = _required(record, 'school', 'name', 'grade_level')
+            try:
+                grade_level = int(grade_level)
+            except ValueError:
+                raise ImportRowError('grade_level должен быть числом')
+            return {'school_id': self._school_id(school), 'name': name, 'grade_level': grade_level}
+
+        rows, errors = self._rows(chunk, build)
+        rows = self._drop_duplicates(rows, errors, lambda r: (r['school_id'], r['name']),
+                                     self.class_ids(), 'Класс уже существует')
+        return rows, errors
+
+    def _prepare_users(self, chunk):
+        User = self.models.User
+
+        def build(record):
+            username, email, password, role = _required(record, 'username', 'email', 'password', 'role')
+            if role not in ROLES:
+                raise ImportRowError(f'Неизвестная роль {role}')
+            school = (record.get('school') or '').strip()
+            return {'username': username, 'email': email, 'password': password, 'role': role,
+                    'school_id': self._school_id(school) if school else None}
+
+        rows, errors = self._rows(chunk, build)
+        taken = self.session.execute(select(User.username, User.email).where(or_(
+            User.username.in_([r['username'] for _, r in rows]),
+            User.email.in_([r['email'] for _, r in rows])
+        ))).all()
+        usernames = {username for username, _ in taken}
+        emails = {email for _, email in taken}
+        unique = []
+        for number, row in rows:
+            if row['username'] in usernames or row['email'] in emails:
+                errors.append((number, 'Пользователь с таким именем или email уже существует'))
+            else:
+                usernames.add(row['username'])
+                emails.add(row['email'])
+                unique.append((number, row))
+
+        hashes = self.hash_passwords([row.pop('password') for _, row in unique])
+        for (_, row), password_hash in zip(unique, hashes):
+            row['password_hash'] = password_hash
+        return unique, errors
+
+    def _prepare_membership(self, chunk, group_field, label, group_ids, group_column, model, message):
+        users = self.users([str(r.get('username', '')).strip() for _, r in chunk])
+
+        def build(record):
+            school, group, username = _required(record, 'school', group_field, 'username')
+            group_id = group_ids().get((self._school_id(school), group))
+            if group_id is None:
+                raise ImportRowError(f'{label} {group} не найден в школе {school}')
+            return {group_column: group_id, 'student_id': _user_id(users, username, 'student')}
+
+        rows, errors = self._rows(chunk, build)
+        existing = self._existing_pairs(model, group_column, 'student_id', rows)
+        rows = self._drop_duplicates(rows, errors, lambda r: (r[group_column], r['student_id']),
+                                     existing, message)
+        return rows, errors
+
+    def _prepare_class_students(self, chunk):
+        return self._prepare_membership(chunk, 'class', 'Класс', self.class_ids, 'class_id',
+                                        self.models.ClassStudent, 'Ученик уже в классе')
+
+    def _prepare_student_subjects(self, chunk):
+        return self._prepare_membership(chunk, 'subject', 'Предмет', self.subject_ids, 'subject_id',
+                                        self.models.StudentSubject, 'Ученик уже записан на предмет')
+
+    def _prepare_parent_children(self, chunk):
+        ParentChild = self.models.ParentChild
+        users = self.users([str(r.get(name, '')).strip() for _, r in chunk
+                            for name in ('parent', 'child')])
+
+        def build(record):
+            parent, child = _required(record, 'parent', 'child')
+            return {'parent_id': _user_id(users, parent, 'parent'),
+                    'child_id': _user_id(users, child, 'student')}
+
+        rows, errors = self._rows(chunk, build)
+        existing = self._existing_pairs(ParentChild, 'parent_id', 'child_id', rows)
+        rows = self._drop_duplicates(rows, errors, lambda r: (r['parent_id'], r['child_id']),
+                                     existing, 'Связь родитель-ребёнок уже существует')
+        return rows, errors
+
+    def _existing_pairs(self, model, first, second, rows):
+        if not rows:
+            return set()
+        columns = (getattr(model, first), getattr(model, second))
+        pairs = {(r[first], r[second]) for _, r in rows}
+        return set(self.session.execute(
+            select(*columns).where(tuple_(*columns).in_(list(pairs)))
+        ).all())
+
+    # Вставка
+
+    def _insert(self, kind, rows):
+        values = [row for _, row in rows]
+        models = self.models
+        if kind == 'schools':
+            result = self.session.execute(
+                insert(models.School).returning(models.School.unique_url, models.School.id), values)
+            self.school_ids().update(result.all())
+        elif kind == 'subjects':
+            result = self.session.execute(
+                insert(models.Subject).returning(models.Subject.id, models.Subject.school_id,
+                                                 models.Subject.name), values)
+            self.subject_ids().update({(s, n): i for i, s, n in result})
+        elif kind == 'classes':
+            result = self.session.execute(
+                insert(models.Class).returning(models.Class.id, models.Class.school_id,
+                                               models.Class.name), values)
+            self.class_ids().update({(s, n): i for i, s, n in result})
+        else:
+            model = {
+                'users': models.User,
+                'class_students': models.ClassStudent,
+                'student_subjects': models.StudentSubject,
+                'parent_children': models.ParentChild,
+            }[kind]
+            self.session.execute(insert(model), values)
+
+        hook = self.hooks.get(kind)
+        if hook is not None:
+            hook(self.session.connection(), values)
+
+    def run(self, records, kind):
+        """Импортировать записи; возвращает отчёт со скоростью и ошибками."""
+        if kind not in KINDS:
+            raise ValueError(f'Неизвестный вид импорта: {kind}')
+        prepare = getattr(self, f'_prepare_{kind}')
+
+        report = {'kind': kind, 'read': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+        started = time.perf_counter()
+        numbered = enumerate(records, start=1)
+        try:
+            for chunk in chunked(numbered, self.chunk_size):
+                report['read'] += len(chunk)
+                invalid = [(n, str(r)) for n, r in chunk if isinstance(r, ImportRowError)]
+                rows, errors = prepare([(n, r) for n, r in chunk if not isinstance(r, ImportRowError)])
+                errors.extend(invalid)
+                # Проверки пачки (и хеширование паролей) - своей транзакцией чтения,
+                # вставка - новой, которая сразу берёт блокировку записи; дубли,
+                # вставленные между ними параллельно, остановит уникальный индекс
+                self.session.commit()
+                if rows:
+                    self._insert(kind, rows)
+                self.session.commit()
+
+                report['inserted'] += len(rows)
+                report['failed'] += len(errors)
+                room = MAX_REPORTED_ERRORS - len(report['errors'])
+                report['errors'].extend({'row': n, 'error': e} for n, e in sorted(errors)[:room])
+        finally:
+            self.session.rollback()
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+        elapsed = time.perf_counter() - started
+        report['seconds'] = round(elapsed, 3)
+        report['rows_per_sec'] = round(report['read'] / elapsed) if elapsed else None
+        return report
@@ -0,0 +1,182 @@
+"""
+Конвейер сообщений чата Socket.IO: проверка, сборка и рассылка.
+
+Frame хранит полезную нагрузку, сериализованную в JSON один раз для всех
+получателей; FrameJSON подставляет её в пакет python-socketio.
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_BYTES = 4000
+
+
+class MessageError(ValueError):
+    """Сообщение клиента не прошло проверку."""
+
+
+class Frame:
+    """Полезная нагрузка события, уже сериализованная в JSON."""
+
+    __slots__ = ('json',)
+
+    def __init__(self, payload):
+        # Без \uXXXX: кириллица в UTF-8 занимает 2 байта, а не 6
+        self.json = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def join(cls, frames):
+        """Список из нескольких кадров без повторной сериализации."""
+        frame = cls.__new__(cls)
+        frame.json = '[' + ','.join(f.json for f in frames) + ']'
+        return frame
+
+    def __getstate__(self):
+        return self.json
+
+    def __setstate__(self, state):
+        self.json = state
+
+
+@lru_cache(maxsize=256)
+def _event_prefix(event):
+    return json.dumps([event], separators=(',', ':'))[:-1] + ','
+
+
+class FrameJSON:
+    """Модуль json для socketio.Server: Frame последним аргументом события не
+    сериализуется заново, остальное - обычный json."""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        if isinstance(obj, list) and obj and isinstance(obj[-1], Frame):
+            # Пакет события: [имя, Frame] - имя тоже закодировано заранее
+            if len(obj) == 2 and isinstance(obj[0], str):
+                return _event_prefix(obj[0]) + obj[-1].json + ']'
+            head = json.dumps(obj[:-1], *args, **kwargs)
+            return head[:-1] + (',' if len(obj) > 1 else '') + obj[-1].json + ']'
+        return json.dumps(obj, *args, **kwargs)
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return json.loads(*args, **kwargs)
+
+
+def _optional_id(value, name):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise MessageError(f'Некорректный {name}')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise MessageError(f'Некорректный {name}')
+
+
+class MessagePipeline:
+    """Проверка, сборка и рассылка сообщений чата (emit - SocketIO.emit в комнату)."""
+
+    def __init__(self, emit=None, max_bytes=MAX_MESSAGE_BYTES, batch_interval=0.0,
+                 start_background_task=None, sleep=None):
+        self._emit = emit
+        self.max_bytes = max_bytes
+        self.batch_interval = batch_interval
+        self._start_background_task = start_background_task or self._start_thread
+        self._sleep = sleep or time.sleep
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self.stats = {'accepted': 0, 'rejected': 0, 'frames': 0}
+
+    def init_app(self, emit=None, max_bytes=None, batch_interval=None,
+                 start_background_task=None, sleep=None):
+        """Настроить из create_app; None оставляет текущее значение."""
+        if emit is not None:
+            self._emit = emit
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if batch_interval is not None:
+            self.batch_interval = batch_interval
+        if start_background_task is not None:
+            self._start_background_task = start_background_task
+        if sleep is not None:
+            self._sleep = sleep
+
+    @staticmethod
+    def _start_thread(target):
+        thread = threading.Thread(target=target, name='chat-batcher', daemon=True)
+        thread.start()
+        return thread
+
+    def prepare(self, data, sender_id):
+        """Проверить данные клиента и собрать сообщение со временем сервера (id - None)."""
+        try:
+            if not isinstance(data, dict):
+                raise MessageError('Ожидается объект сообщения')
+            chat_id = _optional_id(data.get('room'), 'room')
+            if chat_id is None:
+                raise MessageError('Не указан чат (room)')
+            content = data.get('content')
+            if not isinstance(content, str) or not content.strip():
+                raise MessageError('Пустое сообщение')
+            content = content.strip()
+            if len(content.encode('utf-8')) > self.max_bytes:
+                raise MessageError(f'Сообщение длиннее {self.max_bytes} байт')
+            receiver_id = _optional_id(data.get('receiver_id'), 'receiver_id')
+        except MessageError:
+            self.stats['rejected'] += 1
+            raise
+
+        message = {
+            'id': None,
+            'chat_id': chat_id,
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'content': content,
+            'timestamp': datetime.utcnow().isoformat(),
+            'is_pinned': False,
+        }
+        self.stats['accepted'] += 1
+        return message
+
+    def publish(self, room, message):
+        """Разослать сообщение в комнату сразу или в ближайшем пакете."""
+        if self.batch_interval <= 0:
+            self._send('message', Frame(message), room)
+            return
+        with self._lock:
+            self._pending.setdefault(room, []).append(Frame(message))
+            if not self._running:
+                self._running = True
+                self._start_background_task(self._run)
+
+    def _send(self, event, frame, room):
+        self._emit(event, frame, room)
+        self.stats['frames'] += 1
+
+    def flush(self):
+        """Отправить накопленные сообщения: по одному событию на комнату."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for room, frames in pending.items():
+            try:
+                self._send('messages', Frame.join(frames), room)
+            except Exception:
+                logger.exception('Не удалось разослать %d сообщений в комнату %s', len(frames), room)
+        return sum(map(len, pending.values()))
+
+    def _run(self):
+        # Задача живёт, пока есть что рассылать; следующая публикация запустит новую
+        while True:
+            self._sleep(self.batch_interval)
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
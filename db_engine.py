@@ -0,0 +1,201 @@
+"""
+Настройка движка БД по переменным окружения.
+
+PostgreSQL и MySQL получают пул соединений нужного размера, pool_pre_ping
+(переподключение после рестарта БД) и pool_recycle. Для PostgreSQL можно
+задать statement_timeout. SQLite переводится в режим WAL с
+synchronous=NORMAL, busy_timeout и mmap. Транзакции начинаются обычным
+(отложенным) BEGIN, так что чтения в режиме WAL не ждут писателей.
+Транзакция, которая начинается с записи, сразу переоткрывается через
+BEGIN IMMEDIATE и ждёт других писателей до busy_timeout. Транзакция, которая
+сначала читала, остаётся атомарной: SQLite сам повышает её блокировку, но
+если другой писатель успел зафиксироваться после её чтения, запись сразу
+падает с "database is locked". Поэтому транзакции "прочитать, затем
+записать" объявляют запись заранее: write_lock(session) до первого запроса
+или декоратор представления @write_transaction(session).
+Соединения с execution_options(read_only=True) блокировку не берут.
+Функция lower() в SQLite заменяется на юникодную: встроенная меняет регистр
+только латиницы, и ILIKE не находил кириллицу в другом регистре.
+
+Если задан DATABASE_REPLICA_URL, представления с декоратором @use_replica
+читают из реплики. Запись (flush) всегда идёт в основную БД.
+"""
+
+import functools
+import re
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+
+
+def _unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+# Флаги в connection.info: текущая транзакция SQLite уже держит блокировку
+# записи; в ней уже выполнялись запросы
+_WRITE_LOCKED = 'sqlite_write_locked'
+_STARTED = 'sqlite_transaction_started'
+_WRITE_STATEMENT = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|SAVEPOINT)\b', re.IGNORECASE)
+
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def _is_sqlite_memory(url):
+    database = make_url(url).database
+    return database in (None, '', ':memory:')
+
+
+def engine_options(url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS для url по настройкам DB_* из config."""
+    if is_sqlite(url):
+        if _is_sqlite_memory(url):
+            return {}
+        return {
+            'pool_size': config['SQLITE_POOL_SIZE'],
+            'max_overflow': config['SQLITE_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            # Соединение может вернуться в пул из другого потока
+            'connect_args': {'check_same_thread': False,
+                             'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0},
+        }
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and make_url(url).get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+    return options
+
+
+def _begin_immediate(connection):
+    # Отложенный BEGIN ещё не выполнил ни одного запроса и ничего не держит:
+    # он заменяется на BEGIN IMMEDIATE (ожидание писателей до busy_timeout).
+    # Команды идут мимо событий курсора, чтобы не попадать в счётчики запросов
+    driver_connection = connection.connection.driver_connection
+    driver_connection.execute('ROLLBACK')
+    driver_connection.execute('BEGIN IMMEDIATE')
+    connection.info[_WRITE_LOCKED] = True
+
+
+def configure_sqlite(engine, config, immediate=True):
+    """PRAGMA для каждого нового соединения SQLite и BEGIN IMMEDIATE для транзакций записи."""
+    pragmas = [
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+    if config['SQLITE_JOURNAL_MODE']:
+        pragmas.insert(0, f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # Транзакциями управляем сами (см. begin ниже), иначе pysqlite
+        # открывает их неявно и BEGIN IMMEDIATE не применить
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+        dbapi_connection.create_function('lower', 1, _unicode_lower, deterministic=True)
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.connection.driver_connection.execute('BEGIN')
+        connection.info[_WRITE_LOCKED] = False
+        connection.info[_STARTED] = False
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(connection, cursor, statement, parameters, context, executemany):
+        if (immediate and not connection.info.get(_STARTED, True)
+                and not connection.info.get(_WRITE_LOCKED, True) and _WRITE_STATEMENT.match(statement)
+                and not connection.get_execution_options().get('read_only')):
+            _begin_immediate(connection)
+        connection.info[_STARTED] = True
+
+
+def dialect_insert(dialect, table):
+    """INSERT с ON CONFLICT (on_conflict_do_update/do_nothing) для PostgreSQL и SQLite.
+
+    Для остальных СУБД - None: вызывающий код выбирает существующие ключи сам.
+    """
+    if dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(table)
+
+
+def write_lock(session):
+    """Начать транзакцию сессии с блокировкой записи, до чтений, от которых зависит запись.
+
+    SQLite: транзакция открывается через BEGIN IMMEDIATE, её чтения видят
+    последние данные и атомарны с записью, параллельные писатели ждут.
+    Если в транзакции уже были запросы - RuntimeError: её чтения нельзя
+    незаметно отделить от записи, транзакцию завершают явно (commit) до
+    вызова. В остальных СУБД ничего не делает - там блокируют строки
+    (SELECT ... FOR UPDATE). Возвращает соединение сессии.
+    """
+    connection = session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.info.get(_WRITE_LOCKED, True):
+        if connection.info.get(_STARTED):
+            raise RuntimeError('write_lock() вызван после запросов в текущей транзакции')
+        _begin_immediate(connection)
+    return connection
+
+
+def write_transaction(session):
+    """Декоратор представления, которое пишет: транзакция сессии с блокировкой записи с первого запроса."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            write_lock(session)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def configure_engines(app, db):
+    """Применить настройки SQLite ко всем движкам приложения (вызывать после init_app)."""
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                # Реплика только читает: ей не нужна блокировка записи
+                immediate = key != REPLICA_BIND and app.config['SQLITE_BEGIN_IMMEDIATE']
+                configure_sqlite(engine, app.config, immediate=immediate)
+
+
+class RoutingSession(Session):
+    """Сессия, которая внутри @use_replica читает из движка реплики."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('_use_replica'):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica(view):
+    """Декоратор представления, которое только читает данные."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        previous = g.get('_use_replica', False)
+        g._use_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g._use_replica = previous
+    return wrapper
@@ -0,0 +1,216 @@
+"""
+Пакетное выставление оценок из журнала учителя.
+
+Журнал - матрица ученики x даты по одному предмету:
+
+    {"subject_id": 5, "class_id": 3, "dates": ["2024-09-02", "2024-09-03"],
+     "rows": [{"student_id": 10, "grades": [8, null]}, ...]}
+
+null - ячейка не меняется. Значения и даты проверяются в памяти, принадлежность
+учеников предмету (StudentSubject) или классу (ClassStudent) - одним
+запросом на весь журнал. Существующие оценки тех же ячеек читаются одним
+запросом (SELECT ... FOR UPDATE, в SQLite - под блокировкой записи), затем
+изменённые обновляются одним executemany UPDATE, новые вставляются одним
+executemany INSERT, агрегаты обновляются через apply_deltas - всё в одной
+транзакции. Число запросов не зависит от размера журнала. Строки с ошибками
+пропускаются и попадают в отчёт.
+
+Ячейка (ученик, предмет, дата) уникальна (индекс ix_grade_student_subject_date).
+Вставка идёт через INSERT ... ON CONFLICT DO NOTHING RETURNING: если
+параллельный журнал успел вставить ту же ячейку, она перечитывается и
+обновляется как существующая, поэтому дублей нет и агрегаты не
+считаются дважды.
+"""
+
+from datetime import date
+
+from sqlalchemy import bindparam, insert, select, union
+
+from db_engine import dialect_insert, write_lock
+
+GRADE_MIN = 1
+GRADE_MAX = 10
+MAX_CELLS = 5000
+
+
+class JournalError(ValueError):
+    """Журнал нельзя принять целиком (не строки, а его структура)."""
+
+
+def parse_dates(values):
+    if not isinstance(values, list) or not values:
+        raise JournalError('Укажите даты журнала (dates)')
+    try:
+        dates = [date.fromisoformat(value) for value in values]
+    except (TypeError, ValueError):
+        raise JournalError('Даты должны быть в формате ГГГГ-ММ-ДД')
+    if len(set(dates)) != len(dates):
+        raise JournalError('Даты журнала повторяются')
+    return dates
+
+
+def _grade(value):
+    # bool - подкласс int, но true/false оценкой не считаются
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'Оценка должна быть целым числом, получено {value!r}')
+    if not GRADE_MIN <= value <= GRADE_MAX:
+        raise ValueError(f'Оценка {value} вне диапазона {GRADE_MIN}-{GRADE_MAX}')
+    return value
+
+
+def parse_rows(rows, dates):
+    """Ячейки {(student_id, date): grade} и ошибки [(номер строки, student_id, текст)]."""
+    if not isinstance(rows, list) or not rows:
+        raise JournalError('Журнал пуст (rows)')
+    if len(rows) * len(dates) > MAX_CELLS:
+        raise JournalError(f'Не больше {MAX_CELLS} ячеек за запрос')
+
+    cells, errors, seen = {}, [], set()
+    for number, row in enumerate(rows):
+        student_id = row.get('student_id') if isinstance(row, dict) else None
+        grades = row.get('grades') if isinstance(row, dict) else None
+        try:
+            if isinstance(student_id, bool) or not isinstance(student_id, int):
+                raise ValueError('Не указан student_id')
+            if student_id in seen:
+                raise ValueError('Ученик уже есть в журнале')
+            if not isinstance(grades, list) or len(grades) != len(dates):
+                raise ValueError(f'Ожидается {len(dates)} оценок по числу дат')
+            row_cells = {}
+            for day, value in zip(dates, grades):
+                grade = _grade(value)
+                if grade is not None:
+                    row_cells[(student_id, day)] = grade
+        except ValueError as e:
+            errors.append((number, student_id, str(e)))
+            continue
+        seen.add(student_id)
+        cells.update(row_cells)
+    return cells, errors
+
+
+class GradeJournal:
+    """Запись журнала в таблицу Grade.
+
+    models - пространство имён с Grade, StudentSubject и ClassStudent;
+    apply_deltas(connection, deltas) обновляет агрегаты оценок, так как
+    INSERT/UPDATE в обход ORM не вызывают событий модели.
+    """
+
+    def __init__(self, session, models, apply_deltas=None):
+        self.session = session
+        self.models = models
+        self.apply_deltas = apply_deltas
+
+    def enrolled(self, subject_id, class_id, student_ids):
+        """Ученики из student_ids, изучающие предмет или состоящие в классе."""
+        StudentSubject, ClassStudent = self.models.StudentSubject, self.models.ClassStudent
+        statement = select(StudentSubject.student_id).where(
+            StudentSubject.subject_id == subject_id, StudentSubject.student_id.in_(student_ids))
+        if class_id is not None:
+            statement = union(statement, select(ClassStudent.student_id).where(
+                ClassStudent.class_id == class_id, ClassStudent.student_id.in_(student_ids)))
+        return set(self.session.execute(statement).scalars())
+
+    def existing(self, subject_id, student_ids, dates):
+        """{(student_id, date): (id, grade)} для ячеек журнала; строки блокируются до commit."""
+        Grade = self.models.Grade
+        return {
+            (student_id, day): (grade_id, grade)
+            for grade_id, student_id, day, grade in self.session.execute(
+                select(Grade.id, Grade.student_id, Grade.date, Grade.grade)
+                .where(Grade.subject_id == subject_id, Grade.student_id.in_(student_ids),
+                       Grade.date.in_(dates))
+                .with_for_update()
+            )
+        }
+
+    def insert_new(self, rows):
+        """Вставить ячейки rows; ключи (student_id, date) тех, что вставлены (не заняты)."""
+        table = self.models.Grade.__table__
+        statement = dialect_insert(self.session.connection().dialect, table)
+        if statement is None:
+            # Без ON CONFLICT параллельная вставка той же ячейки упадёт на уникальном индексе
+            self.session.execute(insert(table), rows)
+            return {(row['student_id'], row['date']) for row in rows}
+        statement = (statement
+                     .on_conflict_do_nothing(index_elements=['student_id', 'subject_id', 'date'])
+                     .returning(table.c.student_id, table.c.date))
+        return {tuple(row) for row in self.session.execute(statement, rows)}
+
+    @staticmethod
+    def plan(subject_id, cells, existing):
+        """Разложить ячейки на новые, изменённые и прежние."""
+        inserts, updates, deltas = [], [], []
+        unchanged = 0
+        for (student_id, day), grade in cells.items():
+            current = existing.get((student_id, day))
+            if current is None:
+                inserts.append({'student_id': student_id, 'subject_id': subject_id,
+                                'grade': grade, 'date': day})
+            elif current[1] != grade:
+                updates.append({'b_id': current[0], 'b_grade': grade})
+                deltas.append((student_id, subject_id, current[1], -1))
+                deltas.append((student_id, subject_id, grade, 1))
+            else:
+                unchanged += 1
+        return inserts, updates, deltas, unchanged
+
+    def submit(self, subject_id, dates, rows, class_id=None):
+        """Принять журнал; отчёт {inserted, updated, unchanged, errors}."""
+        Grade = self.models.Grade
+        dates = parse_dates(dates)
+        cells, errors = parse_rows(rows, dates)
+        if cells:
+            # Запись зависит от прочитанного (зачисления, прежние оценки): в SQLite
+            # транзакция с блокировкой записи начинается до первого чтения
+            write_lock(self.session)
+
+        student_ids = {student_id for student_id, _ in cells}
+        if student_ids:
+            enrolled = self.enrolled(subject_id, class_id, student_ids)
+            for number, row in enumerate(rows):
+                student_id = row.get('student_id') if isinstance(row, dict) else None
+                if student_id in student_ids and student_id not in enrolled:
+                    errors.append((number, student_id, 'Ученик не записан на предмет или в класс'))
+            cells = {key: grade for key, grade in cells.items() if key[0] in enrolled}
+
+        inserted, updates, deltas, unchanged = [], [], [], 0
+        if cells:
+            inserts, updates, deltas, unchanged = self.plan(
+                subject_id, cells, self.existing(subject_id, {s for s, _ in cells}, dates))
+            if inserts:
+                keys = self.insert_new(inserts)
+                inserted = [row for row in inserts if (row['student_id'], row['date']) in keys]
+                # Ячейки, вставленные параллельным журналом, обновляются как существующие
+                taken = {(row['student_id'], row['date']): row['grade']
+                         for row in inserts if (row['student_id'], row['date']) not in keys}
+                if taken:
+                    _, more_updates, more_deltas, more_unchanged = self.plan(
+                        subject_id, taken,
+                        self.existing(subject_id, {s for s, _ in taken}, {d for _, d in taken}))
+                    updates += more_updates
+                    deltas += more_deltas
+                    unchanged += more_unchanged
+                deltas += [(row['student_id'], subject_id, row['grade'], 1) for row in inserted]
+
+        if updates:
+            # Core executemany: ORM-UPDATE по первичному ключу не принимает b_-параметры
+            self.session.connection().execute(
+                Grade.__table__.update().where(Grade.id == bindparam('b_id'))
+                .values(grade=bindparam('b_grade')),
+                updates
+            )
+        if deltas and self.apply_deltas is not None:
+            self.apply_deltas(self.session.connection(), deltas)
+        self.session.commit()
+
+        return {
+            'inserted': len(inserted),
+            'updated': len(updates),
+            'unchanged': unchanged,
+            'errors': [{'row': number, 'student_id': student_id, 'error': message}
+                       for number, student_id, message in sorted(errors, key=lambda e: e[0])],
+        }
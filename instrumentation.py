@@ -0,0 +1,313 @@
+"""
+Счётчики SQL-запросов и времени для каждого маршрута и события Socket.IO.
+
+Включается через METRICS_ENABLED. Для каждого запроса (HTTP или события
+Socket.IO) считаются число SQL-запросов, суммарное время в БД, самые
+медленные запросы и общее время обработки. Итоги пишутся в лог одной
+JSON-строкой и накапливаются по endpoint для /metrics (формат Prometheus).
+/metrics/slow-queries отдаёт текст SQL и подключается только вместе с
+METRICS_TOKEN.
+
+Детектор N+1 предупреждает, если запрос одной формы (SQL без значений
+параметров) повторяется в рамках одного запроса больше
+N_PLUS_ONE_THRESHOLD раз.
+"""
+
+import functools
+import hmac
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, abort, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_IN_LIST = re.compile(r'\(\s*(\?|%\([^)]*\)s|\$\d+)(\s*,\s*(\?|%\([^)]*\)s|\$\d+))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Форма запроса: списки IN (?, ?, ...) сворачиваются, пробелы сжимаются."""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(?)', statement)).strip()
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestStats:
+    """Статистика одного HTTP-запроса или события Socket.IO."""
+
+    __slots__ = ('endpoint', 'started', 'queries', 'db_time', 'slowest', 'shapes',
+                 'warned', 'status', '_query_started')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []
+        self.shapes = Counter()
+        self.warned = set()
+        self.status = None
+        self._query_started = []
+
+
+class EndpointStats:
+    __slots__ = ('requests', 'errors', 'queries', 'db_time', 'wall_time', 'max_wall_time',
+                 'buckets', 'n_plus_one', 'slowest')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.wall_time = 0.0
+        self.max_wall_time = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.n_plus_one = 0
+        self.slowest = []
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.n_plus_one_threshold = 10
+        self.slowest_count = 5
+        self.token = None
+        self._endpoints = defaultdict(EndpointStats)
+        self._collectors = []
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        self.n_plus_one_threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 10)
+        self.slowest_count = app.config.get('METRICS_SLOWEST_QUERIES', 5)
+        self.token = app.config.get('METRICS_TOKEN')
+        if not self.enabled:
+            return
+
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+        # Слушатели общие для всех движков: при повторном create_app не дублируем
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        if self.token:
+            app.add_url_rule('/metrics/slow-queries', 'metrics_slow_queries', self.slow_queries_view)
+        else:
+            logger.warning('METRICS_TOKEN не задан: /metrics открыт всем, /metrics/slow-queries отключён')
+
+    def add_collector(self, collector):
+        """collector() -> [(имя метрики, тип, {метки}, значение)] для /metrics."""
+        self._collectors.append(collector)
+
+    # Границы запросов и событий
+
+    def _before_request(self):
+        g._instrumentation = RequestStats(request.endpoint or 'unknown')
+
+    def _after_request(self, response):
+        stats = g.get('_instrumentation')
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        stats = g.pop('_instrumentation', None)
+        if stats is not None:
+            if exc is not None:
+                stats.status = 500
+            self._finish(stats, method=request.method)
+
+    def event(self, name):
+        """Декоратор обработчика Socket.IO (ставится под @socketio.on)."""
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return handler(*args, **kwargs)
+                stats = g._instrumentation = RequestStats(f'socketio:{name}')
+                try:
+                    result = handler(*args, **kwargs)
+                except Exception:
+                    stats.status = 500
+                    raise
+                finally:
+                    g.pop('_instrumentation', None)
+                    self._finish(stats, method='EVENT')
+                return result
+            return wrapper
+        return decorator
+
+    # SQL
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_app_context():
+            stats = g.get('_instrumentation')
+            if stats is not None:
+                stats._query_started.append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_app_context():
+            return
+        stats = g.get('_instrumentation')
+        if stats is None or not stats._query_started:
+            return
+
+        elapsed = time.perf_counter() - stats._query_started.pop()
+        stats.queries += 1
+        stats.db_time += elapsed
+
+        shape = statement_shape(statement)
+        stats.shapes[shape] += 1
+        repeats = stats.shapes[shape]
+        if repeats > self.n_plus_one_threshold and shape not in stats.warned:
+            stats.warned.add(shape)
+            logger.warning('Возможный N+1 в %s: запрос повторён больше %d раз: %s',
+                           stats.endpoint, self.n_plus_one_threshold, shape[:300])
+
+        self._keep_slowest(stats.slowest, elapsed, shape)
+
+    def _keep_slowest(self, slowest, elapsed, shape):
+        # Топ самых медленных форм запросов, каждая форма - один раз
+        if len(slowest) >= self.slowest_count and elapsed <= slowest[-1][0]:
+            return
+        for i, (known_elapsed, known_shape) in enumerate(slowest):
+            if known_shape == shape:
+                if elapsed <= known_elapsed:
+                    return
+                del slowest[i]
+                break
+        slowest.append((elapsed, shape))
+        slowest.sort(key=lambda item: item[0], reverse=True)
+        del slowest[self.slowest_count:]
+
+    # Итоги
+
+    def _finish(self, stats, method):
+        wall_time = time.perf_counter() - stats.started
+        with self._lock:
+            endpoint = self._endpoints[stats.endpoint]
+            endpoint.requests += 1
+            if stats.status is not None and stats.status >= 500:
+                endpoint.errors += 1
+            endpoint.queries += stats.queries
+            endpoint.db_time += stats.db_time
+            endpoint.wall_time += wall_time
+            endpoint.max_wall_time = max(endpoint.max_wall_time, wall_time)
+            endpoint.n_plus_one += len(stats.warned)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if wall_time <= bound:
+                    endpoint.buckets[i] += 1
+            for elapsed, shape in stats.slowest:
+                self._keep_slowest(endpoint.slowest, elapsed, shape)
+
+        logger.info(json.dumps({
+            'event': 'request_stats',
+            'endpoint': stats.endpoint,
+            'method': method,
+            'status': stats.status,
+            'wall_ms': round(wall_time * 1000, 2),
+            'db_ms': round(stats.db_time * 1000, 2),
+            'queries': stats.queries,
+            'n_plus_one': sorted(stats.warned),
+            'slowest': [{'ms': round(e * 1000, 2), 'sql': s[:300]} for e, s in stats.slowest],
+        }, ensure_ascii=False))
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {
+                'requests': s.requests,
+                'errors': s.errors,
+                'queries': s.queries,
+                'db_seconds': s.db_time,
+                'wall_seconds': s.wall_time,
+                'max_wall_seconds': s.max_wall_time,
+                'buckets': list(s.buckets),
+                'n_plus_one': s.n_plus_one,
+                'slowest': list(s.slowest),
+            } for name, s in self._endpoints.items()}
+
+    def render_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        data = self.snapshot()
+        metric('eduverse_requests_total', 'counter', 'Обработанные запросы и события',
+               [({'endpoint': e}, s['requests']) for e, s in data.items()])
+        metric('eduverse_request_errors_total', 'counter', 'Запросы, завершившиеся ошибкой 5xx',
+               [({'endpoint': e}, s['errors']) for e, s in data.items()])
+        metric('eduverse_db_queries_total', 'counter', 'SQL-запросы',
+               [({'endpoint': e}, s['queries']) for e, s in data.items()])
+        metric('eduverse_db_seconds_total', 'counter', 'Время выполнения SQL',
+               [({'endpoint': e}, round(s['db_seconds'], 6)) for e, s in data.items()])
+        metric('eduverse_n_plus_one_total', 'counter', 'Предупреждения детектора N+1',
+               [({'endpoint': e}, s['n_plus_one']) for e, s in data.items()])
+        metric('eduverse_request_max_seconds', 'gauge', 'Максимальное время обработки',
+               [({'endpoint': e}, round(s['max_wall_seconds'], 6)) for e, s in data.items()])
+
+        histogram = []
+        for e, s in data.items():
+            for bound, count in zip(LATENCY_BUCKETS, s['buckets']):
+                histogram.append(({'endpoint': e, 'le': bound}, count))
+            histogram.append(({'endpoint': e, 'le': '+Inf'}, s['requests']))
+        lines.append('# HELP eduverse_request_seconds Время обработки запроса')
+        lines.append('# TYPE eduverse_request_seconds histogram')
+        for labels, value in histogram:
+            label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+            lines.append(f'eduverse_request_seconds_bucket{{{label_text}}} {value}')
+        for e, s in data.items():
+            lines.append(f'eduverse_request_seconds_sum{{endpoint="{_escape_label(e)}"}} {round(s["wall_seconds"], 6)}')
+            lines.append(f'eduverse_request_seconds_count{{endpoint="{_escape_label(e)}"}} {s["requests"]}')
+
+        grouped = defaultdict(list)
+        kinds = {}
+        for collector in self._collectors:
+            for name, kind, labels, value in collector():
+                grouped[name].append((labels, value))
+                kinds[name] = kind
+        for name, samples in grouped.items():
+            metric(name, kinds[name], name, samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def _check_token(self):
+        if self.token and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                  f'Bearer {self.token}'):
+            abort(401)
+
+    def metrics_view(self):
+        self._check_token()
+        return Response(self.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    def slow_queries_view(self):
+        self._check_token()
+        data = self.snapshot()
+        return Response(json.dumps({
+            endpoint: [{'ms': round(e * 1000, 2), 'sql': s} for e, s in stats['slowest']]
+            for endpoint, stats in data.items()
+        }, ensure_ascii=False, indent=2), mimetype='application/json')
@@ -0,0 +1,58 @@
+"""
+Именованные профили загрузки связей.
+
+Все связи в setup_relationships() ленивые: обход user.grades или
+school.classes в цикле даёт отдельный запрос на каждый объект (N+1).
+Профиль собирает набор опций selectinload/joinedload для конкретной
+страницы, чтобы число запросов не зависело от объёма данных:
+
+    profiles.register('school_overview', lambda: [
+        selectinload(School.classes).selectinload(Class.students),
+    ])
+    school = profiles.apply(School.query, 'school_overview').get(school_id)
+
+Опции строятся при первом обращении: к этому моменту связи уже настроены.
+"""
+
+import threading
+
+
+class UnknownProfileError(KeyError):
+    pass
+
+
+class LoadingProfiles:
+    def __init__(self):
+        self._factories = {}
+        self._options = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """factory() -> список опций загрузки для Query.options()."""
+        with self._lock:
+            self._factories[name] = factory
+            self._options.pop(name, None)
+
+    def profile(self, name):
+        """Декоратор для регистрации функции-фабрики под именем профиля."""
+        def decorator(factory):
+            self.register(name, factory)
+            return factory
+        return decorator
+
+    def options(self, name):
+        options = self._options.get(name)
+        if options is None:
+            try:
+                factory = self._factories[name]
+            except KeyError:
+                raise UnknownProfileError(f'Неизвестный профиль загрузки: {name}') from None
+            options = self._options[name] = tuple(factory())
+        return options
+
+    def apply(self, query, name):
+        """Query или select() с опциями профиля."""
+        return query.options(*self.options(name))
+
+    def names(self):
+        return sorted(self._factories)
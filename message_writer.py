@@ -0,0 +1,258 @@
+"""
+Отложенная запись сообщений чата в БД пакетами (group commit).
+
+Неудачный пакет повторяется, затем делится пополам; строки, которые не
+записываются, уходят в dead_letter_path, а их квитанции получают ошибку.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import func, insert, select
+
+from db_engine import write_lock
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Очередь записи переполнена и не освободилась за отведённое время."""
+
+
+class WriteError(Exception):
+    """Строка не записана: пакет не прошёл после повторов или истекло ожидание."""
+
+
+class WriteTicket:
+    """Квитанция строки в очереди: id в БД после записи или ошибка."""
+
+    __slots__ = ('row', 'id', 'error', 'done', '_event')
+
+    def __init__(self, row, event):
+        self.row = row
+        self.id = None
+        self.error = None
+        self.done = False
+        self._event = event
+
+    def resolve(self, row_id=None, error=None):
+        self.id = row_id
+        self.error = error
+        self.done = True
+        self._event.set()
+
+    def wait(self, timeout):
+        """Дождаться записи; id строки или WriteError."""
+        if not self.done and not self._event.wait(timeout):
+            raise WriteError('Сообщение не сохранено за отведённое время')
+        if self.error is not None:
+            raise WriteError(self.error)
+        return self.id
+
+
+class MessageWriter:
+    """Пакетная запись строк модели (по умолчанию Message) в фоне."""
+
+    # Пауза проверки места в переполненной очереди
+    poll_interval = 0.005
+
+    def __init__(self, app, db, model, batch_size=200, flush_interval=0,
+                 max_pending=10000, put_timeout=0.5, retries=3, retry_delay=0.05,
+                 dead_letter_path=None, start_background_task=None, sleep=None,
+                 create_event=None):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.dead_letter_path = dead_letter_path
+        self._start_background_task = start_background_task or self._start_thread
+        self._sleep = sleep or time.sleep
+        self._create_event = create_event or threading.Event
+        self._wakeup = None
+        self._buffer = deque()
+        self._running = False
+        self._task = None
+        self._atexit_registered = False
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'rejected': 0,
+            'failed': 0,
+            'retried': 0,
+        }
+
+    def init_app(self, app, batch_size=None, flush_interval=None, max_pending=None,
+                 retries=None, retry_delay=None, dead_letter_path=None,
+                 start_background_task=None, sleep=None, create_event=None):
+        """Привязать к приложению из create_app; None оставляет текущее значение."""
+        self.app = app
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if max_pending is not None:
+            self.max_pending = max_pending
+        if retries is not None:
+            self.retries = retries
+        if retry_delay is not None:
+            self.retry_delay = retry_delay
+        if dead_letter_path is not None:
+            self.dead_letter_path = dead_letter_path
+        if start_background_task is not None:
+            self._start_background_task = start_background_task
+        if sleep is not None:
+            self._sleep = sleep
+        if create_event is not None:
+            self._create_event = create_event
+
+    @staticmethod
+    def _start_thread(target):
+        thread = threading.Thread(target=target, name='message-writer', daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._wakeup = self._create_event()
+        self._task = self._start_background_task(self._run)
+        if not self._atexit_registered:
+            atexit.register(self.close)
+            self._atexit_registered = True
+
+    def put(self, row):
+        """Поставить строку в очередь; квитанция или отказ при переполнении."""
+        if not self._running:
+            self.start()
+
+        if len(self._buffer) >= self.max_pending:
+            deadline = time.monotonic() + self.put_timeout
+            while len(self._buffer) >= self.max_pending:
+                if time.monotonic() >= deadline:
+                    self.stats['rejected'] += 1
+                    raise QueueFullError(
+                        f'Очередь записи сообщений заполнена ({self.max_pending})'
+                    )
+                self._sleep(self.poll_interval)
+
+        ticket = WriteTicket(row, self._create_event())
+        self._buffer.append(ticket)
+        self.stats['enqueued'] += 1
+        self._wakeup.set()
+        return ticket
+
+    def _run(self):
+        wakeup = self._wakeup
+        while self._running:
+            wakeup.wait(1.0)
+            # Сброс до проверки очереди: строка, добавленная после него, разбудит снова
+            wakeup.clear()
+            if not self._buffer or not self._running:
+                continue
+            if self.flush_interval and len(self._buffer) < self.batch_size:
+                self._sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Записать всё накопленное пакетами по batch_size строк."""
+        written = 0
+        while self._buffer:
+            count = min(self.batch_size, len(self._buffer))
+            batch = [self._buffer.popleft() for _ in range(count)]
+            written += self._write(batch)
+        return written
+
+    def _write(self, batch):
+        """Записать пакет квитанций; число записанных строк."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats['retried'] += len(batch)
+                self._sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                ids = self._insert([ticket.row for ticket in batch])
+            except Exception as e:
+                error = e
+                continue
+            for ticket, row_id in zip(batch, ids):
+                ticket.resolve(row_id)
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+            return len(batch)
+
+        if len(batch) > 1:
+            # Пакет не проходит целиком: половины пишутся отдельно, пока
+            # не останутся строки, которые не записываются сами по себе
+            middle = len(batch) // 2
+            return self._write(batch[:middle]) + self._write(batch[middle:])
+
+        self._dead_letter(batch[0], error)
+        return 0
+
+    def _insert(self, rows):
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                table = self.model.__table__
+                dialect = session.get_bind().dialect
+                if dialect.insert_executemany_returning_sort_by_parameter_order:
+                    ids = session.execute(
+                        insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+                    ).scalars().all()
+                elif dialect.name == 'sqlite':
+                    # SQLite до 3.35 без RETURNING: один executemany под блокировкой
+                    # записи, поэтому id пакета идут подряд и заканчиваются max(id)
+                    write_lock(session)
+                    session.execute(insert(table), rows)
+                    last = session.scalar(select(func.max(table.c.id)))
+                    ids = list(range(last - len(rows) + 1, last + 1))
+                else:
+                    # Автоинкремент других СУБД без RETURNING не обязан выдавать
+                    # пакету id подряд - id берутся по строке
+                    ids = [session.execute(insert(table), row).inserted_primary_key[0] for row in rows]
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        return ids
+
+    def _dead_letter(self, ticket, error):
+        self.stats['failed'] += 1
+        logger.error('Сообщение не сохранено после %d попыток: %s', self.retries + 1, error)
+        ticket.resolve(error=f'Сообщение не сохранено: {error.__class__.__name__}')
+        if not self.dead_letter_path:
+            return
+        record = {'failed_at': time.time(), 'error': repr(error), 'row': ticket.row}
+        try:
+            directory = os.path.dirname(self.dead_letter_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        except OSError:
+            logger.exception('Не удалось дописать сообщение в %s', self.dead_letter_path)
+
+    def close(self):
+        """Остановить фоновую задачу и дописать остаток очереди."""
+        if self._running:
+            self._running = False
+            self._wakeup.set()
+            if self._task is not None:
+                self._task.join()
+                self._task = None
+        self.flush()
@@ -0,0 +1,24 @@
+"""Исходная схема (до индексов и агрегатов)
+
+Пустая ревизия-метка: таблицы исходной версии создавались db.create_all().
+Существующую базу помечают ей (flask db stamp 0001_baseline) и доводят
+до актуальной схемы через flask db upgrade.
+
+Revision ID: 0001_baseline
+Revises: 
+Create Date: 2026-10-18 05:27:33.013119
+
+"""
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
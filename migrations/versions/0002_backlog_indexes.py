@@ -0,0 +1,148 @@
+"""Индексы горячих запросов, агрегаты оценок и длинный password_hash
+
+- таблицы grade_stat и class_grade_stat (заполняются flask rebuild-grade-stats);
+- составные индексы сообщений, платежей, событий, расписания и связей;
+- уникальный индекс оценки (ученик, предмет, дата) для журнала;
+- user.password_hash расширен до 255 символов под хеши scrypt/argon2.
+
+Revision ID: 0002_backlog_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18 05:27:35.299795
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_backlog_indexes'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+# Как в модели: is_pinned = 1 в SQLite и is_pinned = true в PostgreSQL
+PINNED = sa.column('is_pinned') == sa.true()
+
+
+def check_grade_duplicates():
+    """Уникальный индекс не создастся, пока в журнале есть дубли ячеек."""
+    if op.get_context().as_sql:
+        return
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT student_id, subject_id, date, COUNT(*) FROM grade '
+        'GROUP BY student_id, subject_id, date HAVING COUNT(*) > 1 LIMIT 5'
+    )).fetchall()
+    if duplicates:
+        sample = ', '.join(f'{s}/{p}/{d} x{n}' for s, p, d, n in duplicates)
+        raise RuntimeError(
+            'В таблице grade есть несколько оценок на одну ячейку журнала '
+            f'(ученик/предмет/дата): {sample}. Оставьте по одной и повторите.'
+        )
+
+
+def upgrade():
+    check_grade_duplicates()
+
+    op.create_table('class_grade_stat',
+    sa.Column('class_id', sa.Integer(), nullable=False),
+    sa.Column('subject_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('total_sq', sa.Integer(), nullable=False),
+    sa.Column('h1', sa.Integer(), nullable=False),
+    sa.Column('h2', sa.Integer(), nullable=False),
+    sa.Column('h3', sa.Integer(), nullable=False),
+    sa.Column('h4', sa.Integer(), nullable=False),
+    sa.Column('h5', sa.Integer(), nullable=False),
+    sa.Column('h6', sa.Integer(), nullable=False),
+    sa.Column('h7', sa.Integer(), nullable=False),
+    sa.Column('h8', sa.Integer(), nullable=False),
+    sa.Column('h9', sa.Integer(), nullable=False),
+    sa.Column('h10', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['class_id'], ['class.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subject.id'], ),
+    sa.PrimaryKeyConstraint('class_id', 'subject_id')
+    )
+    op.create_table('grade_stat',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('subject_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('total_sq', sa.Integer(), nullable=False),
+    sa.Column('h1', sa.Integer(), nullable=False),
+    sa.Column('h2', sa.Integer(), nullable=False),
+    sa.Column('h3', sa.Integer(), nullable=False),
+    sa.Column('h4', sa.Integer(), nullable=False),
+    sa.Column('h5', sa.Integer(), nullable=False),
+    sa.Column('h6', sa.Integer(), nullable=False),
+    sa.Column('h7', sa.Integer(), nullable=False),
+    sa.Column('h8', sa.Integer(), nullable=False),
+    sa.Column('h9', sa.Integer(), nullable=False),
+    sa.Column('h10', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['student_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['subject_id'], ['subject.id'], ),
+    sa.PrimaryKeyConstraint('student_id', 'subject_id')
+    )
+    with op.batch_alter_table('chat_participant', schema=None) as batch_op:
+        batch_op.create_index('ix_chat_participant_user_id', ['user_id'], unique=False)
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.create_index('ix_event_school_start', ['school_id', 'start_date', 'end_date'], unique=False)
+
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.create_index('ix_grade_student_subject_date', ['student_id', 'subject_id', 'date'], unique=True)
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_chat_pinned', ['chat_id', 'timestamp', 'id'], unique=False, sqlite_where=PINNED, postgresql_where=PINNED)
+        batch_op.create_index('ix_message_chat_timestamp_id', ['chat_id', 'timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_status_due_date', ['status', 'due_date'], unique=False)
+
+    with op.batch_alter_table('schedule', schema=None) as batch_op:
+        batch_op.create_index('ix_schedule_school_day', ['school_id', 'day_of_week', 'start_time'], unique=False)
+
+    with op.batch_alter_table('student_subject', schema=None) as batch_op:
+        batch_op.create_index('ix_student_subject_subject_student', ['subject_id', 'student_id'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.VARCHAR(length=120),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+        batch_op.create_index('ix_user_school_id', ['school_id'], unique=False)
+
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_school_id')
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=255),
+               type_=sa.VARCHAR(length=120),
+               existing_nullable=False)
+
+    with op.batch_alter_table('student_subject', schema=None) as batch_op:
+        batch_op.drop_index('ix_student_subject_subject_student')
+
+    with op.batch_alter_table('schedule', schema=None) as batch_op:
+        batch_op.drop_index('ix_schedule_school_day')
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_status_due_date')
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_chat_timestamp_id')
+        batch_op.drop_index('ix_message_chat_pinned', sqlite_where=PINNED, postgresql_where=PINNED)
+
+    with op.batch_alter_table('grade', schema=None) as batch_op:
+        batch_op.drop_index('ix_grade_student_subject_date')
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_school_start')
+
+    with op.batch_alter_table('chat_participant', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_participant_user_id')
+
+    op.drop_table('grade_stat')
+    op.drop_table('class_grade_stat')
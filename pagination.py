@@ -0,0 +1,94 @@
+"""
+Keyset-пагинация (постраничная выборка по курсору).
+
+Вместо OFFSET страница выбирается условием по упорядоченному набору
+колонок, например (timestamp, id) < (:ts, :id). При наличии составного
+индекса с тем же порядком колонок стоимость выборки страницы не зависит
+от того, насколько глубоко пролистан список.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(*values):
+    """Упаковать значения ключа в непрозрачную строку для клиента."""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Распаковать курсор; ValueError, если он повреждён или не той длины."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError('Некорректный курсор') from exc
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Некорректный курсор')
+
+    try:
+        return tuple(_decode_value(v) for v in values)
+    except (ValueError, TypeError) as exc:
+        raise ValueError('Некорректный курсор') from exc
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Размер страницы из параметра запроса с ограничением сверху."""
+    try:
+        size = int(value) if value is not None else default
+    except (TypeError, ValueError):
+        raise ValueError('Некорректный размер страницы')
+    if size < 1:
+        raise ValueError('Некорректный размер страницы')
+    return min(size, maximum)
+
+
+def keyset_page(query, columns, before=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Выбрать страницу запроса по ключу columns.
+
+    before/after - кортежи значений ключа (из decode_cursor). Без курсора
+    и с before возвращаются последние по ключу строки, с after - следующие.
+    Результат всегда упорядочен по возрастанию ключа.
+    Возвращает (rows, has_more).
+    """
+    key = tuple_(*columns)
+
+    if after is not None:
+        query = query.filter(key > tuple(after)).order_by(*[c.asc() for c in columns])
+    else:
+        if before is not None:
+            query = query.filter(key < tuple(before))
+        query = query.order_by(*[c.desc() for c in columns])
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if after is None:
+        rows.reverse()
+    return rows, has_more
@@ -0,0 +1,166 @@
+"""
+Хеширование паролей вне цикла обработки запросов.
+
+PBKDF2 и scrypt занимают процессор на сотни миллисекунд. Под eventlet
+такой вызов прямо в обработчике останавливает весь хаб: пока считается
+хеш, не обслуживаются ни HTTP-запросы, ни события Socket.IO. Поэтому хеш
+считается в ограниченном пуле потоков ОС, подходящем режиму async
+(eventlet.tpool, пул потоков хаба gevent или ThreadPoolExecutor в режиме
+threading). hashlib отпускает GIL, так что хаб в это время работает.
+
+Одновременных попыток с одного IP и для одного имени пользователя не
+больше заданного, всего попыток в работе - не больше max_pending; сверх
+лимита запрос сразу получает отказ, а не ждёт в очереди. Хеш, посчитанный
+со старыми параметрами, при успешном входе пересчитывается текущим методом.
+"""
+
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashLimitError(Exception):
+    """Превышен лимит одновременных попыток (всего, с IP или для имени)."""
+
+
+def hash_params(method):
+    """Метод с параметрами в том виде, в каком werkzeug записывает его в хеш."""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name == 'scrypt':
+        return ':'.join(['scrypt'] + (args or ['32768', '8', '1']))
+    return method
+
+
+class PasswordHasher:
+    """Проверка и создание хешей паролей в пуле из workers потоков.
+
+    workers=0 - считать прямо в вызывающем потоке (как раньше).
+    """
+
+    def __init__(self, method='pbkdf2', workers=4, max_pending=64, per_ip=4, per_username=2):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.per_ip = per_ip
+        self.per_username = per_username
+        self.async_mode = None
+        self._runner = None
+        self._pending = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self.stats = {'verified': 0, 'hashed': 0, 'rehashed': 0, 'rejected': 0}
+
+    def init_app(self, async_mode=None, method=None, workers=None, max_pending=None,
+                 per_ip=None, per_username=None):
+        """Настроить из create_app; None оставляет текущее значение.
+
+        Пул создаётся при первом хешировании, чтобы не замедлять старт воркера.
+        """
+        self.async_mode = async_mode
+        if method is not None:
+            self.method = method
+        if workers is not None:
+            self.workers = workers
+        if max_pending is not None:
+            self.max_pending = max_pending
+        if per_ip is not None:
+            self.per_ip = per_ip
+        if per_username is not None:
+            self.per_username = per_username
+        self._runner = None
+
+    def _create_runner(self):
+        """(run, map) для режима async: один вызов и раздача списка по пулу."""
+        if self.async_mode == 'eventlet':
+            from eventlet import GreenPool, tpool
+            tpool.set_num_threads(self.workers)
+            pool = GreenPool(self.workers)
+            return tpool.execute, lambda func, items: pool.imap(
+                lambda item: tpool.execute(func, item), items)
+        if self.async_mode in ('gevent', 'gevent_uwsgi'):
+            import gevent
+            return (lambda func, *args: gevent.get_hub().threadpool.apply(func, args),
+                    lambda func, items: gevent.get_hub().threadpool.map(func, items))
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        return lambda func, *args: executor.submit(func, *args).result(), executor.map
+
+    def _get_runner(self):
+        if self._runner is None:
+            with self._lock:
+                if self._runner is None:
+                    self._runner = self._create_runner()
+        return self._runner
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        return self._get_runner()[0](func, *args)
+
+    def _map(self, func, items):
+        if not self.workers:
+            return [func(item) for item in items]
+        return list(self._get_runner()[1](func, items))
+
+    @contextmanager
+    def limit(self, ip=None, username=None):
+        """Занять слот попытки для ip и username; HashLimitError сверх лимитов."""
+        keys = []
+        if ip:
+            keys.append((('ip', ip), self.per_ip))
+        if username:
+            keys.append((('user', username), self.per_username))
+
+        with self._lock:
+            if self._pending >= self.max_pending or any(
+                    limit and self._active.get(key, 0) >= limit for key, limit in keys):
+                self.stats['rejected'] += 1
+                raise HashLimitError('Слишком много одновременных попыток')
+            self._pending += 1
+            for key, _ in keys:
+                self._active[key] = self._active.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+                for key, _ in keys:
+                    if self._active[key] > 1:
+                        self._active[key] -= 1
+                    else:
+                        del self._active[key]
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != hash_params(self.method)
+
+    def hash(self, password):
+        self.stats['hashed'] += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """Хеши списка паролей, посчитанные параллельно во всех потоках пула."""
+        self.stats['hashed'] += len(passwords)
+        return self._map(functools.partial(generate_password_hash, method=self.method), passwords)
+
+    def verify(self, pwhash, password):
+        """Проверить пароль; (True, новый хеш или None) или (False, None).
+
+        Новый хеш возвращается, если pwhash посчитан не текущим методом.
+        """
+        self.stats['verified'] += 1
+        if not self._run(check_password_hash, pwhash, password):
+            return False, None
+        if not self.needs_rehash(pwhash):
+            return True, None
+        self.stats['rehashed'] += 1
+        return True, self._run(generate_password_hash, password, self.method)
@@ -0,0 +1,369 @@
+"""
+Присутствие в чате: кто онлайн и кто в какой комнате, в памяти или в Redis.
+"""
+
+import logging
+import threading
+import time
+
+from user_cache import LocalCacheBackend
+
+logger = logging.getLogger(__name__)
+
+
+def school_room(school_id):
+    return f'school:{school_id}'
+
+
+class LocalPresenceBackend:
+    """Индексы присутствия в памяти процесса."""
+
+    def __init__(self):
+        self._user_sids = {}
+        self._sid_user = {}
+        self._sid_rooms = {}
+        self._rooms = {}
+        self._seen = {}
+        self._user_seen = {}
+        self._lock = threading.Lock()
+
+    def add(self, sid, user_id, now):
+        """Зарегистрировать подключение; True, если пользователь только что появился."""
+        with self._lock:
+            if sid in self._sid_user:
+                return False
+            sids = self._user_sids.setdefault(user_id, set())
+            sids.add(sid)
+            self._sid_user[sid] = user_id
+            self._sid_rooms[sid] = set()
+            self._seen[sid] = now
+            self._user_seen[user_id] = now
+            return len(sids) == 1
+
+    def remove(self, sid, now):
+        """Удалить подключение из всех индексов; (user_id, комнаты, ушёл ли пользователь)."""
+        with self._lock:
+            user_id = self._sid_user.pop(sid, None)
+            if user_id is None:
+                return None
+            rooms = self._sid_rooms.pop(sid, set())
+            for room in rooms:
+                self._exit(room, user_id)
+            self._seen.pop(sid, None)
+            sids = self._user_sids[user_id]
+            sids.discard(sid)
+            if not sids:
+                del self._user_sids[user_id]
+            self._user_seen[user_id] = now
+            return user_id, rooms, not sids
+
+    def enter(self, sid, room):
+        with self._lock:
+            user_id = self._sid_user.get(sid)
+            rooms = self._sid_rooms.get(sid)
+            if user_id is None or room in rooms:
+                return False
+            rooms.add(room)
+            members = self._rooms.setdefault(room, {})
+            members[user_id] = members.get(user_id, 0) + 1
+            return True
+
+    def exit(self, sid, room):
+        with self._lock:
+            rooms = self._sid_rooms.get(sid)
+            if rooms is None or room not in rooms:
+                return False
+            rooms.discard(room)
+            self._exit(room, self._sid_user[sid])
+            return True
+
+    def _exit(self, room, user_id):
+        members = self._rooms[room]
+        if members[user_id] > 1:
+            members[user_id] -= 1
+        else:
+            del members[user_id]
+            if not members:
+                del self._rooms[room]
+
+    def touch(self, sid, now):
+        """Отметить живость подключения; False, если sid неизвестен."""
+        with self._lock:
+            user_id = self._sid_user.get(sid)
+            if user_id is None:
+                return False
+            self._seen[sid] = now
+            self._user_seen[user_id] = now
+            return True
+
+    def expired(self, before):
+        with self._lock:
+            return [sid for sid, seen in self._seen.items() if seen < before]
+
+    def room_count(self, room):
+        return len(self._rooms.get(room, ()))
+
+    def room_members(self, room):
+        return set(self._rooms.get(room, ()))
+
+    def rooms(self, sid):
+        return set(self._sid_rooms.get(sid, ()))
+
+    def is_online(self, user_id):
+        return user_id in self._user_sids
+
+    def last_seen(self, user_id):
+        return self._user_seen.get(user_id)
+
+    def counts(self):
+        return {'connections': len(self._sid_user), 'users': len(self._user_sids)}
+
+
+# Уменьшить счётчик пользователя в комнате и удалить поле, когда он дошёл до нуля
+_DECREMENT = """
+local n = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if n <= 0 then redis.call('HDEL', KEYS[1], ARGV[1]) end
+return n
+"""
+
+
+class RedisPresenceBackend:
+    """Индексы присутствия в Redis; без Redis операции пропускаются."""
+
+    def __init__(self, url, prefix='eduverse:presence:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('Для присутствия в Redis установите пакет redis') from exc
+        self._errors = redis.RedisError
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._decrement = self.client.register_script(_DECREMENT)
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    def _call(self, default, func, *args):
+        try:
+            return func(*args)
+        except self._errors:
+            logger.warning('Redis недоступен, операция присутствия пропущена', exc_info=True)
+            return default
+
+    def add(self, sid, user_id, now):
+        def add():
+            pipe = self.client.pipeline()
+            pipe.set(self._key('sid', sid), user_id)
+            pipe.sadd(self._key('user', user_id), sid)
+            pipe.scard(self._key('user', user_id))
+            pipe.zadd(self._key('seen'), {sid: now})
+            pipe.hset(self._key('user_seen'), user_id, now)
+            pipe.sadd(self._key('online'), user_id)
+            _, added, count, *_ = pipe.execute()
+            return bool(added) and count == 1
+        return self._call(False, add)
+
+    def remove(self, sid, now):
+        def remove():
+            user_id = self.client.get(self._key('sid', sid))
+            if user_id is None:
+                return None
+            user_id = int(user_id)
+            rooms = self.client.smembers(self._key('sid', sid, 'rooms'))
+            for room in rooms:
+                self._decrement(keys=[self._key('room', room)], args=[user_id])
+            pipe = self.client.pipeline()
+            pipe.delete(self._key('sid', sid), self._key('sid', sid, 'rooms'))
+            pipe.zrem(self._key('seen'), sid)
+            pipe.srem(self._key('user', user_id), sid)
+            pipe.scard(self._key('user', user_id))
+            pipe.hset(self._key('user_seen'), user_id, now)
+            *_, left, _ = pipe.execute()
+            if not left:
+                self.client.srem(self._key('online'), user_id)
+            return user_id, set(rooms), not left
+        return self._call(None, remove)
+
+    def enter(self, sid, room):
+        def enter():
+            user_id = self.client.get(self._key('sid', sid))
+            if user_id is None or not self.client.sadd(self._key('sid', sid, 'rooms'), room):
+                return False
+            self.client.hincrby(self._key('room', room), user_id, 1)
+            return True
+        return self._call(False, enter)
+
+    def exit(self, sid, room):
+        def exit():
+            user_id = self.client.get(self._key('sid', sid))
+            if user_id is None or not self.client.srem(self._key('sid', sid, 'rooms'), room):
+                return False
+            self._decrement(keys=[self._key('room', room)], args=[user_id])
+            return True
+        return self._call(False, exit)
+
+    def touch(self, sid, now):
+        def touch():
+            user_id = self.client.get(self._key('sid', sid))
+            if user_id is None:
+                return False
+            pipe = self.client.pipeline()
+            pipe.zadd(self._key('seen'), {sid: now})
+            pipe.hset(self._key('user_seen'), user_id, now)
+            pipe.execute()
+            return True
+        return self._call(False, touch)
+
+    def expired(self, before):
+        return self._call([], self.client.zrangebyscore, self._key('seen'), '-inf', f'({before}')
+
+    def room_count(self, room):
+        return self._call(0, self.client.hlen, self._key('room', room))
+
+    def room_members(self, room):
+        return {int(user_id) for user_id in self._call({}, self.client.hkeys, self._key('room', room))}
+
+    def rooms(self, sid):
+        return self._call(set(), self.client.smembers, self._key('sid', sid, 'rooms'))
+
+    def is_online(self, user_id):
+        return bool(self._call(False, self.client.sismember, self._key('online'), user_id))
+
+    def last_seen(self, user_id):
+        value = self._call(None, self.client.hget, self._key('user_seen'), user_id)
+        return float(value) if value is not None else None
+
+    def counts(self):
+        return {'connections': self._call(0, self.client.zcard, self._key('seen')),
+                'users': self._call(0, self.client.scard, self._key('online'))}
+
+
+def create_presence_backend(url=None, prefix='eduverse:presence:'):
+    """Бэкенд по URL: пусто или memory:// - память процесса, redis:// - Redis."""
+    if not url or url.startswith('memory:'):
+        return LocalPresenceBackend()
+    if url.startswith(('redis:', 'rediss:', 'unix:')):
+        return RedisPresenceBackend(url, prefix=prefix)
+    raise ValueError(f'Неизвестный бэкенд присутствия: {url}')
+
+
+class Presence:
+    """Присутствие пользователей и кэш участия в чатах (load_chat_ids)."""
+
+    def __init__(self, backend=None, memberships=None, load_chat_ids=None,
+                 heartbeat_timeout=90, sweep_interval=30,
+                 start_background_task=None, sleep=None, clock=time.time):
+        self.backend = backend if backend is not None else LocalPresenceBackend()
+        self.memberships = memberships if memberships is not None else LocalCacheBackend(ttl=60)
+        self.load_chat_ids = load_chat_ids
+        self.heartbeat_timeout = heartbeat_timeout
+        self.sweep_interval = sweep_interval
+        self._start_background_task = start_background_task
+        self._sleep = sleep or time.sleep
+        self._clock = clock
+        self._task = None
+        self.stats = {'joins': 0, 'rejected': 0, 'membership_hits': 0,
+                      'membership_misses': 0, 'swept': 0}
+
+    def init_app(self, backend=None, memberships=None, heartbeat_timeout=None,
+                 sweep_interval=None, start_background_task=None, sleep=None):
+        """Настроить из create_app; None оставляет текущее значение."""
+        if backend is not None:
+            self.backend = backend
+        if memberships is not None:
+            self.memberships = memberships
+        if heartbeat_timeout is not None:
+            self.heartbeat_timeout = heartbeat_timeout
+        if sweep_interval is not None:
+            self.sweep_interval = sweep_interval
+        if start_background_task is not None:
+            self._start_background_task = start_background_task
+        if sleep is not None:
+            self._sleep = sleep
+
+    def connect(self, sid, user_id, school_id=None):
+        """Подключение пользователя; True, если до этого он был офлайн."""
+        if self._task is None and self._start_background_task is not None and self.sweep_interval:
+            self._task = self._start_background_task(self._sweep_loop)
+        came_online = self.backend.add(sid, user_id, self._clock())
+        if school_id is not None:
+            self.backend.enter(sid, school_room(school_id))
+        return came_online
+
+    def disconnect(self, sid):
+        """Отключение; (user_id, ушёл ли пользователь офлайн) или None для неизвестного sid."""
+        removed = self.backend.remove(sid, self._clock())
+        if removed is None:
+            return None
+        user_id, _, went_offline = removed
+        return user_id, went_offline
+
+    def chat_ids(self, user_id):
+        """Чаты пользователя из кэша участия (запрос к БД только при промахе)."""
+        chat_ids = self.memberships.get(user_id)
+        if chat_ids is not None:
+            self.stats['membership_hits'] += 1
+            return chat_ids
+        self.stats['membership_misses'] += 1
+        version = self.memberships.version(user_id)
+        chat_ids = frozenset(self.load_chat_ids(user_id))
+        self.memberships.set(user_id, chat_ids, version=version)
+        return chat_ids
+
+    def can_join(self, user_id, chat_id):
+        allowed = chat_id in self.chat_ids(user_id)
+        if not allowed:
+            self.stats['rejected'] += 1
+        return allowed
+
+    def invalidate_memberships(self, user_id):
+        self.memberships.invalidate(user_id)
+
+    def join(self, sid, room):
+        self.stats['joins'] += 1
+        self.backend.touch(sid, self._clock())
+        return self.backend.enter(sid, str(room))
+
+    def leave(self, sid, room):
+        return self.backend.exit(sid, str(room))
+
+    def heartbeat(self, sid):
+        """Отметить живость; False, если sid неизвестен (например, удалён sweep)."""
+        return self.backend.touch(sid, self._clock())
+
+    def rooms(self, sid):
+        return self.backend.rooms(sid)
+
+    def online_in_room(self, room):
+        return self.backend.room_count(str(room))
+
+    def online_in_school(self, school_id):
+        return self.backend.room_count(school_room(school_id))
+
+    def members_online(self, room):
+        return self.backend.room_members(str(room))
+
+    def is_online(self, user_id):
+        return self.backend.is_online(user_id)
+
+    def last_seen(self, user_id):
+        return self.backend.last_seen(user_id)
+
+    def counts(self):
+        return self.backend.counts()
+
+    def sweep(self):
+        """Удалить подключения без heartbeat дольше heartbeat_timeout."""
+        expired = self.backend.expired(self._clock() - self.heartbeat_timeout)
+        for sid in expired:
+            self.backend.remove(sid, self._clock())
+        self.stats['swept'] += len(expired)
+        return expired
+
+    def _sweep_loop(self):
+        while True:
+            self._sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('Не удалось удалить устаревшие подключения')
@@ -0,0 +1,276 @@
+"""
+Потоковая выгрузка отчётов в CSV и XLSX и фоновые выгрузки в файлы.
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+CHUNK_ROWS = 1000
+# Управляющие символы недопустимы в XML листа
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# С этих символов табличный редактор начинает формулу (CSV-инъекция)
+_FORMULA_START = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_text(value):
+    """Текст ячейки CSV; строки, похожие на формулу, начинаются с апострофа."""
+    text = _text(value)
+    if isinstance(value, str) and text.startswith(_FORMULA_START):
+        return "'" + text
+    return text
+
+
+def iter_csv(header, rows, chunk_rows=CHUNK_ROWS):
+    """CSV в UTF-8 с BOM (его ждёт Excel) кусками по chunk_rows строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 0
+    first = True
+    for row in rows:
+        writer.writerow([_csv_text(value) for value in row])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode('utf-8-sig' if first else 'utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending, first = 0, False
+    yield buffer.getvalue().encode('utf-8-sig' if first else 'utf-8')
+
+
+class _Sink:
+    """Буфер без seek: zipfile пишет в него, писатель забирает готовые байты."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _cell(value):
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    if value is None:
+        return '<c/>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_ILLEGAL.sub("", _text(value)))}</t></is></c>'
+
+
+def _row(values):
+    return '<row>' + ''.join(_cell(value) for value in values) + '</row>'
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+
+def iter_xlsx(header, rows, chunk_rows=CHUNK_ROWS, sheet='Отчёт'):
+    """Книга XLSX из одного листа кусками по мере записи chunk_rows строк."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as part:
+            part.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _row(header)).encode())
+            batch = []
+            for row in rows:
+                batch.append(_row(row))
+                if len(batch) >= chunk_rows:
+                    part.write(''.join(batch).encode())
+                    batch = []
+                    data = sink.drain()
+                    if data:
+                        yield data
+            part.write((''.join(batch) + '</sheetData></worksheet>').encode())
+    yield sink.drain()
+
+
+def iter_report(fmt, header, rows, chunk_rows=CHUNK_ROWS):
+    if fmt == 'csv':
+        return iter_csv(header, rows, chunk_rows)
+    if fmt == 'xlsx':
+        return iter_xlsx(header, rows, chunk_rows)
+    raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+class ExportJobs:
+    """Фоновые выгрузки в файлы каталога directory со статусом в JSON рядом."""
+
+    def __init__(self, app=None, directory=None, ttl=86400, progress_every=5000,
+                 start_background_task=None, sleep=None):
+        self.app = app
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'eduverse-exports')
+        self.ttl = ttl
+        self.progress_every = progress_every
+        self._start_background_task = start_background_task or self._start_thread
+        self._sleep = sleep or time.sleep
+
+    def init_app(self, app, directory=None, ttl=None, start_background_task=None, sleep=None):
+        """Привязать к приложению из create_app; None оставляет текущее значение."""
+        self.app = app
+        if directory is not None:
+            self.directory = directory
+        if ttl is not None:
+            self.ttl = ttl
+        if start_background_task is not None:
+            self._start_background_task = start_background_task
+        if sleep is not None:
+            self._sleep = sleep
+
+    @staticmethod
+    def _start_thread(target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def _path(self, job_id, suffix):
+        # job_id приходит из URL: только hex из uuid4
+        if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.directory, f'{job_id}.{suffix}')
+
+    def _save(self, job_id, state):
+        path = self._path(job_id, 'json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as stream:
+            json.dump(state, stream, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    def status(self, job_id):
+        """Состояние задачи или None, если её нет (или срок хранения истёк)."""
+        try:
+            with open(self._path(job_id, 'json'), encoding='utf-8') as stream:
+                return json.load(stream)
+        except (KeyError, OSError, ValueError):
+            return None
+
+    def file_path(self, job_id):
+        state = self.status(job_id)
+        return self._path(job_id, state['format']) if state and state['status'] == 'done' else None
+
+    def cleanup(self, now=None):
+        """Удалить файлы выгрузок старше ttl."""
+        now = now or time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def start(self, owner_id, filename, fmt, header, rows_factory, total=None):
+        """Запустить выгрузку; rows_factory() вызывается в фоне в контексте приложения."""
+        if fmt not in FORMATS:
+            raise ValueError(f'Неизвестный формат: {fmt}')
+        os.makedirs(self.directory, exist_ok=True)
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        state = {
+            'id': job_id, 'owner_id': owner_id, 'filename': filename, 'format': fmt,
+            'status': 'pending', 'rows': 0, 'total': total, 'error': None,
+            'created_at': datetime.utcnow().isoformat(), 'finished_at': None,
+        }
+        self._save(job_id, state)
+        self._start_background_task(self._run, job_id, state, header, rows_factory)
+        return state
+
+    def _run(self, job_id, state, header, rows_factory):
+        path = self._path(job_id, state['format'])
+
+        def counted(rows):
+            for row in rows:
+                yield row
+                state['rows'] += 1
+                if state['rows'] % self.progress_every == 0:
+                    self._save(job_id, state)
+                    self._sleep(0)  # под eventlet - уступить другим задачам
+
+        with self.app.app_context():
+            state['status'] = 'running'
+            self._save(job_id, state)
+            try:
+                with open(path + '.part', 'wb') as stream:
+                    for chunk in iter_report(state['format'], header, counted(rows_factory())):
+                        stream.write(chunk)
+                os.replace(path + '.part', path)
+                state['status'] = 'done'
+            except Exception as e:
+                logger.exception('Выгрузка %s не удалась', job_id)
+                state['status'] = 'failed'
+                state['error'] = str(e)
+                try:
+                    os.remove(path + '.part')
+                except OSError:
+                    pass
+            state['finished_at'] = datetime.utcnow().isoformat()
+            self._save(job_id, state)
@@ -0,0 +1,178 @@
+"""
+Кэш готовых HTTP-ответов с номером поколения данных.
+
+Для каждого имени (например, 'schools') хранится счётчик поколений. Его
+увеличивают при изменении данных (события моделей, импорт), а ответ
+строится один раз на поколение: JSON сериализуется в байты, сразу
+сжимается gzip и brotli (если установлен пакет brotli), считается
+сильный ETag. Запросы с совпадающим If-None-Match получают 304 без тела.
+
+Счётчик хранится в Redis - тогда изменение в одном воркере сбрасывает кэш
+во всех остальных - или в памяти процесса. Во втором случае bump() виден
+только своему воркеру, поэтому поколение в памяти живёт не дольше ttl
+секунд: другие воркеры отдают устаревшие данные не дольше этого срока.
+ETag считается по содержимому ответа и одинаков во всех воркерах.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from flask import Response, jsonify, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+class LocalGenerations:
+    """Счётчики поколений в памяти процесса; ttl - срок жизни поколения, сек (None - бессрочно)."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _next(self, name):
+        value = self._values.get(name, (0, None))[0] + 1
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        self._values[name] = (value, expires)
+        return value
+
+    def get(self, name):
+        value, expires = self._values.get(name, (0, None))
+        if self.ttl and (expires is None or expires <= time.monotonic()):
+            # Изменения в других воркерах сюда не доходят: поколение устаревает само
+            with self._lock:
+                value, expires = self._values.get(name, (0, None))
+                if expires is None or expires <= time.monotonic():
+                    value = self._next(name)
+        return value
+
+    def bump(self, name):
+        with self._lock:
+            return self._next(name)
+
+
+class RedisGenerations:
+    """Счётчики поколений в Redis, общие для всех воркеров (нужен пакет redis)."""
+
+    def __init__(self, url, prefix='eduverse:generation:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('Для счётчиков в Redis установите пакет redis') from exc
+        self._errors = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, name):
+        try:
+            value = self.client.get(self.prefix + name)
+        except self._errors:
+            logger.warning('Redis недоступен, ответ строится без кэша', exc_info=True)
+            return None
+        return int(value or 0)
+
+    def bump(self, name):
+        try:
+            return self.client.incr(self.prefix + name)
+        except self._errors:
+            logger.warning('Redis недоступен, поколение %s не увеличено', name, exc_info=True)
+            return None
+
+
+def create_generations(url=None, prefix='eduverse:generation:', local_ttl=None):
+    """Хранилище по URL: пусто или memory:// - память процесса (поколение живёт local_ttl сек), redis:// - Redis."""
+    if not url or url.startswith('memory:'):
+        return LocalGenerations(ttl=local_ttl)
+    if url.startswith(('redis:', 'rediss:', 'unix:')):
+        return RedisGenerations(url, prefix=prefix)
+    raise ValueError(f'Неизвестное хранилище поколений: {url}')
+
+
+class CachedBody:
+    """Готовое тело ответа одного поколения во всех кодировках."""
+
+    __slots__ = ('generation', 'variants', 'etags')
+
+    def __init__(self, generation, body, min_compress_size):
+        self.generation = generation
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        self.variants = {'identity': body}
+        if len(body) >= min_compress_size:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=6)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(body)
+        # Разные кодировки - разные представления, поэтому и ETag у них разный.
+        # Номер поколения в ETag не входит: у воркеров он свой, а тело одно
+        self.etags = {encoding: f'"{digest}-{encoding}"' for encoding in self.variants}
+
+
+class ResponseCache:
+    def __init__(self, generations=None, min_compress_size=512, enabled=True):
+        self.generations = generations or LocalGenerations()
+        self.min_compress_size = min_compress_size
+        self.enabled = enabled
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    def bump(self, name):
+        """Данные name изменились: следующий запрос построит ответ заново."""
+        self.generations.bump(name)
+        self._entries.pop(name, None)
+
+    def _entry(self, name, build):
+        generation = self.generations.get(name)
+        if generation is None:
+            return None
+        entry = self._entries.get(name)
+        if entry is not None and entry.generation == generation:
+            self.stats['hits'] += 1
+            return entry
+
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        # Один поток строит ответ, остальные ждут и берут готовый
+        with lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.generation == generation:
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+            body = json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            entry = self._entries[name] = CachedBody(generation, body, self.min_compress_size)
+            return entry
+
+    def respond(self, name, build):
+        """Ответ с JSON из build(), ETag и 304 для совпадающего If-None-Match."""
+        entry = self._entry(name, build) if self.enabled else None
+        if entry is None:
+            return jsonify(build())
+
+        # При равном q предпочитаем более плотное сжатие
+        encoding = request.accept_encodings.best_match(
+            [e for e in ENCODINGS if e in entry.variants], default='identity')
+        etag = entry.etags[encoding]
+        if request.if_none_match and any(request.if_none_match.contains_weak(tag.strip('"'))
+                                         for tag in entry.etags.values()):
+            self.stats['not_modified'] += 1
+            response = Response(status=304)
+        else:
+            response = Response(entry.variants[encoding], mimetype='application/json')
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,3 @@
+"""Роли пользователей: общие для app.py, app_simple.py и массового импорта."""
+
+ROLES = ('super_admin', 'project_admin', 'school_admin', 'teacher', 'student', 'parent')
@@ -6,7 +6,11 @@
 
 import os
 import sys
-from app import app, socketio
+from app import create_app, socketio
+
+# Схема БД создаётся заранее командой `flask init-db`, здесь только приложение.
+# Объект app нужен и для gunicorn: gunicorn -k eventlet -w 1 run:app
+app = create_app()
 
 if __name__ == '__main__':
     # Проверка переменных окружения
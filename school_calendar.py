@@ -0,0 +1,145 @@
+"""
+Календарь: события школы и уроки недельного расписания за период.
+
+Schedule хранит урок один раз на день недели, поэтому в даты он
+разворачивается только для запрошенного окна и целыми неделями: неделя
+класса или учителя (с понедельника) - список уроков с датами. Развёрнутые
+недели кэшируются по ключу (школа, поколение, вид, id, понедельник).
+Поколение расписания школы увеличивается при любом изменении её Schedule,
+поэтому устаревшие недели просто перестают читаться и вытесняются по LRU/TTL.
+На промахе расписание всех недостающих классов и учителей читается одним
+запросом и разворачивается сразу на все недели окна.
+
+Время уроков - локальное время школы, как в Schedule.
+"""
+
+from datetime import date, datetime, timedelta
+
+MAX_DAYS = 62
+
+
+class CalendarError(ValueError):
+    """Некорректный период календаря."""
+
+
+def generation_name(school_id):
+    """Имя счётчика поколений расписания школы."""
+    return f'schedule:{school_id}'
+
+
+def parse_range(start, end, max_days=MAX_DAYS):
+    """Период 'ГГГГ-ММ-ДД'..'ГГГГ-ММ-ДД' включительно -> (date, date)."""
+    try:
+        start, end = date.fromisoformat(start), date.fromisoformat(end)
+    except (TypeError, ValueError):
+        raise CalendarError('Укажите from и to в формате ГГГГ-ММ-ДД')
+    if end < start:
+        raise CalendarError('Дата to раньше from')
+    if (end - start).days >= max_days:
+        raise CalendarError(f'Период не длиннее {max_days} дней')
+    return start, end
+
+
+def week_starts(start, end):
+    """Понедельники недель, пересекающих период."""
+    monday = start - timedelta(days=start.weekday())
+    while monday <= end:
+        yield monday
+        monday += timedelta(days=7)
+
+
+def expand_week(monday, lessons):
+    """Уроки шаблона (строки Schedule) с датами недели monday, по времени."""
+    items = []
+    for lesson in lessons:
+        day = monday + timedelta(days=lesson.day_of_week)
+        items.append({
+            'type': 'lesson',
+            'schedule_id': lesson.id,
+            'date': day.isoformat(),
+            'start': datetime.combine(day, lesson.start_time).isoformat(),
+            'end': datetime.combine(day, lesson.end_time).isoformat(),
+            'subject_id': lesson.subject_id,
+            'subject': lesson.subject,
+            'class_id': lesson.class_id,
+            'class': lesson.class_name,
+            'teacher_id': lesson.teacher_id,
+            'room': lesson.room,
+        })
+    items.sort(key=lambda item: item['start'])
+    return items
+
+
+class ScheduleCalendar:
+    """Уроки классов и учителей школы за период с кэшем развёрнутых недель.
+
+    load_lessons(school_id, class_ids, teacher_ids) возвращает строки
+    Schedule школы этих классов или учителей с колонками id, day_of_week,
+    start_time, end_time, subject_id, subject, class_id, class_name,
+    teacher_id, room. cache - бэкенд из user_cache, generations - счётчики
+    поколений кэша ответов (общие для воркеров при Redis).
+    """
+
+    def __init__(self, load_lessons, cache=None, generations=None):
+        self.load_lessons = load_lessons
+        self.cache = cache
+        self.generations = generations
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def init_app(self, cache=None, generations=None):
+        if cache is not None:
+            self.cache = cache
+        if generations is not None:
+            self.generations = generations
+
+    def lessons(self, school_id, start, end, class_ids=(), teacher_ids=()):
+        """Уроки школы за [start, end] для классов и учителей, по времени начала."""
+        owners = [('class', class_id) for class_id in sorted(set(class_ids))]
+        owners += [('teacher', teacher_id) for teacher_id in sorted(set(teacher_ids))]
+        if not owners:
+            return []
+        mondays = list(week_starts(start, end))
+
+        # None - хранилище поколений недоступно: разворачиваем без кэша
+        generation = self.generations.get(generation_name(school_id)) if self.generations else 0
+        cache = self.cache if generation is not None else None
+
+        def key(kind, owner_id, monday):
+            return f'{school_id}:{generation}:{kind}:{owner_id}:{monday.isoformat()}'
+
+        weeks, missing = {}, {}
+        for owner in owners:
+            for monday in mondays:
+                week = cache.get(key(*owner, monday)) if cache is not None else None
+                if week is None:
+                    missing.setdefault(owner, []).append(monday)
+                else:
+                    weeks[owner, monday] = week
+        self.stats['hits'] += len(weeks)
+
+        if missing:
+            self.stats['misses'] += sum(map(len, missing.values()))
+            templates = {owner: [] for owner in missing}
+            for lesson in self.load_lessons(school_id,
+                                            [i for kind, i in missing if kind == 'class'],
+                                            [i for kind, i in missing if kind == 'teacher']):
+                for owner in (('class', lesson.class_id), ('teacher', lesson.teacher_id)):
+                    if owner in templates:
+                        templates[owner].append(lesson)
+            for owner, owner_mondays in missing.items():
+                for monday in owner_mondays:
+                    week = weeks[owner, monday] = expand_week(monday, templates[owner])
+                    if cache is not None:
+                        cache.set(key(*owner, monday), week)
+
+        # Урок, запрошенный и по классу, и по учителю, есть в двух неделях - берём один раз
+        first, last = start.isoformat(), end.isoformat()
+        seen, items = set(), []
+        for week in weeks.values():
+            for item in week:
+                marker = (item['schedule_id'], item['date'])
+                if first <= item['date'] <= last and marker not in seen:
+                    seen.add(marker)
+                    items.append(item)
+        items.sort(key=lambda item: (item['start'], item['schedule_id']))
+        return items
@@ -0,0 +1,279 @@
+"""
+Полнотекстовый поиск по сообщениям чата, событиям и предметам.
+
+SQLite: для каждой таблицы создаётся FTS5 с внешним содержимым
+(content='message' и т.д.), которую поддерживают триггеры. Поэтому в индекс
+попадают и строки, вставленные в обход ORM (пакетная запись сообщений,
+импорт). Столбец области видимости (chat_id, school_id) тоже индексируется,
+и ограничение по правам входит в MATCH, а не фильтрует результаты после
+ранжирования. Ранжирование - bm25.
+
+PostgreSQL: вычисляемая колонка search_vector (tsvector, GENERATED ...
+STORED, в моделях её нет) с GIN-индексом; PostgreSQL обновляет её сам,
+ранжирование - ts_rank. В остальных СУБД (и в SQLite без FTS5 или до
+создания индекса) поиск идёт через LIKE без ранжирования.
+
+Запрос пользователя разбивается на слова, все слова обязательны, последнее
+ищется по префиксу (поиск по мере набора). Ранжируются не больше
+max_candidates самых новых совпадений: иначе частое слово заставило бы
+считать ранг для сотен тысяч строк.
+"""
+
+import logging
+import re
+
+from sqlalchemy import and_, column, event, func, literal_column, or_, select, table, text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TOKENS = 8
+# Короче - префикс совпал бы с огромной частью словаря
+MIN_PREFIX = 2
+VECTOR_COLUMN = 'search_vector'
+
+
+class SearchError(ValueError):
+    """Некорректный поисковый запрос."""
+
+
+def parse_query(query):
+    """Слова запроса (не больше MAX_TOKENS); SearchError, если их нет."""
+    tokens = TOKEN_RE.findall((query or '').lower())[:MAX_TOKENS]
+    if not tokens:
+        raise SearchError('Пустой поисковый запрос')
+    return tokens
+
+
+class SearchDocument:
+    """Индексируемая таблица: текстовые колонки с весами и колонка области."""
+
+    def __init__(self, name, table, columns, scope, weights=None):
+        self.name = name
+        self.table = table
+        self.columns = tuple(columns)
+        self.scope = scope
+        self.weights = tuple(weights or (1.0,) * len(self.columns))
+        self.fts = f'{table.name}_fts'
+        self.index = f'ix_{table.name}_search'
+
+
+class SearchIndex:
+    """Реестр индексируемых таблиц, создание индексов и поиск."""
+
+    def __init__(self, text_config='russian', max_candidates=10000):
+        self.text_config = text_config
+        self.max_candidates = max_candidates
+        self.documents = {}
+        # Найденные таблицы FTS5: {(engine, name)}. Отсутствие не запоминается,
+        # чтобы индекс, созданный reindex-search, подхватился без перезапуска
+        self._fts_ready = set()
+        self._warned = set()
+
+    def init_app(self, text_config=None, max_candidates=None):
+        if max_candidates is not None:
+            self.max_candidates = max_candidates
+        if text_config is not None:
+            if not re.fullmatch(r'\w+', text_config):
+                raise ValueError(f'Некорректная конфигурация поиска: {text_config}')
+            self.text_config = text_config
+
+    def register(self, name, table, columns, scope, weights=None):
+        self.documents[name] = SearchDocument(name, table, columns, scope, weights)
+
+    def owns(self, object, name, type_):
+        """Объект схемы создан индексом поиска, а не моделями (для autogenerate)."""
+        for doc in self.documents.values():
+            if type_ == 'table' and (name == doc.fts or name.startswith(f'{doc.fts}_')):
+                return True
+            if type_ == 'index' and name == doc.index:
+                return True
+            if (type_ == 'column' and name == VECTOR_COLUMN
+                    and object.table.name == doc.table.name):
+                return True
+        return False
+
+    def install(self, metadata):
+        """Создавать и удалять индексы вместе с таблицами (create_all/drop_all)."""
+        def after_create(target, connection, tables=(), **kw):
+            names = {t.name for t in tables}
+            self.create(connection, [doc.name for doc in self.documents.values()
+                                     if not names or doc.table.name in names])
+
+        def before_drop(target, connection, **kw):
+            self.drop(connection)
+
+        event.listen(metadata, 'after_create', after_create)
+        event.listen(metadata, 'before_drop', before_drop)
+
+    def _selected(self, names):
+        if names is None:
+            return list(self.documents.values())
+        return [self.documents[name] for name in names]
+
+    def _tsvector(self, doc):
+        config = f"'{self.text_config}'::regconfig"
+        parts = []
+        for name, label in zip(doc.columns, 'ABCD'):
+            vector = f"to_tsvector({config}, coalesce({name}, ''))"
+            parts.append(f"setweight({vector}, '{label}')" if len(doc.columns) > 1 else vector)
+        return ' || '.join(parts)
+
+    def create(self, connection, names=None):
+        """Создать недостающие индексы (повторный вызов ничего не меняет)."""
+        dialect = connection.dialect.name
+        for doc in self._selected(names):
+            if dialect == 'sqlite':
+                self._create_fts(connection, doc)
+            elif dialect == 'postgresql':
+                connection.execute(text(
+                    f'ALTER TABLE {doc.table.name} ADD COLUMN IF NOT EXISTS {VECTOR_COLUMN} tsvector '
+                    f'GENERATED ALWAYS AS ({self._tsvector(doc)}) STORED'))
+                connection.execute(text(
+                    f'CREATE INDEX IF NOT EXISTS {doc.index} ON {doc.table.name} USING gin ({VECTOR_COLUMN})'))
+
+    def _create_fts(self, connection, doc):
+        table, fts = doc.table.name, doc.fts
+        indexed = doc.columns + (doc.scope,)
+        columns = ', '.join(indexed)
+        new = ', '.join(f'new.{c}' for c in indexed)
+        old = ', '.join(f'old.{c}' for c in indexed)
+        try:
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, "
+                f"content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"))
+        except OperationalError:
+            logger.warning('SQLite собран без FTS5: поиск по %s через LIKE', table, exc_info=True)
+            return
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END'))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); END"))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+            f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END'))
+
+    def drop(self, connection, names=None):
+        if connection.dialect.name != 'sqlite':
+            return
+        for doc in self._selected(names):
+            for suffix in ('ai', 'ad', 'au'):
+                connection.execute(text(f'DROP TRIGGER IF EXISTS {doc.fts}_{suffix}'))
+            connection.execute(text(f'DROP TABLE IF EXISTS {doc.fts}'))
+            self._fts_ready.discard((connection.engine, doc.name))
+
+    def rebuild(self, connection, names=None):
+        """Создать индексы, если их нет, и перестроить из таблиц.
+
+        В PostgreSQL колонка search_vector пересоздаётся (нужно после смены
+        text_config). Возвращает {name: число строк в таблице}.
+        """
+        dialect = connection.dialect.name
+        if dialect == 'postgresql':
+            for doc in self._selected(names):
+                connection.execute(text(f'ALTER TABLE {doc.table.name} DROP COLUMN IF EXISTS {VECTOR_COLUMN}'))
+        self.create(connection, names)
+        counts = {}
+        for doc in self._selected(names):
+            if dialect == 'sqlite' and self._has_fts(connection, connection.engine, doc):
+                connection.execute(text(f"INSERT INTO {doc.fts}({doc.fts}) VALUES ('rebuild')"))
+            counts[doc.name] = connection.scalar(select(func.count()).select_from(doc.table))
+        return counts
+
+    def _has_fts(self, executor, engine, doc):
+        key = (engine, doc.name)
+        if key in self._fts_ready:
+            return True
+        if executor.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        ), {'name': doc.fts}).first() is None:
+            if key not in self._warned:
+                self._warned.add(key)
+                logger.warning('Нет индекса %s (flask reindex-search): поиск через LIKE', doc.fts)
+            return False
+        self._fts_ready.add(key)
+        return True
+
+    def backend(self, session, name):
+        """'fts5', 'tsvector' или 'like' для движка, из которого читает session."""
+        bind = session.get_bind()
+        if bind.dialect.name == 'postgresql':
+            return 'tsvector'
+        if bind.dialect.name == 'sqlite' and self._has_fts(session, bind, self.documents[name]):
+            return 'fts5'
+        return 'like'
+
+    def search(self, session, name, query, scope=None, limit=20, offset=0):
+        """Найти строки документа name, лучшие первыми.
+
+        scope - допустимые значения колонки области (None - без ограничения).
+        Возвращает строки таблицы с дополнительной колонкой score (None для LIKE).
+        """
+        doc = self.documents[name]
+        tokens = parse_query(query)
+        if scope is not None:
+            scope = sorted(set(scope))
+            if not scope:
+                return []
+
+        backend = self.backend(session, name)
+        if backend == 'fts5':
+            statement = self._fts5_statement(doc, tokens, scope)
+        elif backend == 'tsvector':
+            statement = self._tsvector_statement(doc, tokens, scope)
+        else:
+            statement = self._like_statement(doc, tokens, scope)
+        return session.execute(statement.limit(limit).offset(offset)).all()
+
+    def _fts5_statement(self, doc, tokens, scope):
+        words = [f'"{token}"' for token in tokens]
+        if len(tokens[-1]) >= MIN_PREFIX:
+            words[-1] += '*'
+        match = '{%s} : (%s)' % (' '.join(doc.columns), ' '.join(words))
+        if scope is not None:
+            match += ' AND %s : (%s)' % (doc.scope, ' OR '.join(f'"{value}"' for value in scope))
+        fts = table(doc.fts, column('rowid'))
+        name = literal_column(doc.fts)
+        # Граница самых новых совпадений: FTS5 отдаёт их по rowid без подсчёта
+        # ранга, а условие rowid >= ... сужает основной запрос
+        newest = (select(fts.c.rowid).where(name.op('MATCH')(match))
+                  .order_by(fts.c.rowid.desc()).limit(self.max_candidates).subquery())
+        # bm25 тем меньше, чем лучше совпадение; колонка области в ранге не участвует
+        score = (-func.bm25(name, *doc.weights, 0.0)).label('score')
+        return (select(doc.table, score)
+                .join_from(doc.table, fts, fts.c.rowid == doc.table.c.id)
+                .where(name.op('MATCH')(match),
+                       fts.c.rowid >= select(func.min(newest.c.rowid)).scalar_subquery())
+                .order_by(score.desc(), doc.table.c.id.desc()))
+
+    def _tsvector_statement(self, doc, tokens, scope):
+        terms = list(tokens)
+        if len(terms[-1]) >= MIN_PREFIX:
+            terms[-1] += ':*'
+        vector = literal_column(f'{doc.table.name}.{VECTOR_COLUMN}')
+        tsquery = func.to_tsquery(literal_column(f"'{self.text_config}'::regconfig"), ' & '.join(terms))
+        matches = [vector.op('@@')(tsquery)]
+        if scope is not None:
+            matches.append(doc.table.c[doc.scope].in_(scope))
+        newest = (select(doc.table.c.id).where(*matches)
+                  .order_by(doc.table.c.id.desc()).limit(self.max_candidates).subquery())
+        score = func.ts_rank(vector, tsquery).label('score')
+        return (select(doc.table, score)
+                .where(*matches, doc.table.c.id >= select(func.min(newest.c.id)).scalar_subquery())
+                .order_by(score.desc(), doc.table.c.id.desc()))
+
+    def _like_statement(self, doc, tokens, scope):
+        conditions = []
+        for token in tokens:
+            pattern = '%' + token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append(or_(*[doc.table.c[column].ilike(pattern, escape='\\')
+                                    for column in doc.columns]))
+        statement = select(doc.table, literal_column('NULL').label('score')).where(and_(*conditions))
+        if scope is not None:
+            statement = statement.where(doc.table.c[doc.scope].in_(scope))
+        return statement.order_by(doc.table.c.id.desc())
@@ -0,0 +1,187 @@
+"""
+Менеджеры клиентов Socket.IO для работы в нескольких процессах.
+
+Без очереди сообщений emit(..., room=room) доходит только до клиентов,
+подключённых к тому же воркеру. С очередью каждый воркер публикует
+событие в общий канал и рассылает своим клиентам всё, что пришло из него.
+
+Бэкенд выбирается по схеме SOCKETIO_MESSAGE_QUEUE:
+
+    redis://, rediss://        - socketio.RedisManager (продакшен)
+    udp://127.0.0.1:47000-47003 - LocalSocketManager, воркеры на одной машине
+    memory://                  - MemoryManager, серверы внутри одного процесса
+
+udp:// и memory:// нужны для разработки и тестов без Redis; udp://
+принимает только адрес loopback. Другие схемы
+(amqp:// через kombu, kafka://) требуют своих пакетов, которых нет в
+requirements.txt, и подключаются через register_backend(); неизвестная
+схема - ошибка настройки (ValueError) при старте.
+"""
+
+import ipaddress
+import json
+import pickle
+import socket
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+import socketio
+
+BACKENDS = {}
+
+
+def register_backend(scheme, factory):
+    """Зарегистрировать фабрику менеджера: factory(url, channel, write_only, logger)."""
+    BACKENDS[scheme] = factory
+
+
+def create_client_manager(url, channel='eduverse', write_only=False, logger=None):
+    """Менеджер клиентов для url или None для обычного режима одного процесса."""
+    if not url:
+        return None
+
+    scheme = urlparse(url).scheme
+    factory = BACKENDS.get(scheme)
+    if factory is None:
+        raise ValueError(f'Неизвестная очередь сообщений Socket.IO: {url} '
+                         f'(поддерживаются {", ".join(sorted(BACKENDS))})')
+    return factory(url, channel, write_only, logger)
+
+
+class MemoryManager(socketio.PubSubManager):
+    """Шина внутри процесса: все менеджеры одного канала видят сообщения друг друга.
+
+    Позволяет поднять несколько socketio.Server в одном процессе и проверить
+    межсерверную рассылку без внешнего брокера.
+    """
+    name = 'memory'
+    poll_interval = 0.001
+    _subscribers = defaultdict(list)
+
+    def __init__(self, url='memory://', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox = deque()
+
+    def initialize(self):
+        if not self.write_only:
+            self._subscribers[self.channel].append(self._inbox)
+        super().initialize()
+
+    def close(self):
+        subscribers = self._subscribers[self.channel]
+        if self._inbox in subscribers:
+            subscribers.remove(self._inbox)
+
+    def _publish(self, data):
+        # Сериализуем как настоящий брокер, чтобы получатели не делили объекты
+        payload = pickle.dumps(data)
+        for inbox in self._subscribers[self.channel]:
+            inbox.append(payload)
+
+    def _listen(self):
+        while True:
+            if self._inbox:
+                yield self._inbox.popleft()
+            else:
+                self.server.sleep(self.poll_interval)
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class LocalSocketManager(socketio.PubSubManager):
+    """Рассылка между воркерами одной машины через UDP на диапазоне портов.
+
+    Каждый воркер занимает первый свободный порт из диапазона
+    udp://host:first-last и отправляет события на все порты диапазона,
+    включая свой. Размер события ограничен размером датаграммы (~64 КБ).
+    События передаются в JSON, и слушать можно только loopback: датаграмму
+    в порт может прислать любой процесс, которому он доступен.
+    """
+    name = 'udp'
+    poll_interval = 0.002
+    max_datagram = 65507
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        if not is_loopback(self.host):
+            raise ValueError(f'Очередь udp:// работает только на loopback, а не на {self.host}')
+        first, _, last = parsed.netloc.rsplit(':', 1)[1].partition('-')
+        self.ports = list(range(int(first), int(last or first) + 1))
+        self.port = None
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._channel_prefix = channel.encode() + b'\0'
+
+    def initialize(self):
+        if not self.write_only:
+            for port in self.ports:
+                try:
+                    self._sock.bind((self.host, port))
+                except OSError:
+                    continue
+                self.port = port
+                break
+            else:
+                raise RuntimeError(
+                    f'Нет свободного UDP-порта в диапазоне {self.ports[0]}-{self.ports[-1]}')
+        super().initialize()
+
+    def close(self):
+        self._sock.close()
+
+    def _publish(self, data):
+        try:
+            payload = self._channel_prefix + json.dumps(data, separators=(',', ':')).encode()
+        except (TypeError, ValueError):
+            self._get_logger().exception('Событие Socket.IO не сериализуется в JSON')
+            return
+        if len(payload) > self.max_datagram:
+            self._get_logger().error('Событие Socket.IO слишком велико для UDP: %d байт', len(payload))
+            return
+        for port in self.ports:
+            try:
+                self._sock.sendto(payload, (self.host, port))
+            except OSError:
+                # Порт ещё никем не занят
+                pass
+
+    def _listen(self):
+        blocking = self.server.async_mode == 'threading'
+        self._sock.settimeout(1.0 if blocking else 0)
+        while True:
+            try:
+                payload = self._sock.recv(self.max_datagram)
+            except (socket.timeout, BlockingIOError):
+                if not blocking:
+                    self.server.sleep(self.poll_interval)
+                continue
+            except OSError:
+                # Сокет закрыт при остановке воркера
+                return
+            if not payload.startswith(self._channel_prefix):
+                continue
+            try:
+                data = json.loads(payload[len(self._channel_prefix):])
+            except ValueError:
+                continue
+            # Словарь PubSubManager принимает как есть, без pickle.loads
+            if isinstance(data, dict):
+                yield data
+
+
+def _redis_manager(url, channel, write_only, logger):
+    return socketio.RedisManager(url, channel=channel, write_only=write_only, logger=logger)
+
+
+register_backend('redis', _redis_manager)
+register_backend('rediss', _redis_manager)
+register_backend('udp', LocalSocketManager)
+register_backend('memory', MemoryManager)
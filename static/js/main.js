@@ -78,9 +78,25 @@ function initializeSocketIO() {
             displayMessage(data);
         });
         
+        // Пакетный режим сервера: несколько сообщений одним событием
+        socket.on('messages', function(list) {
+            list.forEach(displayMessage);
+        });
+        
         socket.on('status', function(data) {
             showNotification(data.msg, 'info');
         });
+        
+        socket.on('error', function(data) {
+            showNotification(data.msg, 'danger');
+        });
+        
+        // Сервер считает подключение живым, пока приходят heartbeat
+        setInterval(function() {
+            if (socket.connected) {
+                socket.emit('heartbeat');
+            }
+        }, 25000);
     }
 }
 
@@ -117,16 +133,12 @@ function leaveChat(chatId) {
     }
 }
 
+// id, время и отправителя назначает сервер; своё сообщение приходит
+// обратно вместе со всеми, поэтому сразу оно не показывается
 function sendMessage(chatId, message) {
     if (socket && message.trim()) {
-        const messageData = {
-            room: chatId,
-            content: message.trim(),
-            timestamp: new Date().toISOString()
-        };
-        
-        socket.emit('message', messageData);
-        displayMessage(messageData);
+        // Ошибки (пустое, слишком длинное, нет доступа) приходят событием error
+        socket.emit('message', { room: Number(chatId), content: message.trim() });
         
         // Очистка поля ввода
         const input = document.querySelector(`#chat-input-${chatId}`);
@@ -136,18 +148,28 @@ function sendMessage(chatId, message) {
     }
 }
 
+// Время сервера - ISO 8601 в UTC без указания пояса
+function parseServerTime(value) {
+    return new Date(/(Z|[+-]\d\d:\d\d)$/.test(value) ? value : value + 'Z');
+}
+
 function displayMessage(data) {
     const chatMessages = document.querySelector('.chat-messages');
     if (!chatMessages) return;
+    // id живого сообщения совпадает с id в истории: уже показанное не дублируется
+    if (data.id != null && chatMessages.querySelector(`[data-message-id="${data.id}"]`)) return;
     
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${data.sender_id === getCurrentUserId() ? 'sent' : 'received'}`;
+    if (data.id != null) messageDiv.dataset.messageId = data.id;
     
-    const time = new Date(data.timestamp).toLocaleTimeString();
+    const time = parseServerTime(data.timestamp).toLocaleTimeString();
     messageDiv.innerHTML = `
-        <div class="message-content">${data.content}</div>
+        <div class="message-content"></div>
         <small class="message-time">${time}</small>
     `;
+    // Текст сообщения - только как текст, не HTML
+    messageDiv.querySelector('.message-content').textContent = data.content;
     
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
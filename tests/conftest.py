@@ -0,0 +1,95 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as eduverse  # noqa: E402
+
+
+@pytest.fixture
+def app_config(request):
+    """Настройки поверх тестовых: indirect-параметр теста или переопределённая фикстура модуля."""
+    return getattr(request, 'param', {})
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    """Приложение на временной SQLite-базе с пустой схемой."""
+    app = eduverse.create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "eduverse.db"}',
+        'DATABASE_REPLICA_URL': None,
+        'SOCKETIO_ASYNC_MODE': 'threading',
+        'SOCKETIO_MESSAGE_QUEUE': None,
+        'USER_CACHE_URL': None,
+        'RESPONSE_CACHE_URL': None,
+        'PRESENCE_URL': None,
+        'EXPORT_DIR': str(tmp_path / 'exports'),
+        'CHAT_DEAD_LETTER_PATH': str(tmp_path / 'chat_dead_letter.jsonl'),
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'SQLITE_BUSY_TIMEOUT_MS': 2000,
+        **app_config,
+    })
+    with app.app_context():
+        eduverse.db.create_all()
+    yield app
+    eduverse.message_writer.close()
+    with app.app_context():
+        eduverse.db.session.remove()
+        for engine in eduverse.db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield eduverse.db
+
+
+@pytest.fixture
+def login(app):
+    """Тестовый клиент, вошедший как пользователь user_id (без формы логина)."""
+    def login(user_id):
+        client = app.test_client()
+        with client.session_transaction() as flask_session:
+            flask_session['_user_id'] = str(user_id)
+            flask_session['_fresh'] = True
+        return client
+    return login
+
+
+@pytest.fixture
+def make_user(db):
+    """Создать пользователя с ролью и школой; возвращает id."""
+    def make_user(role, school_id=None, username=None, **fields):
+        username = username or f'{role}{make_user.count}'
+        make_user.count += 1
+        fields.setdefault('password_hash', '-')
+        user = eduverse.User(username=username, email=f'{username}@example.com',
+                             role=role, school_id=school_id, **fields)
+        db.session.add(user)
+        db.session.flush()
+        user_id = user.id
+        db.session.commit()
+        return user_id
+    make_user.count = 0
+    return make_user
+
+
+@pytest.fixture
+def make_school(db):
+    """Создать школу; возвращает id."""
+    def make_school(name=None):
+        name = name or f'school{make_school.count}'
+        make_school.count += 1
+        school = eduverse.School(name=name, unique_url=name)
+        db.session.add(school)
+        db.session.flush()
+        school_id = school.id
+        db.session.commit()
+        return school_id
+    make_school.count = 0
+    return make_school
@@ -0,0 +1,76 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import insert
+
+import app as eduverse
+from pagination import decode_cursor
+
+
+@pytest.fixture
+def platform(db, make_school, make_user):
+    """Три школы (одна закрыта), пользователи разных ролей и платежи."""
+    platform = {'schools': [make_school(name) for name in ('alpha', 'beta_100%', 'gamma')]}
+    db.session.get(eduverse.School, platform['schools'][2]).is_active = False
+    db.session.commit()
+    platform['super_admin'] = make_user('super_admin')
+    students = [make_user('student', platform['schools'][0]) for _ in range(3)]
+    make_user('teacher', platform['schools'][0])
+    make_user('parent', platform['schools'][1])
+    db.session.execute(insert(eduverse.Payment), [
+        {'student_id': s, 'amount': 100.0, 'paid_amount': paid, 'due_date': date(2024, 9, 5),
+         'month': 9, 'year': 2024, 'status': 'due'}
+        for s, paid in zip(students, (100.0, 25.5, None))])
+    db.session.commit()
+    return platform
+
+
+def test_totals(db, platform):
+    stats = eduverse.admin_stats.compute(db.session)
+    assert (stats['total_schools'], stats['active_schools'], stats['total_users']) == (3, 2, 6)
+    assert stats['users_by_role']['student'] == 3
+    assert stats['users_by_role']['super_admin'] == 1
+    assert stats['total_revenue'] == 125.5
+
+
+def test_totals_cached_until_write(db, platform, make_user):
+    stats = eduverse.admin_stats
+    first = stats.get(db.session)
+    hits = stats.stats['hits']
+    assert stats.get(db.session) is first
+    assert stats.stats['hits'] == hits + 1
+
+    make_user('teacher', platform['schools'][1])
+    assert stats.get(db.session)['users_by_role']['teacher'] == 2
+
+
+def test_school_page_cursor_search_and_status(db, platform):
+    stats = eduverse.admin_stats
+    rows, has_more = stats.school_page(db.session, limit=2)
+    assert [r.name for r in rows] == ['alpha', 'beta_100%'] and has_more
+    assert [r.user_count for r in rows] == [4, 1]
+    rows, has_more = stats.school_page(db.session, after=(rows[-1].id,), limit=2)
+    assert [r.name for r in rows] == ['gamma'] and not has_more
+
+    # % и _ в запросе - обычные символы, а не шаблон LIKE
+    assert [r.name for r in stats.school_page(db.session, search='_100%')[0]] == ['beta_100%']
+    assert stats.school_page(db.session, search='a_p')[0] == []
+    assert [r.name for r in stats.school_page(db.session, status='inactive')[0]] == ['gamma']
+
+
+def test_admin_api(platform, login):
+    client = login(platform['super_admin'])
+    stats = client.get('/api/admin/stats').get_json()
+    assert stats['total_schools'] == 3
+    page = client.get('/api/admin/schools?limit=1&status=active').get_json()
+    assert [s['name'] for s in page['schools']] == ['alpha']
+    page = client.get(f"/api/admin/schools?limit=1&status=active&after={page['after']}").get_json()
+    assert [s['name'] for s in page['schools']] == ['beta_100%'] and page['after'] is None
+    assert decode_cursor(client.get('/api/admin/schools?limit=1').get_json()['after'], 1) == (platform['schools'][0],)
+    assert client.get('/api/admin/schools?status=closed').status_code == 400
+
+
+def test_admin_api_requires_super_admin(platform, make_user, login):
+    client = login(make_user('school_admin', platform['schools'][0]))
+    assert client.get('/api/admin/stats').status_code == 403
+    assert client.get('/api/admin/schools').status_code == 403
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+from flask import Flask
+
+import app as eduverse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_load_config_reads_environment(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///other.db')
+    monkeypatch.setenv('IMPORT_HASH_WORKERS', '0')
+    monkeypatch.setenv('RESPONSE_CACHE_ENABLED', 'false')
+    app = Flask(__name__)
+    eduverse.load_config(app)
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == 'sqlite:///other.db'
+    assert app.config['IMPORT_HASH_WORKERS'] == 0
+    assert app.config['RESPONSE_CACHE_ENABLED'] is False
+
+
+def test_factory_registers_routes_and_commands(app):
+    assert app.config['TESTING'] is True
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()}
+    assert {'get_schools', 'get_chat_messages', 'submit_grades', 'export_report'} <= endpoints
+    assert {'init-db', 'sweep-payments', 'import-data', 'reindex-search'} <= set(app.cli.commands)
+    # Вне CLI Flask-Migrate (и alembic) не подключаются
+    assert 'migrate' not in app.extensions
+
+
+def test_init_db_creates_schema_and_admin_once(app):
+    result = app.test_cli_runner().invoke(args=['init-db', '--admin-username', 'root'])
+    assert result.exit_code == 0, result.output
+    assert 'супер-админ: root' in result.output
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    assert result.output.strip() == 'Таблицы созданы'
+
+
+def test_worker_startup_does_not_touch_database_or_alembic(tmp_path):
+    # Свежий интерпретатор: импорт и create_app не открывают БД и не импортируют alembic
+    database = tmp_path / 'eduverse.db'
+    code = (
+        'import sys, app\n'
+        f'app.create_app({{"SQLALCHEMY_DATABASE_URI": "sqlite:///{database}", '
+        '"SOCKETIO_ASYNC_MODE": "threading"})\n'
+        'print("alembic" in sys.modules)\n'
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'False'
+    assert not database.exists()
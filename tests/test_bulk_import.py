@@ -0,0 +1,118 @@
+import io
+
+import pytest
+from flask import Flask
+from sqlalchemy import select
+
+import app as eduverse
+from bulk_import import iter_records
+
+
+def run(kind, text, fmt='csv', **options):
+    return eduverse.create_importer(**options).run(iter_records(io.StringIO(text), fmt), kind)
+
+
+@pytest.fixture
+def school(db):
+    report = run('schools', 'name,unique_url\nШкола 1,s1\n')
+    assert report['inserted'] == 1
+    run('classes', 'school,name,grade_level\ns1,5А,5\n')
+    run('subjects', 'school,name\ns1,Математика\n')
+    return 's1'
+
+
+def usernames_with_hash(db):
+    return dict(db.session.execute(select(eduverse.User.username, eduverse.User.password_hash)).all())
+
+
+def test_users_hashed_with_configured_method(app, db, school):
+    text = ('{"username": "u1", "email": "u1@x", "password": "p1", "role": "student", "school": "s1"}\n'
+            '{"username": "u1", "email": "u2@x", "password": "p2", "role": "student"}\n'
+            '{"username": "u3", "email": "u3@x", "password": "p3", "role": "wizard"}\n')
+    report = run('users', text, fmt='jsonl', hash_workers=0)
+    assert (report['inserted'], report['failed']) == (1, 2)
+    assert [e['row'] for e in report['errors']] == [2, 3]
+    assert usernames_with_hash(db)['u1'].startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+
+
+@pytest.mark.parametrize('app_config', [{'IMPORT_CHUNK_SIZE': 1}], indirect=True)
+def test_bad_jsonl_lines_are_row_errors(app, db, make_user, login):
+    client = login(make_user('super_admin'))
+    text = ('{"username": "u1", "email": "u1@x", "password": "p1", "role": "parent"}\n'
+            '[1, 2]\n'
+            '\n'
+            '"x"\n'
+            '{"username": \n'
+            '{"username": "u2", "email": "u2@x", "password": "p2", "role": "parent"}\n')
+    response = client.post('/api/import/users?format=jsonl', data=text)
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['read'], report['inserted'], report['failed']) == (5, 2, 3)
+    assert [(e['row'], e['error'].split(':')[0]) for e in report['errors']] == [
+        (2, 'Строка 2'), (3, 'Строка 4'), (4, 'Строка 5')]
+    assert {'u1', 'u2'} <= set(usernames_with_hash(db))
+
+
+def test_process_pool_uses_configured_method(app, db, school):
+    report = run('users', 'username,email,password,role\nu1,u1@x,p1,teacher\n', hash_workers=1)
+    assert report['inserted'] == 1
+    assert usernames_with_hash(db)['u1'].startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+
+
+def test_api_hashes_in_shared_pool(app, db, make_user, login, monkeypatch):
+    batches = []
+    monkeypatch.setattr(eduverse.password_hasher, 'hash_many',
+                        lambda ps: batches.append(list(ps)) or [f'hash-{p}' for p in ps])
+    client = login(make_user('super_admin'))
+    response = client.post('/api/import/users?format=jsonl',
+                           data='{"username": "u1", "email": "u1@x", "password": "p1", "role": "parent"}\n'
+                                '{"username": "u2", "email": "u2@x", "password": "p2", "role": "parent"}\n')
+    assert response.get_json()['inserted'] == 2
+    # Одна пачка - один вызов пула со всеми паролями
+    assert batches == [['p1', 'p2']]
+    assert usernames_with_hash(db)['u1'] == 'hash-p1'
+
+
+@pytest.mark.parametrize('app_config', [{'PASSWORD_HASH_QUEUE': 1}], indirect=True)
+def test_api_import_respects_hash_limits(app, db, make_user, login):
+    client = login(make_user('super_admin'))
+    with eduverse.password_hasher.limit('10.0.0.9', 'anna'):
+        response = client.post('/api/import/users?format=jsonl',
+                               data='{"username": "u1", "email": "u1@x", "password": "p1", "role": "parent"}\n')
+    assert response.status_code == 429
+    assert eduverse.password_hasher.pending == 0
+
+
+def test_membership_requires_student(db, school, make_user):
+    make_user('student', username='kid')
+    make_user('teacher', username='teach')
+    report = run('class_students', 'school,class,username\ns1,5А,kid\ns1,5А,teach\ns1,5А,ghost\ns1,5А,kid\n')
+    assert report['inserted'] == 1
+    assert [(e['row'], e['error']) for e in report['errors']] == [
+        (2, 'Пользователь teach должен иметь роль student, а не teacher'),
+        (3, 'Пользователь ghost не найден'),
+        (4, 'Ученик уже в классе'),
+    ]
+
+    report = run('student_subjects', 'school,subject,username\ns1,Математика,teach\n')
+    assert report['failed'] == 1
+
+
+def test_parent_children_roles(db, school, make_user):
+    make_user('parent', username='mom')
+    make_user('student', username='kid')
+    make_user('teacher', username='teach')
+    report = run('parent_children', 'parent,child\nmom,kid\nteach,kid\nmom,teach\nkid,mom\n')
+    assert report['inserted'] == 1
+    assert [e['row'] for e in report['errors']] == [2, 3, 4]
+    assert db.session.execute(select(eduverse.ParentChild.parent_id, eduverse.ParentChild.child_id)).all() \
+        == [(db.session.scalar(select(eduverse.User.id).where(eduverse.User.username == 'mom')),
+             db.session.scalar(select(eduverse.User.id).where(eduverse.User.username == 'kid')))]
+
+
+def test_hash_workers_config(monkeypatch):
+    app = Flask(__name__)
+    for value, expected in (('', None), ('0', 0), ('3', 3)):
+        monkeypatch.setenv('IMPORT_HASH_WORKERS', value)
+        eduverse.load_config(app)
+        assert app.config['IMPORT_HASH_WORKERS'] == expected
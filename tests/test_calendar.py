@@ -0,0 +1,115 @@
+from datetime import date, datetime, time
+from types import SimpleNamespace
+
+import pytest
+
+import app as eduverse
+from response_cache import LocalGenerations
+from school_calendar import CalendarError, ScheduleCalendar, generation_name, parse_range, week_starts
+from user_cache import LocalCacheBackend
+
+
+def test_parse_range():
+    assert parse_range('2024-09-01', '2024-09-30') == (date(2024, 9, 1), date(2024, 9, 30))
+    for start, end in (('2024-09-30', '2024-09-01'), ('01.09.2024', '2024-09-02'), (None, None),
+                       ('2024-09-01', '2024-11-30')):
+        with pytest.raises(CalendarError):
+            parse_range(start, end)
+
+
+def test_week_starts_cover_partial_weeks():
+    # 2024-09-01 - воскресенье, 2024-09-10 - вторник
+    assert list(week_starts(date(2024, 9, 1), date(2024, 9, 10))) == [
+        date(2024, 8, 26), date(2024, 9, 2), date(2024, 9, 9)]
+
+
+def lesson(id, day_of_week, hour, class_id=1, teacher_id=7):
+    return SimpleNamespace(id=id, day_of_week=day_of_week, start_time=time(hour), end_time=time(hour, 45),
+                           subject_id=3, subject='Физика', class_id=class_id, class_name='8А',
+                           teacher_id=teacher_id, room='12')
+
+
+@pytest.fixture
+def calendar():
+    loads = []
+
+    def load_lessons(school_id, class_ids, teacher_ids):
+        loads.append((sorted(class_ids), sorted(teacher_ids)))
+        return [lesson(1, 0, 9), lesson(2, 2, 10), lesson(3, 4, 8, class_id=2)]
+    calendar = ScheduleCalendar(load_lessons, cache=LocalCacheBackend(ttl=60), generations=LocalGenerations())
+    calendar.loads = loads
+    return calendar
+
+
+def test_expands_only_requested_dates(calendar):
+    # Вторник 2024-09-03 - пятница 2024-09-13: понедельник 09-02 вне периода
+    items = calendar.lessons(5, date(2024, 9, 3), date(2024, 9, 13), class_ids=[1])
+    assert [(item['schedule_id'], item['date']) for item in items] == [
+        (2, '2024-09-04'), (1, '2024-09-09'), (2, '2024-09-11')]
+    assert items[0]['start'] == '2024-09-04T10:00:00' and items[0]['end'] == '2024-09-04T10:45:00'
+
+
+def test_lesson_of_class_and_teacher_appears_once(calendar):
+    items = calendar.lessons(5, date(2024, 9, 2), date(2024, 9, 8), class_ids=[1], teacher_ids=[7])
+    assert [item['schedule_id'] for item in items] == [1, 2, 3]
+    assert calendar.loads == [([1], [7])]
+
+
+def test_weeks_cached_until_schedule_generation_changes(calendar):
+    period = (5, date(2024, 9, 2), date(2024, 9, 15))
+    first = calendar.lessons(*period, class_ids=[1])
+    assert calendar.lessons(*period, class_ids=[1]) == first
+    assert len(calendar.loads) == 1 and calendar.stats['hits'] == 2
+
+    # Новая неделя читается отдельно, уже развёрнутые берутся из кэша
+    calendar.lessons(5, date(2024, 9, 9), date(2024, 9, 22), class_ids=[1])
+    assert len(calendar.loads) == 2
+
+    calendar.generations.bump(generation_name(5))
+    calendar.lessons(*period, class_ids=[1])
+    assert len(calendar.loads) == 3
+    assert calendar.lessons(6, *period[1:]) == []
+
+
+@pytest.fixture
+def school_schedule(db, make_school, make_user):
+    school_id = make_school()
+    subject = eduverse.Subject(name='Физика', school_id=school_id)
+    school_class = eduverse.Class(name='8А', school_id=school_id, grade_level=8)
+    db.session.add_all([subject, school_class])
+    db.session.flush()
+    teacher = make_user('teacher', school_id)
+    db.session.add_all([
+        eduverse.Schedule(school_id=school_id, subject_id=subject.id, class_id=school_class.id,
+                          teacher_id=teacher, day_of_week=1, start_time=time(9), end_time=time(9, 45),
+                          room='12'),
+        eduverse.Event(school_id=school_id, title='Каникулы', start_date=datetime(2024, 8, 30),
+                       end_date=datetime(2024, 9, 3, 23, 59), event_type='holiday'),
+        eduverse.Event(school_id=school_id, title='Экзамен', start_date=datetime(2024, 9, 20, 9),
+                       end_date=datetime(2024, 9, 20, 12), event_type='exam'),
+    ])
+    db.session.commit()
+    return {'school': school_id, 'class': school_class.id, 'teacher': teacher}
+
+
+def test_school_calendar_api(db, school_schedule, login):
+    client = login(school_schedule['teacher'])
+    url = (f"/api/schools/{school_schedule['school']}/calendar?from=2024-09-02&to=2024-09-15"
+           f"&class_id={school_schedule['class']}")
+    items = client.get(url).get_json()['items']
+    assert [(item['type'], item['start']) for item in items] == [
+        ('event', '2024-08-30T00:00:00'), ('lesson', '2024-09-03T09:00:00'), ('lesson', '2024-09-10T09:00:00')]
+
+    # Изменение расписания сбрасывает развёрнутые недели
+    schedule = eduverse.Schedule.query.one()
+    schedule.room = '14'
+    db.session.commit()
+    items = client.get(url).get_json()['items']
+    assert [item['room'] for item in items if item['type'] == 'lesson'] == ['14', '14']
+
+    assert client.get(url.replace('2024-09-15', '2024-12-31')).status_code == 400
+
+
+def test_my_calendar_for_teacher(school_schedule, login):
+    items = login(school_schedule['teacher']).get('/api/calendar?from=2024-09-16&to=2024-09-22').get_json()['items']
+    assert [(item['type'], item.get('title')) for item in items] == [('lesson', None), ('event', 'Экзамен')]
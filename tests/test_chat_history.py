@@ -0,0 +1,87 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select, text
+
+import app as eduverse
+from pagination import decode_cursor, encode_cursor, parse_page_size
+
+
+def test_cursor_round_trip():
+    values = (datetime(2024, 9, 1, 8, 30, 15, 123456), date(2024, 9, 1), 42, 'x')
+    assert decode_cursor(encode_cursor(*values), 4) == values
+    for broken in ('###', encode_cursor(1, 2), encode_cursor({'dt': 'вчера'})):
+        with pytest.raises(ValueError):
+            decode_cursor(broken, 1)
+
+
+def test_page_size():
+    assert parse_page_size(None) == 50
+    assert parse_page_size('500') == 200
+    for bad in ('0', 'abc'):
+        with pytest.raises(ValueError):
+            parse_page_size(bad)
+
+
+@pytest.fixture
+def history(db, make_user):
+    """Чат участника с 7 сообщениями (два с одинаковым временем) и чужой чат."""
+    member = make_user('student')
+    chats = [eduverse.Chat(name=name, chat_type='group') for name in ('свой', 'чужой')]
+    db.session.add_all(chats)
+    db.session.flush()
+    chat_id, other_id = chats[0].id, chats[1].id
+    db.session.add(eduverse.ChatParticipant(chat_id=chat_id, user_id=member))
+    start = datetime(2024, 9, 1, 8, 0)
+    times = [start + timedelta(minutes=m) for m in (0, 1, 2, 2, 3, 4, 5)]
+    ids = db.session.execute(insert(eduverse.Message).returning(eduverse.Message.id), [
+        {'chat_id': chat_id, 'sender_id': member, 'content': f'сообщение {n}', 'timestamp': ts,
+         'is_pinned': n in (1, 5)}
+        for n, ts in enumerate(times)]).scalars().all()
+    db.session.execute(insert(eduverse.Message), [
+        {'chat_id': other_id, 'sender_id': member, 'content': 'чужое', 'timestamp': start}])
+    db.session.commit()
+    return {'member': member, 'chat': chat_id, 'other': other_id, 'ids': ids}
+
+
+def test_pages_backwards_and_forwards_without_gaps(history, login):
+    client = login(history['member'])
+    url = f"/api/chats/{history['chat']}/messages?limit=3"
+
+    pages, cursor = [], None
+    while True:
+        page = client.get(url + (f'&before={cursor}' if cursor else '')).get_json()
+        pages.insert(0, [m['id'] for m in page['messages']])
+        cursor = page['before']
+        if not page['has_more']:
+            break
+    assert [len(p) for p in pages] == [1, 3, 3]
+    assert sum(pages, []) == history['ids']
+
+    page = client.get(url + f"&after={encode_cursor(datetime(2024, 9, 1, 8, 2), history['ids'][2])}").get_json()
+    assert [m['id'] for m in page['messages']] == history['ids'][3:6]
+    assert page['has_more'] is True
+
+
+def test_pinned_messages(history, login):
+    page = login(history['member']).get(f"/api/chats/{history['chat']}/messages/pinned").get_json()
+    assert [m['id'] for m in page['messages']] == [history['ids'][1], history['ids'][5]]
+    assert all(m['is_pinned'] for m in page['messages'])
+
+
+def test_history_rejects_bad_requests(history, login):
+    client = login(history['member'])
+    url = f"/api/chats/{history['chat']}/messages"
+    assert client.get(f"/api/chats/{history['other']}/messages").status_code == 403
+    assert client.get(f'{url}?before=abc&after=abc').status_code == 400
+    assert client.get(f'{url}?before=@@@').status_code == 400
+    assert client.get(f'{url}?limit=0').status_code == 400
+
+
+def test_page_query_uses_chat_index(db, history):
+    query = (select(eduverse.Message.id).where(eduverse.Message.chat_id == history['chat'])
+             .order_by(eduverse.Message.timestamp.desc(), eduverse.Message.id.desc()).limit(3))
+    compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+    plan = ' '.join(row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')))
+    assert 'ix_message_chat_timestamp_id' in plan
+    assert 'TEMP B-TREE' not in plan
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from chat_pipeline import Frame, FrameJSON, MessageError, MessagePipeline
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def pipeline(sent):
+    return MessagePipeline(emit=lambda event, frame, room: sent.append((event, frame, room)), max_bytes=12)
+
+
+@pytest.mark.parametrize('data', [
+    None, {'content': 'привет'}, {'room': 'abc', 'content': 'x'}, {'room': 1, 'content': '   '},
+    {'room': 1, 'content': 'ё' * 7}, {'room': 1, 'content': 'x', 'receiver_id': True},
+])
+def test_prepare_rejects_invalid_messages(pipeline, data):
+    with pytest.raises(MessageError):
+        pipeline.prepare(data, sender_id=3)
+    assert pipeline.stats['rejected'] == 1
+
+
+def test_prepare_keeps_only_server_fields(pipeline):
+    message = pipeline.prepare({'room': '5', 'content': ' привет ', 'sender_id': 99, 'id': 'x',
+                                'is_pinned': True}, sender_id=3)
+    assert {k: v for k, v in message.items() if k != 'timestamp'} == {
+        'id': None, 'chat_id': 5, 'sender_id': 3, 'receiver_id': None, 'content': 'привет',
+        'is_pinned': False}
+
+
+def test_frame_is_serialized_once():
+    frame = Frame({'content': 'привет'})
+    # Кириллица без \\uXXXX
+    assert frame.json == '{"content":"привет"}'
+    packet = FrameJSON.dumps(['message', frame])
+    assert json.loads(packet) == ['message', {'content': 'привет'}]
+    assert FrameJSON.dumps({'plain': 1}) == json.dumps({'plain': 1})
+
+
+def test_batched_messages_leave_as_one_event_per_room(sent):
+    tasks = []
+    pipeline = MessagePipeline(emit=lambda event, frame, room: sent.append((event, frame, room)),
+                               batch_interval=0.05, start_background_task=tasks.append)
+    for n in range(3):
+        pipeline.publish('5', {'n': n})
+    pipeline.publish('6', {'n': 9})
+    assert len(tasks) == 1 and sent == []
+
+    assert pipeline.flush() == 4
+    assert [(event, json.loads(frame.json), room) for event, frame, room in sent] == [
+        ('messages', [{'n': 0}, {'n': 1}, {'n': 2}], '5'), ('messages', [{'n': 9}], '6')]
+    assert pipeline.stats['frames'] == 2
@@ -0,0 +1,136 @@
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import app as eduverse
+from db_engine import write_lock
+
+
+def raw_connection(app):
+    path = eduverse.db.engine.url.database
+    return sqlite3.connect(path, timeout=0, isolation_level=None)
+
+
+def add_school(session, name):
+    session.add(eduverse.School(name=name, unique_url=name))
+
+
+def test_read_does_not_wait_for_writer(app, db):
+    add_school(db.session, 'a')
+    db.session.commit()
+
+    writer = raw_connection(app)
+    writer.execute('BEGIN IMMEDIATE')
+    writer.execute("INSERT INTO school (name, unique_url, is_active) VALUES ('b', 'b', 1)")
+    try:
+        started = time.monotonic()
+        count = db.session.execute(select(func.count()).select_from(eduverse.School)).scalar()
+        db.session.commit()
+        assert count == 1
+        # busy_timeout - 2 с: чтение не должно его дожидаться
+        assert time.monotonic() - started < 0.5
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_get_schools_while_write_is_open(app, db):
+    writer = raw_connection(app)
+    writer.execute('BEGIN IMMEDIATE')
+    writer.execute("INSERT INTO school (name, unique_url, is_active) VALUES ('b', 'b', 1)")
+    try:
+        started = time.monotonic()
+        response = app.test_client().get('/api/schools')
+        assert response.status_code == 200
+        assert time.monotonic() - started < 0.5
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_first_write_takes_lock(app, db):
+    db.session.execute(select(eduverse.School)).all()
+    other = raw_connection(app)
+    try:
+        # После чтения транзакция ещё не мешает писателям
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+
+        add_school(db.session, 'a')
+        db.session.flush()
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            other.execute('BEGIN IMMEDIATE')
+        db.session.commit()
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+    finally:
+        other.close()
+
+
+def test_read_then_write_stays_atomic(app, db):
+    first = db.session
+    with Session(db.engine) as second:
+        first.execute(select(func.count()).select_from(eduverse.School)).scalar()
+        second.execute(select(func.count()).select_from(eduverse.School)).scalar()
+
+        add_school(first, 'a')
+        first.commit()
+        # Прочитанное второй транзакцией устарело: запись не отрывается от
+        # чтения тайным COMMIT, а падает
+        add_school(second, 'b')
+        with pytest.raises(OperationalError, match='locked'):
+            second.commit()
+
+
+def test_write_lock_transactions_do_not_fail(app, db):
+    first = db.session
+    with Session(db.engine) as second:
+        write_lock(first)
+        first.execute(select(func.count()).select_from(eduverse.School)).scalar()
+        add_school(first, 'a')
+        first.commit()
+
+        write_lock(second)
+        assert second.execute(select(func.count()).select_from(eduverse.School)).scalar() == 1
+        add_school(second, 'b')
+        second.commit()
+
+    assert db.session.execute(select(func.count()).select_from(eduverse.School)).scalar() == 2
+
+
+def test_write_lock_after_reads_raises(app, db):
+    db.session.execute(select(eduverse.School)).all()
+    with pytest.raises(RuntimeError, match='write_lock'):
+        write_lock(db.session)
+    db.session.commit()
+    write_lock(db.session)
+    db.session.rollback()
+
+
+def test_write_lock_before_reads(app, db):
+    write_lock(db.session)
+    other = raw_connection(app)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            other.execute('BEGIN IMMEDIATE')
+        db.session.rollback()
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+    finally:
+        other.close()
+
+
+def test_read_only_connection_never_locks(app, db):
+    with db.engine.connect().execution_options(read_only=True) as connection:
+        connection.execute(select(eduverse.School)).all()
+        other = raw_connection(app)
+        try:
+            other.execute('BEGIN IMMEDIATE')
+            other.rollback()
+        finally:
+            other.close()
+        connection.rollback()
@@ -0,0 +1,153 @@
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import app as eduverse
+from grade_journal import JournalError, parse_dates, parse_rows
+
+DATES = ['2024-09-02', '2024-09-03']
+
+
+@pytest.fixture
+def journal_school(db, make_school, make_user):
+    """Школа с предметом, классом из двух учеников и учителем предмета."""
+    school_id = make_school()
+    subject = eduverse.Subject(name='Математика', school_id=school_id)
+    school_class = eduverse.Class(name='7А', school_id=school_id, grade_level=7)
+    db.session.add_all([subject, school_class])
+    db.session.flush()
+    ids = {'school': school_id, 'subject': subject.id, 'class': school_class.id}
+    db.session.commit()
+    ids['students'] = [make_user('student', school_id) for _ in range(2)]
+    ids['outsider'] = make_user('student', school_id)
+    ids['teacher'] = make_user('teacher', school_id)
+    db.session.execute(insert(eduverse.ClassStudent), [
+        {'class_id': ids['class'], 'student_id': student} for student in ids['students']])
+    db.session.execute(insert(eduverse.TeacherSubject), [
+        {'teacher_id': ids['teacher'], 'subject_id': ids['subject']}])
+    db.session.commit()
+    return ids
+
+
+def journal(db):
+    return eduverse.GradeJournal(db.session, eduverse.SimpleNamespace(
+        Grade=eduverse.Grade, StudentSubject=eduverse.StudentSubject, ClassStudent=eduverse.ClassStudent
+    ), apply_deltas=eduverse.apply_grade_deltas)
+
+
+def grades(db):
+    db.session.rollback()
+    return sorted(db.session.execute(
+        select(eduverse.Grade.student_id, eduverse.Grade.date, eduverse.Grade.grade)).all())
+
+
+def assert_stats_consistent(db):
+    columns = ['student_id', 'subject_id', 'count', 'total']
+
+    def snapshot():
+        return sorted(db.session.execute(
+            select(*[getattr(eduverse.GradeStat, c) for c in columns])
+            .where(eduverse.GradeStat.count != 0)).all())
+    incremental = snapshot()
+    eduverse.rebuild_grade_stats()
+    assert snapshot() == incremental
+
+
+def test_parse_rejects_bad_structure():
+    with pytest.raises(JournalError):
+        parse_dates(['2024-09-02', '2024-09-02'])
+    with pytest.raises(JournalError):
+        parse_dates(['02.09.2024'])
+    cells, errors = parse_rows([
+        {'student_id': 1, 'grades': [5, None]},
+        {'student_id': 2, 'grades': [11, 3]},
+        {'student_id': 3, 'grades': [True, 3]},
+        {'student_id': 1, 'grades': [4, 4]},
+        {'grades': [4, 4]},
+    ], parse_dates(DATES))
+    assert cells == {(1, date(2024, 9, 2)): 5}
+    assert [number for number, _, _ in errors] == [1, 2, 3, 4]
+
+
+def test_submit_inserts_updates_and_reports(db, journal_school):
+    first, second = journal_school['students']
+    report = journal(db).submit(journal_school['subject'], DATES, [
+        {'student_id': first, 'grades': [8, None]},
+        {'student_id': second, 'grades': [6, 9]},
+        {'student_id': journal_school['outsider'], 'grades': [5, 5]},
+    ], class_id=journal_school['class'])
+    assert (report['inserted'], report['updated'], report['unchanged']) == (3, 0, 0)
+    assert [e['student_id'] for e in report['errors']] == [journal_school['outsider']]
+
+    report = journal(db).submit(journal_school['subject'], DATES, [
+        {'student_id': first, 'grades': [8, 7]},
+        {'student_id': second, 'grades': [10, 9]},
+    ], class_id=journal_school['class'])
+    assert (report['inserted'], report['updated'], report['unchanged']) == (1, 1, 2)
+    assert grades(db) == sorted([
+        (first, date(2024, 9, 2), 8), (first, date(2024, 9, 3), 7),
+        (second, date(2024, 9, 2), 10), (second, date(2024, 9, 3), 9)])
+    assert_stats_consistent(db)
+
+
+def test_cell_taken_between_read_and_insert_becomes_update(db, journal_school):
+    # Параллельный журнал вставил ячейку после нашего SELECT: ON CONFLICT
+    # не даёт дубля, ячейка обновляется, агрегаты считаются один раз
+    student = journal_school['students'][0]
+    subject = journal_school['subject']
+    grade_journal = journal(db)
+    read = grade_journal.existing
+
+    def existing_then_concurrent_insert(subject_id, student_ids, dates):
+        found = read(subject_id, student_ids, dates)
+        if not found:
+            db.session.add(eduverse.Grade(student_id=student, subject_id=subject,
+                                          grade=4, date=date(2024, 9, 2)))
+            db.session.flush()
+        return {}
+    grade_journal.existing = existing_then_concurrent_insert
+    report = grade_journal.submit(subject, DATES, [{'student_id': student, 'grades': [9, 6]}],
+                                  class_id=journal_school['class'])
+
+    assert (report['inserted'], report['updated']) == (1, 0)
+    assert grades(db) == [(student, date(2024, 9, 2), 4), (student, date(2024, 9, 3), 6)]
+    assert_stats_consistent(db)
+
+
+def test_concurrent_submits_do_not_duplicate_cells(app, db, journal_school, login):
+    body = {'class_id': journal_school['class'], 'dates': DATES,
+            'rows': [{'student_id': s, 'grades': [7, 8]} for s in journal_school['students']]}
+    barrier = threading.Barrier(4)
+    statuses = []
+
+    def submit():
+        client = login(journal_school['teacher'])
+        barrier.wait()
+        statuses.append(client.post(f"/api/subjects/{journal_school['subject']}/grades",
+                                    json=body).status_code)
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 4
+    db.session.rollback()
+    assert db.session.scalar(select(func.count()).select_from(eduverse.Grade)) == 4
+    assert_stats_consistent(db)
+
+
+def test_grades_api_rejects_other_teacher(journal_school, make_user, login):
+    other_teacher = login(make_user('teacher', journal_school['school']))
+    url = f"/api/subjects/{journal_school['subject']}/grades"
+    assert other_teacher.post(url, json={'dates': DATES, 'rows': []}).status_code == 403
+
+
+def test_grades_api_validates_journal(journal_school, login):
+    url = f"/api/subjects/{journal_school['subject']}/grades"
+    teacher = login(journal_school['teacher'])
+    assert teacher.post(url, json={'dates': DATES, 'rows': []}).status_code == 400
+    assert teacher.post('/api/subjects/999/grades', json={}).status_code == 404
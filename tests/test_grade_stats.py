@@ -0,0 +1,108 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+
+import app as eduverse
+
+
+@pytest.fixture
+def school(db, make_school, make_user):
+    school_id = make_school()
+    subject = eduverse.Subject(name='Математика', school_id=school_id)
+    classes = [eduverse.Class(name=name, school_id=school_id, grade_level=5) for name in ('5А', '5Б')]
+    db.session.add_all([subject, *classes])
+    db.session.flush()
+    students = [make_user('student', school_id) for _ in range(3)]
+    ids = {'school': school_id, 'subject': subject.id, 'classes': [c.id for c in classes],
+           'students': students}
+    db.session.commit()
+    return ids
+
+
+def stats(db):
+    def rows(model, key_names):
+        columns = [getattr(model, name) for name in key_names] + [
+            getattr(model, name) for name in ['count', 'total', 'total_sq'] + [f'h{g}' for g in eduverse.GRADE_SCALE]]
+        # Строки с нулевым count остаются после удалений, пересчёт их не создаёт
+        return sorted(tuple(r) for r in db.session.execute(select(*columns).where(model.count != 0)))
+    return (rows(eduverse.GradeStat, ('student_id', 'subject_id')),
+            rows(eduverse.ClassGradeStat, ('class_id', 'subject_id')))
+
+
+def assert_matches_rebuild(db):
+    incremental = stats(db)
+    eduverse.rebuild_grade_stats()
+    assert stats(db) == incremental
+
+
+def add_grade(db, student_id, subject_id, grade, day=1):
+    g = eduverse.Grade(student_id=student_id, subject_id=subject_id, grade=grade, date=date(2024, 9, day))
+    db.session.add(g)
+    db.session.commit()
+    return g
+
+
+def test_grade_insert_update_delete(db, school):
+    class_a, _ = school['classes']
+    first, second, _ = school['students']
+    db.session.add_all([eduverse.ClassStudent(class_id=class_a, student_id=first),
+                        eduverse.ClassStudent(class_id=class_a, student_id=second)])
+    db.session.commit()
+
+    grades = [add_grade(db, first, school['subject'], 7, day=d) for d in (1, 2)]
+    add_grade(db, second, school['subject'], 10)
+    assert_matches_rebuild(db)
+
+    grades[0].grade = 3
+    db.session.commit()
+    assert_matches_rebuild(db)
+
+    db.session.delete(grades[1])
+    db.session.commit()
+    assert_matches_rebuild(db)
+
+
+def test_class_membership_changes(db, school):
+    class_a, class_b = school['classes']
+    student = school['students'][0]
+    add_grade(db, student, school['subject'], 8)
+    add_grade(db, student, school['subject'], 5, day=2)
+
+    membership = eduverse.ClassStudent(class_id=class_a, student_id=student)
+    db.session.add(membership)
+    db.session.commit()
+    assert_matches_rebuild(db)
+
+    # Перевод в другой класс: оценки уходят из агрегатов 5А в 5Б
+    membership.class_id = class_b
+    db.session.commit()
+    _, class_rows = stats(db)
+    assert [(r[0], r[2]) for r in class_rows] == [(class_b, 2)]
+    assert_matches_rebuild(db)
+
+    db.session.delete(membership)
+    db.session.commit()
+    assert stats(db)[1] == []
+
+
+def test_upsert_existing_key_without_select(db, school):
+    # Обе "первые" оценки вставляются в один и тот же ключ: второй INSERT
+    # должен превратиться в UPDATE, а не упасть с IntegrityError
+    student = school['students'][0]
+    with db.engine.begin() as connection:
+        eduverse.apply_grade_deltas(connection, [(student, school['subject'], 9, 1)])
+        eduverse.apply_grade_deltas(connection, [(student, school['subject'], 4, 1)])
+    student_rows, _ = stats(db)
+    assert [r[:5] for r in student_rows] == [(student, school['subject'], 2, 13, 97)]
+
+
+def test_fallback_without_on_conflict(db, school, monkeypatch):
+    monkeypatch.setattr(eduverse, 'dialect_insert', lambda dialect, table: None)
+    class_a, _ = school['classes']
+    student = school['students'][0]
+    db.session.add(eduverse.ClassStudent(class_id=class_a, student_id=student))
+    db.session.commit()
+    for day, grade in enumerate((6, 9, 6), start=1):
+        add_grade(db, student, school['subject'], grade, day=day)
+    assert_matches_rebuild(db)
@@ -0,0 +1,76 @@
+import logging
+
+import pytest
+from sqlalchemy import select
+
+import app as eduverse
+
+
+@pytest.fixture
+def app_config(request):
+    return {'METRICS_ENABLED': True, 'METRICS_TOKEN': getattr(request, 'param', None)}
+
+
+def test_slow_queries_disabled_without_token(app, db):
+    client = app.test_client()
+    client.get('/api/schools')
+    assert client.get('/metrics/slow-queries').status_code == 404
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'eduverse_requests_total' in response.data
+
+
+@pytest.mark.parametrize('app_config', ['secret'], indirect=True)
+def test_token_required(app, db):
+    client = app.test_client()
+    client.get('/api/schools')
+    for url in ('/metrics', '/metrics/slow-queries'):
+        assert client.get(url).status_code == 401
+        assert client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get(url, headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+    slow = client.get('/metrics/slow-queries', headers={'Authorization': 'Bearer secret'}).get_json()
+    assert any('school' in q['sql'] for q in slow.get('get_schools', []))
+
+
+def test_query_counts_per_endpoint(app, db):
+    client = app.test_client()
+    client.get('/api/schools')
+    stats = eduverse.instrumentation.snapshot()
+    assert stats['get_schools']['requests'] >= 1
+    assert stats['get_schools']['queries'] >= 1
+
+
+
+def run_queries(db, name, statements):
+    @eduverse.instrumentation.event(name)
+    def handler():
+        for statement in statements:
+            db.session.execute(statement)
+    handler()
+    return eduverse.instrumentation.snapshot()[f'socketio:{name}']
+
+
+def by_id(school_id):
+    return select(eduverse.School).where(eduverse.School.id == school_id)
+
+
+def test_n_plus_one_flags_repeated_select(db, caplog):
+    threshold = eduverse.instrumentation.n_plus_one_threshold
+    with caplog.at_level(logging.WARNING, logger='instrumentation'):
+        stats = run_queries(db, 'n_plus_one_loop', [by_id(i) for i in range(threshold + 1)])
+    assert stats['queries'] == threshold + 1
+    assert stats['n_plus_one'] == 1
+    assert any('N+1' in record.getMessage() for record in caplog.records)
+
+
+def test_n_plus_one_ignores_distinct_and_batched_selects(db, caplog):
+    threshold = eduverse.instrumentation.n_plus_one_threshold
+    # По порогу на форму: IN-списки разной длины сворачиваются в одну форму
+    statements = [by_id(i) for i in range(threshold)]
+    statements += [select(eduverse.School).where(eduverse.School.id.in_(range(n)))
+                   for n in range(1, threshold + 1)]
+    with caplog.at_level(logging.WARNING, logger='instrumentation'):
+        stats = run_queries(db, 'n_plus_one_batched', statements)
+    assert stats['n_plus_one'] == 0
+    assert not any('N+1' in record.getMessage() for record in caplog.records)
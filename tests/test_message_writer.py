@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, select
+
+import app as eduverse
+from message_writer import MessageWriter, WriteError
+
+
+@pytest.fixture
+def chat(db, make_user):
+    sender_id = make_user('super_admin')
+    chat = eduverse.Chat(name='класс', chat_type='group')
+    db.session.add(chat)
+    db.session.flush()
+    chat_id = chat.id
+    db.session.commit()
+    return chat_id, sender_id
+
+
+@pytest.fixture
+def writer(app, db, tmp_path):
+    writer = MessageWriter(app, db, eduverse.Message, retries=2, retry_delay=0,
+                           dead_letter_path=str(tmp_path / 'dead.jsonl'))
+    # Очередь сбрасывается вручную через flush(), без фоновой задачи
+    writer._running = True
+    writer._wakeup = threading.Event()
+    return writer
+
+
+def row(chat, content='текст'):
+    chat_id, sender_id = chat
+    return {'chat_id': chat_id, 'sender_id': sender_id, 'receiver_id': None,
+            'content': content, 'timestamp': datetime(2024, 9, 1, 8, 0)}
+
+
+def stored(db):
+    return db.session.execute(select(eduverse.Message.id, eduverse.Message.content)
+                              .order_by(eduverse.Message.id)).all()
+
+
+def test_ticket_gets_row_id(db, writer, chat):
+    tickets = [writer.put(row(chat, str(i))) for i in range(3)]
+    assert not any(ticket.done for ticket in tickets)
+
+    assert writer.flush() == 3
+    assert [(t.id, t.row['content']) for t in tickets] == [tuple(r) for r in stored(db)]
+    assert tickets[0].wait(0) == tickets[0].id
+
+
+def test_transient_failure_is_retried(db, writer, chat):
+    insert = writer._insert
+    calls = []
+
+    def flaky(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        return insert(rows)
+
+    writer._insert = flaky
+    tickets = [writer.put(row(chat)) for _ in range(4)]
+    assert writer.flush() == 4
+    assert calls == [4, 4]
+    assert writer.stats['retried'] == 4
+    assert writer.stats['failed'] == 0
+    assert all(ticket.wait(0) for ticket in tickets)
+
+
+def test_bad_row_goes_to_dead_letter(db, writer, chat, tmp_path):
+    tickets = [writer.put(row(chat, str(i))) for i in range(5)]
+    tickets[3].row['content'] = None
+
+    assert writer.flush() == 4
+    assert [r.content for r in stored(db)] == ['0', '1', '2', '4']
+    assert writer.stats['failed'] == 1
+    with pytest.raises(WriteError):
+        tickets[3].wait(0)
+    assert all(t.wait(0) for i, t in enumerate(tickets) if i != 3)
+
+    records = [json.loads(line) for line in (tmp_path / 'dead.jsonl').read_text().splitlines()]
+    assert len(records) == 1
+    assert records[0]['row']['chat_id'] == chat[0]
+    assert 'IntegrityError' in records[0]['error']
+
+
+def test_wait_times_out(writer, chat):
+    ticket = writer.put(row(chat))
+    with pytest.raises(WriteError):
+        ticket.wait(0.01)
+
+
+def test_ticket_wakes_on_resolve(writer, chat):
+    ticket = writer.put(row(chat))
+    assert writer._wakeup.is_set()
+    timer = threading.Timer(0.05, writer.flush)
+    started = time.monotonic()
+    timer.start()
+    assert ticket.wait(5) is not None
+    # Квитанция будится записью пакета, а не опросом с паузой
+    assert time.monotonic() - started < 1
+    timer.join()
+
+
+def test_background_task_writes_without_waiting_window(app, db, chat):
+    writer = MessageWriter(app, db, eduverse.Message, flush_interval=0)
+    try:
+        started = time.monotonic()
+        ticket = writer.put(row(chat))
+        assert ticket.wait(5) is not None
+        assert time.monotonic() - started < 0.5
+        assert writer.stats['batches'] == 1
+    finally:
+        writer.close()
+
+
+def test_executemany_fallback_without_returning(db, writer, chat, monkeypatch):
+    dialect = db.engine.dialect
+    monkeypatch.setattr(dialect, 'insert_executemany_returning_sort_by_parameter_order', False)
+    statements = []
+
+    def listener(conn, cursor, statement, params, context, many):
+        statements.append((statement, many))
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        tickets = [writer.put(row(chat, str(i))) for i in range(3)]
+        assert writer.flush() == 3
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    inserts = [many for statement, many in statements if statement.startswith('INSERT')]
+    assert inserts == [True]
+    assert [(t.id, t.row['content']) for t in tickets] == [tuple(r) for r in stored(db)]
+
+
+def test_ack_after_message_is_stored(app, db, chat, login):
+    chat_id, sender_id = chat
+    client = eduverse.socketio.test_client(app, flask_test_client=login(sender_id))
+    client.emit('join', {'room': str(chat_id)})
+    client.get_received()
+
+    ack = client.emit('message', {'room': chat_id, 'content': 'привет'}, callback=True)
+    assert 'error' not in ack
+    # Обработчики тестового клиента работают в контексте приложения теста
+    db.session.rollback()
+    stored = db.session.execute(select(eduverse.Message)).scalars().all()
+    assert len(stored) == 1
+    # Ack и рассылка - с id строки и временем в том же виде, что в истории чата
+    history = eduverse.message_to_dict(stored[0])
+    assert ack == {'id': history['id'], 'timestamp': history['timestamp']}
+    [received] = [p for p in client.get_received() if p['name'] == 'message']
+    assert received['args'] == history
+    client.disconnect()
+
+
+def test_failed_write_is_rejected(app, db, chat, login, monkeypatch):
+    def broken(rows):
+        raise RuntimeError('диск недоступен')
+
+    monkeypatch.setattr(eduverse.message_writer, '_insert', broken)
+    monkeypatch.setattr(eduverse.message_writer, 'retry_delay', 0)
+    chat_id, sender_id = chat
+    client = eduverse.socketio.test_client(app, flask_test_client=login(sender_id))
+    client.emit('join', {'room': str(chat_id)})
+    client.get_received()
+
+    ack = client.emit('message', {'room': chat_id, 'content': 'привет'}, callback=True)
+    assert 'error' in ack
+    # Сообщение, которое не сохранилось, не рассылается
+    assert [p['name'] for p in client.get_received()] == ['error']
+    client.disconnect()
+
+
+@pytest.mark.parametrize('app_config', [{'CHAT_PERSIST_MESSAGES': False}], indirect=True)
+def test_unsaved_message_has_no_id(app, db, chat, login):
+    chat_id, sender_id = chat
+    client = eduverse.socketio.test_client(app, flask_test_client=login(sender_id))
+    client.emit('join', {'room': str(chat_id)})
+    ack = client.emit('message', {'room': chat_id, 'content': 'привет'}, callback=True)
+    assert ack['id'] is None
+    assert datetime.fromisoformat(ack['timestamp']) <= datetime.utcnow()
+    client.disconnect()
@@ -0,0 +1,80 @@
+import importlib.util
+import io
+import os
+import sqlite3
+import subprocess
+import sys
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def flask(database, *args):
+    # Отдельный процесс: env.py Alembic перенастраивает логирование всего процесса
+    env = dict(os.environ, FLASK_APP='app:create_app', DATABASE_URL=f'sqlite:///{database}',
+               SOCKETIO_ASYNC_MODE='threading', PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    return subprocess.run([sys.executable, '-m', 'flask', *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=120)
+
+
+def flask_db(database, *args):
+    return flask(database, 'db', *args)
+
+
+def init_db(database):
+    result = flask(database, 'init-db', '--admin-password', 'test-password')
+    assert result.returncode == 0, result.stderr
+
+
+def test_migrations_match_models(tmp_path):
+    database = tmp_path / 'eduverse.db'
+    init_db(database)
+    for args in (['stamp', 'head'], ['check'],
+                 ['downgrade', '0001_baseline'], ['upgrade'], ['check']):
+        result = flask_db(database, *args)
+        assert result.returncode == 0, (args, result.stderr)
+    with sqlite3.connect(database) as connection:
+        indexes = dict(connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name IN ('grade', 'message')"))
+    assert 'UNIQUE' in indexes['ix_grade_student_subject_date']
+    assert indexes['ix_message_chat_pinned'].endswith('WHERE is_pinned = 1')
+
+
+def test_upgrade_stops_on_duplicate_grades(tmp_path):
+    database = tmp_path / 'eduverse.db'
+    init_db(database)
+    assert flask_db(database, 'stamp', 'head').returncode == 0
+    assert flask_db(database, 'downgrade', '0001_baseline').returncode == 0
+    with sqlite3.connect(database) as connection:
+        connection.execute(
+            "INSERT INTO grade (student_id, subject_id, grade, date) "
+            "VALUES (1, 1, 5, '2024-01-01'), (1, 1, 4, '2024-01-01')")
+    result = flask_db(database, 'upgrade')
+    assert result.returncode != 0
+    assert '1/1/2024-01-01 x2' in result.stderr
+
+
+def migration_sql(dialect, step):
+    """DDL ревизии 0002 в офлайн-режиме для заданного диалекта."""
+    path = os.path.join(ROOT, 'migrations', 'versions', '0002_backlog_indexes.py')
+    spec = importlib.util.spec_from_file_location('backlog_indexes', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    buffer = io.StringIO()
+    context = MigrationContext.configure(dialect_name=dialect,
+                                         opts={'as_sql': True, 'output_buffer': buffer})
+    with Operations.context(context):
+        getattr(module, step)()
+    return buffer.getvalue()
+
+
+def test_postgresql_ddl_uses_boolean_predicate():
+    upgrade = migration_sql('postgresql', 'upgrade')
+    assert ('CREATE INDEX ix_message_chat_pinned ON message (chat_id, timestamp, id) '
+            'WHERE is_pinned = true') in upgrade
+    assert 'is_pinned = 1' not in upgrade
+    assert 'ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)' in upgrade
+    assert 'CREATE UNIQUE INDEX ix_grade_student_subject_date' in upgrade
+    assert 'DROP INDEX ix_message_chat_pinned' in migration_sql('postgresql', 'downgrade')
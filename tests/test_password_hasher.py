@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import app as eduverse
+from password_hasher import HashLimitError, PasswordHasher, hash_params
+
+
+def test_hash_params():
+    assert hash_params('pbkdf2:sha256:1000') == 'pbkdf2:sha256:1000'
+    assert hash_params('pbkdf2').startswith('pbkdf2:sha256:')
+    assert hash_params('scrypt') == 'scrypt:32768:8:1'
+
+
+def test_verify_rehashes_old_method():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=0)
+    old = generate_password_hash('secret', 'pbkdf2:sha256:500')
+    valid, new_hash = hasher.verify(old, 'secret')
+    assert valid and new_hash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify(new_hash, 'secret') == (True, None)
+    assert hasher.verify(new_hash, 'wrong') == (False, None)
+
+
+def test_hashing_runs_in_pool_thread():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=2)
+    hasher.init_app(async_mode='threading')
+    threads = []
+    hasher._run(lambda: threads.append(threading.current_thread().name))
+    assert threads[0].startswith('password-hash')
+
+
+def test_hash_many_fans_out_over_pool():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=2)
+    hasher.init_app(async_mode='threading')
+    barrier = threading.Barrier(2, timeout=5)
+    threads = set()
+
+    def hash_in_pool(password, method):
+        # Оба пароля должны считаться одновременно, иначе барьер не пройдёт
+        barrier.wait()
+        threads.add(threading.current_thread().name)
+        return generate_password_hash(password, method)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr('password_hasher.generate_password_hash', hash_in_pool)
+        hashes = hasher.hash_many(['a', 'b'])
+    assert len(threads) == 2 and all(name.startswith('password-hash') for name in threads)
+    assert [hasher.verify(h, p)[0] for h, p in zip(hashes, 'ab')] == [True, True]
+    assert hasher.stats['hashed'] == 2
+
+
+def test_limits_per_username_ip_and_total():
+    hasher = PasswordHasher(workers=0, max_pending=3, per_ip=2, per_username=1)
+    with hasher.limit('10.0.0.1', 'anna'):
+        with pytest.raises(HashLimitError):
+            with hasher.limit('10.0.0.2', 'anna'):
+                pass
+        with hasher.limit('10.0.0.1', 'boris'):
+            with pytest.raises(HashLimitError):
+                with hasher.limit('10.0.0.1', 'vera'):
+                    pass
+            with hasher.limit('10.0.0.3', 'vera'):
+                assert hasher.pending == 3
+                with pytest.raises(HashLimitError):
+                    with hasher.limit('10.0.0.4', 'gleb'):
+                        pass
+    assert hasher.pending == 0 and hasher._active == {}
+    assert hasher.stats['rejected'] == 3
+
+
+def test_login_upgrades_old_hash(app, db, make_user):
+    user_id = make_user('student', username='anna',
+                        password_hash=generate_password_hash('secret', 'pbkdf2:sha256:500'))
+    client = app.test_client()
+    assert client.post('/login', data={'username': 'anna', 'password': 'wrong'}).status_code == 200
+    response = client.post('/login', data={'username': 'anna', 'password': 'secret'})
+    assert response.status_code == 302
+    db.session.rollback()
+    assert db.session.get(eduverse.User, user_id).password_hash.startswith('pbkdf2:sha256:1000$')
+
+
+@pytest.mark.parametrize('app_config', [{'LOGIN_MAX_PER_USERNAME': 1}], indirect=True)
+def test_login_over_limit_gets_429(app, make_user):
+    make_user('student', username='anna')
+    # Другой вход для того же имени ещё считает хеш
+    with eduverse.password_hasher.limit('10.0.0.9', 'anna'):
+        response = app.test_client().post('/login', data={'username': 'anna', 'password': 'x'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_register_hashes_with_configured_method(app, db):
+    response = app.test_client().post('/register', data={
+        'username': 'new', 'email': 'new@example.com', 'password': 'secret', 'role': 'student'})
+    assert response.status_code == 302
+    db.session.rollback()
+    user = eduverse.User.query.filter_by(username='new').one()
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import insert, select
+
+import app as eduverse
+
+
+@pytest.mark.parametrize('amount, paid, status', [
+    (100, None, 'due'), (100, 0, 'due'), (100, 40, 'partial'), (100, 100, 'paid'), (100, 120, 'paid'),
+])
+def test_payment_status(amount, paid, status):
+    assert eduverse.payment_status(amount, paid) == status
+
+
+def test_orm_writes_keep_status_in_sync(db, make_school, make_user):
+    student = make_user('student', make_school())
+    payment = eduverse.Payment(student_id=student, amount=100.0, due_date=date(2024, 9, 5),
+                               month=9, year=2024)
+    db.session.add(payment)
+    db.session.commit()
+    assert payment.status == 'due'
+    payment.paid_amount = 30.0
+    db.session.commit()
+    assert payment.status == 'partial'
+
+
+@pytest.fixture
+def payments(db, make_school, make_user):
+    """Платежи двух школ, записанные в обход ORM со статусом 'due'."""
+    schools = [make_school(), make_school()]
+    students = [make_user('student', school_id) for school_id in schools]
+    rows = [
+        # (ученик, сумма, оплачено, срок)
+        (students[0], 100.0, 100.0, date(2024, 8, 5)),
+        (students[0], 100.0, 30.0, date(2024, 9, 5)),
+        (students[0], 100.0, 0.0, date(2024, 9, 5)),
+        (students[0], 100.0, 0.0, date(2024, 10, 5)),
+        (students[1], 50.0, None, date(2024, 9, 1)),
+    ]
+    db.session.execute(insert(eduverse.Payment), [
+        {'student_id': s, 'amount': a, 'paid_amount': p, 'due_date': d, 'month': d.month,
+         'year': d.year, 'status': 'due'} for s, a, p, d in rows])
+    db.session.commit()
+    return schools
+
+
+# Последняя пачка - хвост после последней полной (может быть пустым)
+@pytest.mark.parametrize('chunk_size, chunks', [(1, 6), (2, 3), (5000, 1)])
+def test_sweep_recomputes_statuses_in_chunks(db, payments, chunk_size, chunks):
+    report = eduverse.sweep_payments(chunk_size=chunk_size, today=date(2024, 9, 20))
+    assert report['updated'] == 2
+    assert report['chunks'] == chunks
+    statuses = db.session.execute(select(eduverse.Payment.status).order_by(eduverse.Payment.id)).scalars()
+    assert list(statuses) == ['paid', 'partial', 'due', 'due', 'due']
+    assert report['overdue_by_school'] == {
+        payments[0]: {'count': 2, 'outstanding': 170.0},
+        payments[1]: {'count': 1, 'outstanding': 50.0},
+    }
+    assert report['overdue_total'] == 3
+
+    # Обход берёт блокировку записи с начала транзакции: чтение теста завершается
+    db.session.rollback()
+    assert eduverse.sweep_payments(chunk_size=chunk_size, today=date(2024, 9, 20))['updated'] == 0
+
+
+def test_sweep_command(app, payments):
+    result = app.test_cli_runner().invoke(args=['sweep-payments', '--date', '2024-09-20', '--chunk-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'Обновлено статусов: 2 за 3 пачек' in result.output
+    assert f'школа {payments[0]}: 2 платежей, долг 170.0' in result.output
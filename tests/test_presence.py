@@ -0,0 +1,94 @@
+import pytest
+
+import app as eduverse
+from presence import LocalPresenceBackend, Presence, school_room
+from user_cache import LocalCacheBackend
+
+
+@pytest.fixture
+def clock():
+    return [1000.0]
+
+
+@pytest.fixture
+def presence(clock):
+    loads = []
+
+    def load_chat_ids(user_id):
+        loads.append(user_id)
+        return {10, 11} if user_id == 1 else set()
+    presence = Presence(LocalPresenceBackend(), LocalCacheBackend(ttl=60), load_chat_ids,
+                        heartbeat_timeout=90, clock=lambda: clock[0])
+    presence.loads = loads
+    return presence
+
+
+def test_tabs_of_one_user_count_once(presence):
+    assert presence.connect('a', 1, school_id=5) is True
+    assert presence.connect('b', 1, school_id=5) is False
+    presence.connect('c', 2, school_id=5)
+    for sid in ('a', 'b', 'c'):
+        presence.join(sid, 10)
+    assert presence.online_in_room(10) == 2
+    assert presence.online_in_school(5) == 2
+    assert presence.members_online(10) == {1, 2}
+    assert presence.rooms('a') == {'10', school_room(5)}
+
+    assert presence.disconnect('a') == (1, False)
+    assert presence.online_in_room(10) == 2
+    assert presence.disconnect('b') == (1, True)
+    assert presence.online_in_room(10) == 1 and not presence.is_online(1)
+    assert presence.disconnect('b') is None
+    assert presence.counts() == {'connections': 1, 'users': 1}
+
+
+def test_leave_and_repeated_join(presence):
+    presence.connect('a', 1)
+    assert presence.join('a', 10) is True
+    assert presence.join('a', 10) is False
+    assert presence.leave('a', 10) is True
+    assert presence.online_in_room(10) == 0
+    assert presence.leave('a', 10) is False
+
+
+def test_sweep_drops_connections_without_heartbeat(presence, clock):
+    presence.connect('a', 1)
+    presence.connect('b', 2)
+    presence.join('a', 10)
+    clock[0] += 60
+    assert presence.heartbeat('b') is True
+    clock[0] += 60
+    assert presence.sweep() == ['a']
+    assert presence.online_in_room(10) == 0
+    assert presence.last_seen(1) == clock[0]
+    assert presence.heartbeat('a') is False
+
+
+def test_membership_cache(presence):
+    assert presence.can_join(1, 10) and not presence.can_join(1, 12)
+    assert presence.loads == [1]
+    presence.invalidate_memberships(1)
+    assert presence.can_join(1, 11)
+    assert presence.loads == [1, 1]
+    assert presence.stats['rejected'] == 1
+
+
+def test_chat_participant_changes_reset_membership(app, db, make_user, login):
+    member = make_user('student')
+    chat = eduverse.Chat(name='класс', chat_type='group')
+    db.session.add(chat)
+    db.session.flush()
+    chat_id = chat.id
+    db.session.commit()
+    assert not eduverse.presence.can_join(member, chat_id)
+
+    db.session.add(eduverse.ChatParticipant(chat_id=chat_id, user_id=member))
+    db.session.commit()
+    assert eduverse.presence.can_join(member, chat_id)
+
+    client = eduverse.socketio.test_client(app, flask_test_client=login(member))
+    client.emit('join', {'room': str(chat_id)})
+    response = login(member).get(f'/api/chats/{chat_id}/online')
+    assert response.get_json() == {'chat_id': chat_id, 'online': 1, 'user_ids': [member]}
+    client.disconnect()
+    assert eduverse.presence.online_in_room(chat_id) == 0
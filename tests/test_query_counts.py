@@ -0,0 +1,114 @@
+"""Число SQL-запросов дашбордов не растёт с объёмом данных (нет N+1)."""
+
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event, insert
+
+import app as eduverse
+
+SCALES = (1, 5, 20)
+
+# Число запросов на страницу (пользователь уже в кэше user_loader); одно и то же
+# во всех масштабах, иначе где-то появился N+1
+EXPECTED = {
+    'student': 4,
+    'parent': 4,
+    'teacher': 2,
+    'school_overview': 6,
+    'chats': 2,
+    'admin_schools': 2,
+}
+
+
+def seed(scale):
+    """Школа, у которой всего в scale раз больше; адреса дашбордов и их пользователи."""
+    m = eduverse
+    session = m.db.session
+
+    def add_all(model, rows):
+        return session.execute(insert(model).returning(model.id), rows).scalars().all()
+
+    school_id = add_all(m.School, [{'name': f'Школа {i}', 'unique_url': f'school{i}'}
+                                   for i in range(1 + scale)])[0]
+    subject_ids = add_all(m.Subject, [{'name': f'Предмет {i}', 'school_id': school_id}
+                                      for i in range(3 * scale)])
+    class_ids = add_all(m.Class, [{'name': f'{i}А', 'school_id': school_id, 'grade_level': 1 + i % 11}
+                                  for i in range(2 * scale)])
+
+    def users(role, count):
+        return add_all(m.User, [{'username': f'{role}{i}', 'email': f'{role}{i}@example.com',
+                                 'password_hash': '-', 'role': role, 'school_id': school_id}
+                                for i in range(count)])
+
+    teacher_ids = users('teacher', 2 * scale)
+    student_ids = users('student', 5 * scale)
+    parent_id = users('parent', 1)[0]
+    admin_id = users('school_admin', 1)[0]
+    super_admin_id = users('super_admin', 1)[0]
+
+    session.execute(insert(m.TeacherSubject), [
+        {'teacher_id': teacher_ids[i % len(teacher_ids)], 'subject_id': s}
+        for i, s in enumerate(subject_ids)] + [
+        {'teacher_id': teacher_ids[0], 'subject_id': s} for s in subject_ids[1:]])
+    session.execute(insert(m.StudentSubject), [
+        {'student_id': st, 'subject_id': s} for st in student_ids for s in subject_ids])
+    session.execute(insert(m.ClassStudent), [
+        {'class_id': class_ids[i % len(class_ids)], 'student_id': st} for i, st in enumerate(student_ids)])
+    session.execute(insert(m.ParentChild), [
+        {'parent_id': parent_id, 'child_id': st} for st in student_ids[:1 + scale]])
+    session.execute(insert(m.Grade), [
+        {'student_id': st, 'subject_id': s, 'grade': 1 + (st + s) % 10, 'date': date(2024, 9, 1 + s % 28)}
+        for st in student_ids for s in subject_ids])
+    session.execute(insert(m.Payment), [
+        {'student_id': st, 'amount': 100.0, 'due_date': date(2024, month, 5),
+         'month': month, 'year': 2024, 'status': 'due'}
+        for st in student_ids for month in range(1, 1 + min(12, 2 * scale))])
+    session.execute(insert(m.Event), [
+        {'school_id': school_id, 'title': f'Событие {i}',
+         'start_date': datetime(2024, 9, 1), 'end_date': datetime(2024, 9, 2)}
+        for i in range(scale)])
+    chat_ids = add_all(m.Chat, [{'name': f'Чат {i}', 'chat_type': 'group', 'school_id': school_id}
+                                for i in range(scale)])
+    session.execute(insert(m.ChatParticipant), [
+        {'chat_id': c, 'user_id': u} for c in chat_ids for u in [student_ids[0]] + student_ids[1:1 + scale]])
+    session.commit()
+
+    return {
+        'student': (student_ids[0], '/api/dashboard/student'),
+        'parent': (parent_id, '/api/dashboard/parent'),
+        'teacher': (teacher_ids[0], '/api/dashboard/teacher'),
+        'school_overview': (admin_id, f'/api/schools/{school_id}/overview'),
+        'chats': (student_ids[0], '/api/chats'),
+        'admin_schools': (super_admin_id, '/api/admin/schools'),
+    }
+
+
+def count_queries(app, client, url):
+    # Первый запрос прогревает кэш user_loader
+    client.get(url)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = eduverse.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return len(statements)
+
+
+@pytest.mark.parametrize('scale', SCALES)
+def test_dashboard_query_counts(app, login, scale):
+    # Запросы идут вне контекста заполнения, иначе сессия и g общие с сидом
+    with app.app_context():
+        targets = seed(scale)
+    eduverse.user_cache.backend.clear()
+    counts = {name: count_queries(app, login(user_id), url)
+              for name, (user_id, url) in targets.items()}
+    assert counts == EXPECTED
@@ -0,0 +1,125 @@
+import csv
+import io
+import time
+import zipfile
+from datetime import date
+
+import pytest
+from sqlalchemy import event, insert
+
+import app as eduverse
+from report_export import iter_csv, iter_report, iter_xlsx
+
+
+def test_csv_has_bom_once_and_streams_in_chunks():
+    rows = [(date(2024, 9, i), 'Иванов', i, None) for i in range(1, 6)]
+    chunks = list(iter_csv(['Дата', 'Ученик', 'Оценка', 'Комментарий'], iter(rows), chunk_rows=2))
+    assert len(chunks) == 3
+    assert chunks[0].startswith(b'\xef\xbb\xbf') and not chunks[1].startswith(b'\xef\xbb\xbf')
+    parsed = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8-sig'))))
+    assert parsed[0] == ['Дата', 'Ученик', 'Оценка', 'Комментарий']
+    assert parsed[1] == ['2024-09-01', 'Иванов', '1', '']
+    assert len(parsed) == 6
+
+
+def test_csv_neutralizes_formulas():
+    rows = [('=HYPERLINK("http://x")', '+1', '-2+3', '@SUM(A1)', '\tA', '\r=1', 'обычный', -5, 7.5)]
+    data = b''.join(iter_csv(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i'], iter(rows)))
+    parsed = list(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+    assert parsed[1] == ["'=HYPERLINK(\"http://x\")", "'+1", "'-2+3", "'@SUM(A1)", "'\tA", "'\r=1",
+                         'обычный', '-5', '7.5']
+
+
+def test_xlsx_is_a_valid_workbook():
+    rows = [('Петров', 9, 'a\x01<b>'), ('Сидоров', 7.5, None)]
+    data = b''.join(iter_xlsx(['Ученик', 'Оценка', 'Комментарий'], iter(rows), chunk_rows=1))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+    assert sheet.count('<row>') == 3
+    assert '<c><v>9</v></c>' in sheet
+    assert 'a&lt;b&gt;' in sheet and '\x01' not in sheet
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        iter_report('pdf', [], [])
+
+
+@pytest.fixture
+def report_school(db, make_school, make_user):
+    """Школа, где ученик состоит в двух классах, и у каждого ученика одна оценка и платёж."""
+    school_id = make_school()
+    subject = eduverse.Subject(name='Химия', school_id=school_id)
+    classes = [eduverse.Class(name=name, school_id=school_id, grade_level=9) for name in ('9А', '9Б')]
+    db.session.add_all([subject, *classes])
+    db.session.flush()
+    ids = {'school': school_id, 'subject': subject.id, 'classes': [c.id for c in classes]}
+    db.session.commit()
+    ids['students'] = both, only_b, no_class = [make_user('student', school_id) for _ in range(3)]
+    ids['admin'] = make_user('school_admin', school_id)
+    db.session.execute(insert(eduverse.ClassStudent), [
+        {'class_id': ids['classes'][0], 'student_id': both},
+        {'class_id': ids['classes'][1], 'student_id': both},
+        {'class_id': ids['classes'][1], 'student_id': only_b},
+    ])
+    db.session.execute(insert(eduverse.Grade), [
+        {'student_id': s, 'subject_id': subject.id, 'grade': 8, 'date': date(2024, 9, 2)}
+        for s in ids['students']])
+    db.session.execute(insert(eduverse.Payment), [
+        {'student_id': s, 'amount': 100.0, 'due_date': date(2024, 9, 5), 'month': 9, 'year': 2024,
+         'status': 'due'} for s in ids['students']])
+    db.session.commit()
+    return ids
+
+
+def csv_rows(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return list(csv.reader(io.StringIO(response.get_data().decode('utf-8-sig'))))[1:]
+
+
+@pytest.mark.parametrize('report, class_column', [('grades', 1), ('payments', 0)])
+def test_student_in_two_classes_is_exported_once(report_school, login, report, class_column):
+    client = login(report_school['admin'])
+    url = f"/api/schools/{report_school['school']}/exports/{report}"
+    response = client.get(url)
+    rows = csv_rows(response)
+    assert sorted(row[class_column] for row in rows) == ['', '9А', '9Б']
+    assert response.headers['X-Export-Rows'] == '3'
+
+    rows = csv_rows(client.get(f"{url}?class_id={report_school['classes'][1]}"))
+    assert [row[class_column] for row in rows] == ['9Б', '9Б']
+
+
+@pytest.mark.parametrize('app_config', [{'EXPORT_SYNC_MAX_ROWS': 2}], indirect=True)
+def test_sync_export_limit_counts_only_up_to_the_limit(app, db, report_school, login):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = login(report_school['admin']).get(
+            f"/api/schools/{report_school['school']}/exports/grades")
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 413
+    assert response.get_json()['max_rows'] == 2
+    count = next((s, p) for s, p in statements if 'count(' in s)
+    assert 'LIMIT' in count[0] and 3 in count[1]
+
+
+def test_background_export(app, report_school, login):
+    client = login(report_school['admin'])
+    response = client.post(f"/api/schools/{report_school['school']}/exports/payments?format=xlsx")
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['total'] == 3
+    deadline = time.monotonic() + 5
+    while job['status'] not in ('done', 'failed') and time.monotonic() < deadline:
+        time.sleep(0.02)
+        job = client.get(job['status_url']).get_json()
+    assert job['status'] == 'done' and job['rows'] == 3
+    data = client.get(job['download_url']).get_data()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read('xl/worksheets/sheet1.xml').decode().count('<row>') == 4
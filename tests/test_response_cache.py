@@ -0,0 +1,86 @@
+import pytest
+from flask import Flask
+
+import app as eduverse
+import response_cache
+from response_cache import LocalGenerations, ResponseCache, create_generations
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое time.monotonic модуля response_cache."""
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_local_generation_expires_after_ttl(clock):
+    generations = LocalGenerations(ttl=30)
+    first = generations.get('schools')
+    clock[0] += 29
+    assert generations.get('schools') == first
+    clock[0] += 2
+    assert generations.get('schools') > first
+
+
+def test_local_generation_without_ttl_changes_only_on_bump(clock):
+    generations = LocalGenerations()
+    clock[0] += 10 ** 6
+    assert generations.get('schools') == 0
+    assert generations.bump('schools') == 1
+    assert generations.get('schools') == 1
+
+
+def test_create_generations():
+    assert create_generations(None, local_ttl=5).ttl == 5
+    assert isinstance(create_generations('memory://'), LocalGenerations)
+    with pytest.raises(ValueError):
+        create_generations('kafka://localhost')
+
+
+def test_etag_does_not_depend_on_generation():
+    body = b'{"schools":[]}' * 100
+    first = response_cache.CachedBody(1, body, min_compress_size=512)
+    other = response_cache.CachedBody(7, body, min_compress_size=512)
+    assert first.etags == other.etags
+    assert set(first.etags) >= {'identity', 'gzip'}
+
+
+def test_schools_etag_and_bump(app, db):
+    db.session.add(eduverse.School(name='Гимназия', unique_url='gym'))
+    db.session.commit()
+    client = app.test_client()
+
+    response = client.get('/api/schools', headers={'Accept-Encoding': 'identity'})
+    etag = response.headers['ETag']
+    assert [school['name'] for school in response.get_json()] == ['Гимназия']
+
+    response = client.get('/api/schools', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # Тело не изменилось: новое поколение даёт тот же ETag
+    eduverse.response_cache.bump('schools')
+    assert client.get('/api/schools', headers={'If-None-Match': etag}).status_code == 304
+
+    db.session.add(eduverse.School(name='Лицей', unique_url='lyceum'))
+    db.session.commit()
+    response = client.get('/api/schools', headers={'If-None-Match': etag, 'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.get_json()) == 2
+
+
+def test_other_worker_sees_change_after_ttl(clock):
+    # Два воркера без Redis: bump() одного не доходит до другого
+    data = {'value': 1}
+    workers = [ResponseCache(LocalGenerations(ttl=30)) for _ in range(2)]
+    app = Flask(__name__)
+    with app.test_request_context('/api/schools'):
+        for cache in workers:
+            assert cache.respond('schools', lambda: dict(data)).get_json() == {'value': 1}
+        data['value'] = 2
+        workers[0].bump('schools')
+        assert workers[0].respond('schools', lambda: dict(data)).get_json() == {'value': 2}
+        assert workers[1].respond('schools', lambda: dict(data)).get_json() == {'value': 1}
+        clock[0] += 31
+        assert workers[1].respond('schools', lambda: dict(data)).get_json() == {'value': 2}
@@ -0,0 +1,96 @@
+import logging
+
+import pytest
+from sqlalchemy import Column, MetaData, Table, Text, insert
+
+import app as eduverse
+from search_index import SearchError, SearchIndex, parse_query
+
+
+@pytest.fixture
+def schools(db):
+    """Две школы с предметами; возвращает их id."""
+    ids = []
+    for name in ('Гимназия', 'Лицей'):
+        school = eduverse.School(name=name, unique_url=name.lower())
+        db.session.add(school)
+        db.session.flush()
+        ids.append(school.id)
+    db.session.execute(insert(eduverse.Subject), [
+        {'school_id': ids[0], 'name': 'Математика', 'description': 'Алгебра и геометрия'},
+        {'school_id': ids[0], 'name': 'Физика', 'description': 'Механика, немного математики'},
+        {'school_id': ids[1], 'name': 'Математика', 'description': 'Углублённая программа'},
+    ])
+    db.session.commit()
+    return ids
+
+
+def test_parse_query():
+    assert parse_query('Алгебра  И, геометрия!') == ['алгебра', 'и', 'геометрия']
+    with pytest.raises(SearchError):
+        parse_query(' ,. ')
+
+
+def test_fts5_ranks_title_matches_first_within_scope(db, schools):
+    assert eduverse.search_index.backend(db.session, 'subjects') == 'fts5'
+    rows = eduverse.search_index.search(db.session, 'subjects', 'математ', scope=[schools[0]])
+    assert [row.name for row in rows] == ['Математика', 'Физика']
+    assert rows[0].score > rows[1].score
+    assert eduverse.search_index.search(db.session, 'subjects', 'математика', scope=[]) == []
+
+
+def test_rows_inserted_past_orm_are_indexed(db, schools):
+    # Триггеры FTS5 поддерживают индекс и для вставок без ORM
+    db.session.execute(insert(eduverse.Subject), [
+        {'school_id': schools[1], 'name': 'Астрономия', 'description': None}])
+    db.session.commit()
+    rows = eduverse.search_index.search(db.session, 'subjects', 'астроно')
+    assert [row.name for row in rows] == ['Астрономия']
+
+
+def test_like_fallback_without_index_and_reindex_command(app, db, schools, caplog):
+    with db.engine.begin() as connection:
+        eduverse.search_index.drop(connection, ['subjects'])
+    with caplog.at_level(logging.WARNING, logger='search_index'):
+        assert eduverse.search_index.backend(db.session, 'subjects') == 'like'
+    assert 'flask reindex-search' in caplog.text
+    rows = eduverse.search_index.search(db.session, 'subjects', 'математика', scope=[schools[1]])
+    assert [(row.name, row.score) for row in rows] == [('Математика', None)]
+
+    result = app.test_cli_runner().invoke(args=['reindex-search', '--type', 'subjects'])
+    assert result.exit_code == 0, result.output
+    assert 'subjects - 3' in result.output
+    db.session.rollback()
+    assert eduverse.search_index.backend(db.session, 'subjects') == 'fts5'
+
+
+def test_tsvector_expression_weights_every_column():
+    index = SearchIndex(text_config='russian')
+    index.register('events', eduverse.Event.__table__, ['title', 'description'], scope='school_id')
+    assert index._tsvector(index.documents['events']) == (
+        "setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'B')")
+
+
+def test_owns_only_search_objects():
+    index = eduverse.search_index
+    vector = Column('search_vector', Text)
+    Table('event', MetaData(), vector)
+    other = Column('search_vector', Text)
+    Table('grade', MetaData(), other)
+    assert index.owns(None, 'event_fts', 'table')
+    assert index.owns(None, 'message_fts_data', 'table')
+    assert index.owns(None, 'ix_subject_search', 'index')
+    assert index.owns(vector, 'search_vector', 'column')
+    assert not index.owns(other, 'search_vector', 'column')
+    assert not index.owns(None, 'ix_grade_search', 'index')
+    assert not index.owns(None, 'event', 'table')
+
+
+def test_search_api_limits_schools(app, schools, make_user, login):
+    client = login(make_user('teacher', schools[1]))
+    response = client.get('/api/search?type=subjects&q=математика')
+    assert response.status_code == 200
+    assert [subject['school_id'] for subject in response.get_json()['subjects']] == [schools[1]]
+    assert client.get(f'/api/search?type=subjects&q=x&school_id={schools[0]}').status_code == 403
+    assert client.get('/api/search?type=subjects&q=%20').status_code == 400
@@ -0,0 +1,65 @@
+import pickle
+from types import SimpleNamespace
+
+import pytest
+import socketio
+
+from socketio_backends import LocalSocketManager, MemoryManager, create_client_manager
+
+
+def test_no_queue_means_single_process():
+    assert create_client_manager(None) is None
+    assert create_client_manager('') is None
+
+
+@pytest.mark.parametrize('url, manager', [
+    ('udp://127.0.0.1:47000-47003', LocalSocketManager),
+    ('memory://', MemoryManager),
+])
+def test_known_schemes(url, manager):
+    assert isinstance(create_client_manager(url), manager)
+
+
+@pytest.mark.parametrize('url', ['redis://localhost:6379/0', 'rediss://localhost:6380/0'])
+def test_redis_schemes(url):
+    pytest.importorskip('redis')
+    assert isinstance(create_client_manager(url), socketio.RedisManager)
+
+
+@pytest.mark.parametrize('url', ['redsi://localhost:6379/0', 'amqp://guest@localhost//', 'localhost:6379'])
+def test_unknown_scheme_is_config_error(url):
+    with pytest.raises(ValueError, match='Неизвестная очередь'):
+        create_client_manager(url)
+
+
+def test_memory_manager_delivers_between_managers():
+    sender = create_client_manager('memory://', channel='test', write_only=True)
+    receiver = create_client_manager('memory://', channel='test')
+    receiver._subscribers['test'].append(receiver._inbox)
+    try:
+        sender._publish({'method': 'emit', 'event': 'message', 'data': 1})
+        assert next(receiver._listen()) and not receiver._inbox
+    finally:
+        receiver.close()
+
+
+@pytest.mark.parametrize('url', ['udp://0.0.0.0:47000-47003', 'udp://10.0.0.5:47000', 'udp://example.com:47000'])
+def test_udp_refuses_non_loopback(url):
+    with pytest.raises(ValueError, match='loopback'):
+        create_client_manager(url)
+
+
+def test_udp_manager_ignores_pickled_datagrams():
+    receiver = create_client_manager('udp://127.0.0.1:0')
+    receiver._sock.bind(('127.0.0.1', 0))
+    port = receiver._sock.getsockname()[1]
+    receiver.server = SimpleNamespace(async_mode='threading')
+    sender = create_client_manager(f'udp://127.0.0.1:{port}', write_only=True)
+    try:
+        evil = pickle.dumps({'method': 'emit', 'event': 'x', 'data': 0})
+        sender._sock.sendto(sender._channel_prefix + evil, ('127.0.0.1', port))
+        sender._publish({'method': 'emit', 'event': 'message', 'data': {'text': 'привет'}})
+        assert next(receiver._listen()) == {'method': 'emit', 'event': 'message', 'data': {'text': 'привет'}}
+    finally:
+        sender.close()
+        receiver.close()
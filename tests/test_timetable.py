@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+import app as eduverse
+from timetable import IntervalSet, Lesson, TimetableEngine, to_minutes
+
+
+def test_interval_set_bisect():
+    intervals = IntervalSet()
+    for start, end, lesson_id in ((540, 585, 1), (600, 645, 2), (660, 705, 3)):
+        intervals.add(start, end, lesson_id)
+    assert not intervals.overlaps
+    assert intervals.overlapping(580, 610) == [1, 2]
+    # Полуоткрытые интервалы: касание концами - не пересечение
+    assert intervals.overlapping(585, 600) == []
+    assert intervals.is_free(585, 600)
+    assert not intervals.is_free(700, 720)
+
+
+def test_interval_set_with_legacy_overlaps():
+    intervals = IntervalSet()
+    intervals.add(0, 100, 'long')
+    intervals.add(10, 20, 'short')
+    assert intervals.overlaps
+    # Концы уже не отсортированы: бинарный поиск пропустил бы длинный урок
+    assert intervals.overlapping(30, 40) == ['long']
+    assert not intervals.is_free(30, 40)
+    assert intervals.is_free(100, 120)
+
+
+def test_engine_conflicts_and_validate():
+    lessons = [Lesson(1, 0, 540, 585, 10, 20, '101'), Lesson(2, 0, 600, 645, 11, 21, '101')]
+    engine = TimetableEngine(lessons)
+    assert engine.conflicts(Lesson(None, 0, 570, 610, 12, 22, '101')) == [('room', '101', 1), ('room', '101', 2)]
+    assert engine.conflicts(Lesson(None, 0, 585, 600, 10, 20, '101')) == []
+    assert engine.free('teacher', [10, 11, 12], 0, 550, 560) == [11, 12]
+
+    found = TimetableEngine.validate(lessons + [Lesson(3, 0, 560, 620, 10, 22, None)])
+    assert ('teacher', 10, 0, 1, 3) in found
+    assert TimetableEngine.validate([Lesson(4, 1, 600, 600, 1, 1, None)]) == [('time', None, 1, 4, 4)]
+
+
+@pytest.fixture
+def school(db, make_school, make_user):
+    school_id, other_id = make_school(), make_school()
+    ids = {'school': school_id, 'admin': make_user('school_admin', school_id),
+           'teacher': make_user('teacher', school_id), 'other_teacher': make_user('teacher', other_id),
+           'student': make_user('student', school_id)}
+    for key, sid in (('', school_id), ('other_', other_id)):
+        subject = eduverse.Subject(name='Математика', school_id=sid)
+        cls = eduverse.Class(name='5А', school_id=sid, grade_level=5)
+        db.session.add_all([subject, cls])
+        db.session.flush()
+        ids[f'{key}subject'], ids[f'{key}class'] = subject.id, cls.id
+    db.session.commit()
+    return ids
+
+
+def lesson(school, **overrides):
+    data = {'day_of_week': 0, 'start_time': '09:00', 'end_time': '09:45', 'room': '101',
+            'teacher_id': school['teacher'], 'class_id': school['class'], 'subject_id': school['subject']}
+    data.update(overrides)
+    return data
+
+
+def lessons_count(db):
+    db.session.rollback()
+    return db.session.scalar(select(func.count()).select_from(eduverse.Schedule))
+
+
+def test_create_schedule(db, school, login):
+    client = login(school['admin'])
+    url = f"/api/schools/{school['school']}/schedules"
+    assert client.post(url, json=lesson(school)).status_code == 201
+    # Запросы теста делят сессию его контекста приложения: транзакция чтения
+    # после ответа завершается, как при смене контекста между запросами
+    db.session.rollback()
+
+    response = client.post(url, json=lesson(school, start_time='09:30', end_time='10:15', room='102'))
+    assert response.status_code == 409
+    assert {c['resource'] for c in response.get_json()['conflicts']} == {'teacher', 'class'}
+    assert lessons_count(db) == 1
+
+
+@pytest.mark.parametrize('value', [900, None, 9.5, ['09:00'], '25:00', '9:xx'])
+def test_to_minutes_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        to_minutes(value)
+
+
+@pytest.mark.parametrize('overrides', [{'start_time': 900}, {'end_time': None}, {'start_time': {'h': 9}}])
+def test_create_schedule_with_wrong_time_types(db, school, login, overrides):
+    response = login(school['admin']).post(f"/api/schools/{school['school']}/schedules",
+                                           json=lesson(school, **overrides))
+    assert response.status_code == 400
+    assert lessons_count(db) == 0
+
+
+def test_create_schedule_numeric_room(db, school, login):
+    response = login(school['admin']).post(f"/api/schools/{school['school']}/schedules",
+                                           json=lesson(school, room=101))
+    assert response.status_code == 201
+
+
+@pytest.mark.parametrize('field, value', [
+    ('teacher_id', 'other_teacher'), ('teacher_id', 'student'),
+    ('class_id', 'other_class'), ('subject_id', 'other_subject'),
+])
+def test_create_schedule_rejects_other_school(db, school, login, field, value):
+    client = login(school['admin'])
+    response = client.post(f"/api/schools/{school['school']}/schedules",
+                           json=lesson(school, **{field: school[value]}))
+    assert response.status_code == 400
+    assert response.get_json()['invalid'] == {field: [school[value]]}
+    assert lessons_count(db) == 0
+
+
+def test_replace_timetable_rejects_other_school(db, school, login):
+    client = login(school['admin'])
+    url = f"/api/schools/{school['school']}/timetable"
+    items = [lesson(school), lesson(school, day_of_week=1, subject_id=school['other_subject'])]
+    response = client.put(url, json=items)
+    assert response.status_code == 400
+    assert response.get_json()['invalid'] == {'subject_id': [school['other_subject']]}
+
+    assert client.put(url, json=items[:1]).status_code == 200
+    assert lessons_count(db) == 1
+
+
+def test_concurrent_creates_do_not_overlap(app, db, school, login, monkeypatch):
+    load_timetable = eduverse.load_timetable
+
+    def slow_load(*args, **kwargs):
+        timetable = load_timetable(*args, **kwargs)
+        # Окно между проверкой конфликтов и вставкой
+        time.sleep(0.2)
+        return timetable
+
+    monkeypatch.setattr(eduverse, 'load_timetable', slow_load)
+    statuses = []
+
+    def post(room):
+        client = login(school['admin'])
+        response = client.post(f"/api/schools/{school['school']}/schedules", json=lesson(school, room=room))
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=post, args=(room,)) for room in ('101', '102')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [201, 409]
+    assert lessons_count(db) == 1
+
+
+def test_legacy_overlaps_still_detected(db, school, login):
+    # Пересекающиеся уроки, записанные до появления проверки
+    for start, end in (('08:00', '12:00'), ('08:15', '08:30')):
+        db.session.add(eduverse.Schedule(
+            school_id=school['school'], subject_id=school['subject'], class_id=school['class'],
+            teacher_id=school['teacher'], day_of_week=2, room=None,
+            start_time=eduverse.minutes_to_time(eduverse.to_minutes(start)),
+            end_time=eduverse.minutes_to_time(eduverse.to_minutes(end))))
+    db.session.commit()
+
+    client = login(school['admin'])
+    response = client.post(f"/api/schools/{school['school']}/schedules",
+                           json=lesson(school, day_of_week=2, start_time='10:00', end_time='10:45',
+                                       class_id=school['class'], room=None))
+    assert response.status_code == 409
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy.orm import Session
+
+import app as eduverse
+from user_cache import LocalCacheBackend, UserCache
+
+
+def test_versioned_set_after_invalidate_is_refused():
+    cache = UserCache(LocalCacheBackend())
+    version = cache.version(1)
+    cache.invalidate(1)
+    assert not cache.set(1, {'id': 1}, version=version)
+    assert cache.get(1) is None
+
+    assert cache.set(1, {'id': 1}, version=cache.version(1))
+    assert cache.get(1) == {'id': 1}
+
+
+def test_expired_entries_and_lru():
+    backend = LocalCacheBackend(maxsize=2, ttl=0)
+    backend.set('a', 1)
+    assert backend.get('a') is None
+
+    backend = LocalCacheBackend(maxsize=2)
+    for key in 'abc':
+        backend.set(key, key)
+    assert backend.get('a') is None and backend.get('c') == 'c'
+
+
+@pytest.fixture
+def teacher(db, make_school, make_user):
+    eduverse.user_cache.backend.clear()
+    return make_user('teacher', make_school(), password_hash='hash')
+
+
+def test_snapshot_has_no_password_hash(app, db, teacher):
+    eduverse.load_user(teacher)
+    snapshot = eduverse.user_cache.get(teacher)
+    assert snapshot['role'] == 'teacher'
+    assert 'password_hash' not in snapshot
+
+    # Объект из снимка догружает хеш из БД при обращении
+    db.session.remove()
+    assert eduverse.load_user(teacher).password_hash == 'hash'
+
+
+def test_update_during_load_does_not_cache_stale_user(app, db, teacher, monkeypatch):
+    session = eduverse.db.session
+    get = session.get
+
+    def get_then_concurrent_update(model, ident):
+        user = get(model, ident)
+        # Другой запрос меняет пользователя и сбрасывает кэш, пока этот
+        # ещё не записал снимок прочитанной строки
+        with Session(db.engine) as other:
+            other.get(eduverse.User, ident).is_active = False
+            other.commit()
+        return user
+
+    monkeypatch.setattr(session, 'get', get_then_concurrent_update)
+    stale = eduverse.load_user(teacher)
+    monkeypatch.undo()
+    assert stale.is_active
+
+    assert eduverse.user_cache.get(teacher) is None
+    db.session.remove()
+    assert eduverse.load_user(teacher).is_active is False
+    assert eduverse.user_cache.get(teacher)['is_active'] is False
+
+
+def test_update_invalidates_cache(app, db, teacher):
+    eduverse.load_user(teacher)
+    user = db.session.get(eduverse.User, teacher)
+    user.role = 'school_admin'
+    db.session.commit()
+    assert eduverse.user_cache.get(teacher) is None
+    db.session.remove()
+    assert eduverse.load_user(teacher).role == 'school_admin'
@@ -0,0 +1,173 @@
+"""
+Проверка конфликтов расписания.
+
+Для каждого учителя, класса и кабинета на каждый день недели хранится
+отсортированный список непересекающихся интервалов уроков. Поскольку
+интервалы одного ресурса не пересекаются, их концы тоже отсортированы, и
+пересечения с новым уроком находятся двумя бинарными поисками -
+O(log n) на проверку. Целое расписание проверяется одним проходом после
+сортировки по (ресурс, день, начало).
+
+Время хранится в минутах от начала суток, интервалы полуоткрытые
+[start, end): урок 9:00-9:45 не конфликтует с уроком 9:45-10:30.
+
+Уроки, загруженные из БД без проверки (add(..., check=False)), могут уже
+пересекаться, если их записали до появления проверки. Тогда концы не
+отсортированы, и такой набор интервалов ищет пересечения перебором.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import time
+
+RESOURCES = ('teacher', 'class', 'room')
+
+Lesson = namedtuple('Lesson', 'id day start end teacher_id class_id room')
+
+
+def to_minutes(value):
+    """datetime.time или строка 'HH:MM' -> минуты от полуночи."""
+    if isinstance(value, str):
+        hours, _, minutes = value.partition(':')
+        hours, minutes = int(hours), int(minutes or 0)
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError(f'Некорректное время: {value}')
+        return hours * 60 + minutes
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    raise ValueError(f'Некорректное время: {value!r}')
+
+
+def lesson_keys(lesson):
+    """Ресурсы урока: (вид, идентификатор); кабинет может быть не указан."""
+    keys = [('teacher', lesson.teacher_id), ('class', lesson.class_id)]
+    if lesson.room:
+        keys.append(('room', lesson.room))
+    return keys
+
+
+class IntervalSet:
+    """Интервалы одного ресурса за один день.
+
+    Пока интервалы не пересекаются, поиск - бинарный; overlaps становится
+    True, если добавлен интервал, пересекающий соседний.
+    """
+
+    __slots__ = ('starts', 'ends', 'ids', 'overlaps')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+        self.overlaps = False
+
+    def overlapping(self, start, end):
+        if self.overlaps:
+            return [lesson_id for s, e, lesson_id in zip(self.starts, self.ends, self.ids)
+                    if s < end and e > start]
+        # Первый интервал, который заканчивается позже start, и первый,
+        # который начинается не раньше end: всё между ними пересекается
+        lo = bisect_right(self.ends, start)
+        hi = bisect_left(self.starts, end, lo)
+        return self.ids[lo:hi]
+
+    def is_free(self, start, end):
+        if self.overlaps:
+            return not any(s < end and e > start for s, e in zip(self.starts, self.ends))
+        lo = bisect_right(self.ends, start)
+        return lo == len(self.starts) or self.starts[lo] >= end
+
+    def add(self, start, end, lesson_id):
+        index = bisect_left(self.starts, start)
+        if (index and self.ends[index - 1] > start) or (index < len(self.starts) and self.starts[index] < end):
+            self.overlaps = True
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.ids.insert(index, lesson_id)
+
+    def remove(self, lesson_id):
+        index = self.ids.index(lesson_id)
+        del self.starts[index], self.ends[index], self.ids[index]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class TimetableEngine:
+    """Индексы интервалов по учителям, классам и кабинетам."""
+
+    def __init__(self, lessons=()):
+        self._index = {}
+        for lesson in lessons:
+            self.add(lesson, check=False)
+
+    def _intervals(self, kind, key, day, create=False):
+        index_key = (kind, key, day)
+        intervals = self._index.get(index_key)
+        if intervals is None and create:
+            intervals = self._index[index_key] = IntervalSet()
+        return intervals
+
+    def conflicts(self, lesson):
+        """Список (вид ресурса, значение, id урока), с которыми пересекается lesson."""
+        found = []
+        for kind, key in lesson_keys(lesson):
+            intervals = self._intervals(kind, key, lesson.day)
+            if intervals is not None:
+                found.extend((kind, key, other) for other in intervals.overlapping(lesson.start, lesson.end)
+                             if other != lesson.id)
+        return found
+
+    def add(self, lesson, check=True):
+        """Добавить урок, если он ни с чем не пересекается; вернуть конфликты."""
+        if check:
+            found = self.conflicts(lesson)
+            if found:
+                return found
+        for kind, key in lesson_keys(lesson):
+            self._intervals(kind, key, lesson.day, create=True).add(lesson.start, lesson.end, lesson.id)
+        return []
+
+    def remove(self, lesson):
+        for kind, key in lesson_keys(lesson):
+            intervals = self._intervals(kind, key, lesson.day)
+            if intervals is not None:
+                intervals.remove(lesson.id)
+
+    def free(self, kind, candidates, day, start, end):
+        """Те из candidates (учителя, классы или кабинеты), кто свободен в слоте."""
+        result = []
+        for key in candidates:
+            intervals = self._intervals(kind, key, day)
+            if intervals is None or intervals.is_free(start, end):
+                result.append(key)
+        return result
+
+    @staticmethod
+    def validate(lessons):
+        """Все конфликты расписания за один проход.
+
+        Возвращает список (вид ресурса, значение, день, id первого урока,
+        id второго урока). Урок сравнивается с тем уроком ресурса, который
+        заканчивается позже всех из начавшихся раньше него. Уроки с началом
+        не раньше конца попадают в список с видом 'time'.
+        """
+        found, entries = [], []
+        for lesson in lessons:
+            if lesson.start >= lesson.end:
+                found.append(('time', None, lesson.day, lesson.id, lesson.id))
+                continue
+            for kind, key in lesson_keys(lesson):
+                entries.append((kind, key, lesson.day, lesson.start, lesson.end, lesson.id))
+        entries.sort()
+
+        group, latest_end, latest_id = None, None, None
+        for kind, key, day, start, end, lesson_id in entries:
+            if (kind, key, day) != group:
+                group, latest_end, latest_id = (kind, key, day), end, lesson_id
+                continue
+            if start < latest_end:
+                found.append((kind, key, day, latest_id, lesson_id))
+            if end > latest_end:
+                latest_end, latest_id = end, lesson_id
+        return found
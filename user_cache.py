@@ -0,0 +1,207 @@
+"""
+Кэш пользователей для login_manager.user_loader.
+
+Внутри одного запроса Flask-Login сам хранит current_user, поэтому
+user_loader вызывается не чаще раза за запрос. Этот кэш убирает запрос к
+БД между запросами: снимок колонок User хранится с TTL в LRU процесса
+или в общем бэкенде (Redis) и сбрасывается при изменении строки.
+
+Сброс (invalidate) увеличивает версию ключа. Загрузчик запоминает версию
+до чтения из БД и записывает снимок через set(..., version=v): если строка
+изменилась и кэш был сброшен между чтением и записью, устаревший снимок
+не сохраняется.
+"""
+
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCacheBackend:
+    """LRU в памяти процесса с ограничением размера и временем жизни записей."""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def version(self, key):
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def set(self, key, value, version=None):
+        """Записать значение; с version - только если ключ с тех пор не сбрасывали."""
+        with self._lock:
+            if version is not None and self._versions.get(key, 0) != version:
+                return False
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCacheBackend:
+    """Общий для всех воркеров кэш в Redis (нужен пакет redis).
+
+    Версия ключа хранится рядом (prefix + 'v:' + key); запись с версией
+    сравнивает её и пишет значение одним Lua-скриптом.
+    """
+
+    # Версия живёт дольше значения: загрузчик успевает сравнить её с прочитанной
+    version_ttl = 3600
+
+    _SET_IF_VERSION = """
+    if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] then
+        return 0
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return 1
+    """
+
+    def __init__(self, url, ttl=300, prefix='eduverse:cache:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('Для кэша в Redis установите пакет redis') from exc
+        self._errors = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._set_if_version = self.client.register_script(self._SET_IF_VERSION)
+
+    def _version_key(self, key):
+        return f'{self.prefix}v:{key}'
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + str(key))
+        except self._errors:
+            logger.warning('Redis недоступен, чтение кэша пропущено', exc_info=True)
+            return None
+        return pickle.loads(raw) if raw is not None else None
+
+    def version(self, key):
+        try:
+            return int(self.client.get(self._version_key(key)) or 0)
+        except self._errors:
+            logger.warning('Redis недоступен, версия ключа не прочитана', exc_info=True)
+            # Ни с одной версией не совпадёт: снимок не будет записан
+            return -1
+
+    def set(self, key, value, version=None):
+        try:
+            if version is None:
+                self.client.setex(self.prefix + str(key), self.ttl, pickle.dumps(value))
+                return True
+            return bool(self._set_if_version(
+                keys=[self.prefix + str(key), self._version_key(key)],
+                args=[pickle.dumps(value), version, self.ttl]
+            ))
+        except self._errors:
+            logger.warning('Redis недоступен, запись в кэш пропущена', exc_info=True)
+            return False
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + str(key))
+        except self._errors:
+            logger.warning('Redis недоступен, запись кэша %s не сброшена', key, exc_info=True)
+
+    def invalidate(self, key):
+        try:
+            pipe = self.client.pipeline()
+            pipe.delete(self.prefix + str(key))
+            pipe.incr(self._version_key(key))
+            pipe.expire(self._version_key(key), max(self.version_ttl, self.ttl))
+            pipe.execute()
+        except self._errors:
+            logger.warning('Redis недоступен, запись кэша %s не сброшена', key, exc_info=True)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def create_cache_backend(url=None, maxsize=10000, ttl=300, prefix='eduverse:cache:'):
+    """Бэкенд по URL: пусто или memory:// - память процесса, redis:// - Redis."""
+    if not url or url.startswith('memory:'):
+        return LocalCacheBackend(maxsize=maxsize, ttl=ttl)
+    if url.startswith(('redis:', 'rediss:', 'unix:')):
+        return RedisCacheBackend(url, ttl=ttl, prefix=prefix)
+    raise ValueError(f'Неизвестный бэкенд кэша: {url}')
+
+
+class UserCache:
+    """Снимки строк User по id со счётчиками попаданий и промахов."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        value = self.backend.get(user_id)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def version(self, user_id):
+        """Версия записи; передаётся в set() после чтения строки из БД."""
+        return self.backend.version(user_id)
+
+    def set(self, user_id, snapshot, version=None):
+        return self.backend.set(user_id, snapshot, version=version)
+
+    def invalidate(self, user_id, count=True):
+        if count:
+            self.invalidations += 1
+        self.backend.invalidate(user_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }